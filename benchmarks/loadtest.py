@@ -0,0 +1,376 @@
+"""Load test of concurrent visualizer sessions against a local stub server.
+
+Each simulated session runs in its own thread, as Streamlit runs the script of
+every session, and replays what ``visualize`` does on each rerun: connect, look
+up projects and annotators in the shared metadata caches, fetch a sample text,
+then either rerun on a widget change or submit a text or a file. Submitted
+work runs in the shared background executor while the session keeps polling
+with reruns, and finished results are rendered::
+
+    python benchmarks/loadtest.py --sessions 50 --duration 30
+    python benchmarks/loadtest.py -s 200 -d 60 --latency 0.02 --output load.json
+    python benchmarks/loadtest.py -s 20 --max-metadata-requests 2   # exit 1 if caches stop being shared
+
+Reports the p50/p95/p99 latency of each phase, the server requests per
+session (all of them and metadata only), the hit rates of the client caches
+and the memory growth of the process. Results are written as JSON in the
+format of ``run_benchmarks.py``.
+"""
+import gc
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import plac
+
+sys.path.insert(0, str(Path(__file__).parent))
+from run_benchmarks import Result, Upload  # noqa: E402
+from stub_server import StubConfig, StubSherpaServer, synthetic_text  # noqa: E402
+
+PHASES = ("connect", "metadata", "sample", "queue", "annotate", "render", "rerun")
+
+# what a user does between two reruns, with its weight
+ACTIONS = {"widget": 5, "text": 3, "file": 1, "another_sample": 1}
+
+# endpoints whose calls should be shared by all sessions through the caches
+METADATA_ROUTES = ("/projects", "/annotators_by_type", "/labels", "/plans/*")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, ``q`` in [0, 100]."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def rss_bytes() -> int:
+    """Resident set size of the process, the peak where the current one is unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class Timings:
+    """Latencies of every phase of all sessions."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, phase: str, seconds: float):
+        with self.lock:
+            self.seconds[phase].append(seconds)
+
+    def error(self, phase: str):
+        with self.lock:
+            self.errors[phase] += 1
+
+
+class SimulatedSession:
+    """One user of the visualizer, with the state Streamlit keeps per session."""
+
+    def __init__(
+        self,
+        index: int,
+        server: StubSherpaServer,
+        timings: Timings,
+        files: List[Upload],
+        users: int = 1,
+        think: float = 1.0,
+        poll_interval: float = 0.5,
+        text_chars: int = 3000,
+    ):
+        from sherpa_streamlit.background import TaskQueue
+
+        self.index = index
+        self.server = server
+        self.timings = timings
+        self.files = files
+        self.user = f"user{index % users}"
+        self.think = think
+        self.poll_interval = poll_interval
+        self.text_chars = text_chars
+        self.rng = random.Random(index)
+        self.tasks = TaskQueue()
+        self.token: Optional[str] = None
+        self.project_label: Optional[str] = None
+        self.annotator_label: Optional[str] = None
+        self.sample = None
+        self.rendered: Dict[int, str] = {}
+        self.reruns = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:  # noqa: B902
+            self.timings.error(name)
+            raise
+        self.timings.add(name, time.perf_counter() - start)
+
+    def connect(self):
+        from sherpa_streamlit.util import get_authenticated_client
+
+        with self.phase("connect"):
+            self.token = get_authenticated_client(self.server.url, self.user, "secret").token
+
+    def run(self, deadline: float):
+        self.connect()
+        while time.monotonic() < deadline:
+            action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+            self.rerun(action)
+            # poll with reruns while the submitted work is pending, as visualize does
+            while self.tasks.pending() and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                self.rerun("poll")
+            time.sleep(self.rng.expovariate(1 / self.think) if self.think else 0)
+
+    def rerun(self, action: str):
+        with self.phase("rerun"):
+            self._rerun(action)
+        self.reruns += 1
+
+    def _rerun(self, action: str):  # noqa: C901
+        from sherpa_streamlit.samples import sample_pool
+        from sherpa_streamlit.util import (
+            get_cached_annotator_by_label,
+            get_cached_annotators,
+            get_cached_project_by_label,
+            get_cached_projects,
+            get_client,
+        )
+
+        token = self.token
+        with self.phase("metadata"):
+            projects = get_cached_projects(token)
+            if self.project_label is None or action == "widget" and self.rng.random() < 0.2:
+                self.project_label = self.rng.choice(sorted(p.label for p in projects))
+                self.annotator_label = None
+            project = get_cached_project_by_label(token, self.project_label)
+            annotators = get_cached_annotators(token, project.name, None, False)
+            if self.annotator_label is None or action == "widget":
+                self.annotator_label = self.rng.choice(sorted(a.label for a in annotators))
+            annotator = get_cached_annotator_by_label(token, project.name, self.annotator_label, None, False)
+        client = get_client(token)
+        if self.sample is None or action == "another_sample":
+            with self.phase("sample"):
+                self.sample = sample_pool(client, project.name).next()
+        if action in ("text", "file"):
+            self.submit(action, client, project, annotator)
+        task = next(iter(reversed(self.tasks.finished())), None)
+        if task is not None and task.status == "done":
+            self.render(task, annotator)
+
+    def submit(self, action: str, client, project, annotator):
+        from sherpa_streamlit.visualizer import annotation_work, upload_work
+
+        if action == "file":
+            upload = self.rng.choice(self.files)
+            work = upload_work(client, project, annotator, [], upload)
+        else:
+            text = self.sample.text if self.sample is not None and self.rng.random() < 0.5 else None
+            text = text or synthetic_text(self.text_chars, seed=self.rng.randrange(1 << 30))
+            work = annotation_work(client, project, annotator, [], text=text)
+        self.tasks.submit(work, description=action, context=dict(annotator=annotator))
+
+    def render(self, task, annotator):
+        from sherpa_streamlit.tables import TABLE_MIME_TYPES, load_table, payload_digest
+        from sherpa_streamlit.visualizer import annotations_html
+
+        if task.id in self.rendered:
+            # visualize_annotated_doc keeps the HTML of the result in the session
+            return
+        result = task.future.result()
+        with self.phase("render"):
+            if result.doc is not None:
+                self.rendered[task.id] = annotations_html(result.doc, task.context["annotator"])
+            elif result.formatted is not None and result.formatted.mime_type in TABLE_MIME_TYPES:
+                payload = result.formatted.payload
+                load_table(payload, result.formatted.mime_type, None, payload_digest(payload))
+                self.rendered[task.id] = ""
+        if task.started is not None and task.finished is not None:
+            self.timings.add("queue", task.started - task.submitted)
+            self.timings.add("annotate", task.finished - task.started)
+        # like the session queue, forget old results
+        if len(self.rendered) > 20:
+            self.rendered.pop(min(self.rendered))
+
+
+def sample_files(n: int, chars: int) -> List[Upload]:
+    """Text and JSON uploads shared by the sessions, as users upload the same documents."""
+    files = []
+    for i in range(n):
+        text = synthetic_text(chars, seed=1000 + i)
+        if i % 3 == 2:
+            files.append(Upload(f"doc_{i}.json", "application/json", json.dumps([{"text": text}]).encode("utf-8")))
+        else:
+            files.append(Upload(f"doc_{i}.txt", "text/plain", text.encode("utf-8")))
+    return files
+
+
+def cache_results() -> Dict[str, Result]:
+    """Hit rates of the shared metadata caches and of the client caches."""
+    from sherpa_streamlit import util
+    from sherpa_streamlit.cache import GLOBAL_BUDGET
+    from sherpa_streamlit.sherpa import CONVERSIONS
+    from sherpa_streamlit.tables import TABLES
+
+    def rate(info) -> float:
+        total = info.hits + info.misses
+        return info.hits / total if total else float("nan")
+
+    results = {}
+    for name in (
+        "get_cached_projects",
+        "get_cached_project_by_label",
+        "get_cached_annotators",
+        "get_cached_annotator_by_label",
+    ):
+        results[f"load.cache.{name}.hit_rate"] = Result(rate(getattr(util, name).cache_info()), "ratio", "higher")
+    budget = GLOBAL_BUDGET.info()
+    results["load.cache.client.hit_rate"] = Result(rate(budget), "ratio", "higher")
+    results["load.cache.client.mb"] = Result(budget.bytes / 2 ** 20, "MiB")
+    results["load.cache.conversions.hit_rate"] = Result(rate(CONVERSIONS.info()), "ratio", "higher")
+    results["load.cache.tables.hit_rate"] = Result(rate(TABLES.info()), "ratio", "higher")
+    return results
+
+
+def run_load(
+    sessions: int,
+    duration: float,
+    ramp: float,
+    users: int,
+    think: float,
+    poll_interval: float,
+    files: int,
+    server: StubSherpaServer,
+) -> Dict[str, Result]:
+    """Run the sessions, return the results by name."""
+    # import everything a session needs before measuring memory
+    import sherpa_streamlit.visualizer  # noqa: F401
+
+    timings = Timings()
+    uploads = sample_files(files, 5000)
+    gc.collect()
+    rss_start = rss_bytes()
+    deadline = time.monotonic() + ramp + duration
+    population = [
+        SimulatedSession(i, server, timings, uploads, users=users, think=think, poll_interval=poll_interval)
+        for i in range(sessions)
+    ]
+
+    def start(session: SimulatedSession, delay: float):
+        time.sleep(delay)
+        try:
+            session.run(deadline)
+        except Exception as e:  # noqa: B902
+            print(f"session {session.index} failed: {e!r}", file=sys.stderr)
+
+    threads = [
+        threading.Thread(target=start, args=(s, ramp * i / max(1, sessions)), name=f"session-{i}", daemon=True)
+        for i, s in enumerate(population)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    gc.collect()
+    rss_end = rss_bytes()
+
+    results: Dict[str, Result] = {}
+    for phase in PHASES:
+        values = timings.seconds.get(phase, [])
+        for q in (50, 95, 99):
+            results[f"load.{phase}.p{q}"] = Result(percentile(values, q) * 1000, "ms")
+        results[f"load.{phase}.count"] = Result(len(values), "calls", "higher")
+        if timings.errors.get(phase):
+            results[f"load.{phase}.errors"] = Result(timings.errors[phase], "errors")
+    requests = dict(server.requests)
+    metadata = sum(n for route, n in requests.items() if route.startswith("GET ") and route.endswith(METADATA_ROUTES))
+    reruns = sum(s.reruns for s in population)
+    results["load.requests.per_session"] = Result(sum(requests.values()) / sessions, "requests")
+    results["load.requests.metadata_per_session"] = Result(metadata / sessions, "requests")
+    results["load.requests.logins"] = Result(requests.get("POST /auth/login", 0), "requests")
+    results["load.reruns.per_session"] = Result(reruns / sessions, "reruns", "higher")
+    results.update(cache_results())
+    results["load.memory.rss_start_mb"] = Result(rss_start / 2 ** 20, "MiB")
+    results["load.memory.rss_end_mb"] = Result(rss_end / 2 ** 20, "MiB")
+    results["load.memory.growth_per_session_kb"] = Result((rss_end - rss_start) / 1024 / sessions, "KiB")
+    return results
+
+
+@plac.opt("sessions", "Number of concurrent sessions", type=int, abbrev="s")
+@plac.opt("duration", "Seconds each session keeps interacting after the ramp-up", type=float, abbrev="d")
+@plac.opt("ramp", "Seconds over which sessions start", type=float)
+@plac.opt("users", "Distinct logins shared by the sessions", type=int)
+@plac.opt("think", "Mean seconds between two user actions", type=float)
+@plac.opt("poll_interval", "Seconds between reruns while work is pending", type=float)
+@plac.opt("files", "Distinct files uploaded by the sessions", type=int)
+@plac.opt("latency", "Latency of every stub server call, in seconds", type=float)
+@plac.opt("output", "Write the results as JSON to this file", type=Path)
+@plac.opt("max_metadata_requests", "Fail if sessions make more metadata requests on average", type=float, abbrev="M")
+@plac.opt("max_growth_kb", "Fail if the memory grows more per session, in KiB", type=float, abbrev="G")
+def main(
+    sessions: int = 20,
+    duration: float = 20.0,
+    ramp: float = 5.0,
+    users: int = 1,
+    think: float = 1.0,
+    poll_interval: float = 0.5,
+    files: int = 10,
+    latency: float = 0.01,
+    output: Optional[Path] = None,
+    max_metadata_requests: Optional[float] = None,
+    max_growth_kb: Optional[float] = None,
+):
+    """Simulate concurrent visualizer sessions and report latency, requests, caches and memory."""
+    with StubSherpaServer(StubConfig(latency=latency)) as server:
+        results = run_load(sessions, duration, ramp, users, think, poll_interval, files, server)
+    for name, r in results.items():
+        print(f"{name:50s} {r.value:12.3f} {r.unit}")
+    payload: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sessions": sessions,
+            "duration": duration,
+            "users": users,
+            "think": think,
+            "latency": latency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {k: r._asdict() for k, r in results.items()},
+    }
+    if output:
+        output.write_text(json.dumps(payload, indent=2))
+    failures = []
+    metadata = results["load.requests.metadata_per_session"].value
+    if max_metadata_requests is not None and metadata > max_metadata_requests:
+        failures.append(f"{metadata:.2f} metadata requests per session > {max_metadata_requests}")
+    growth = results["load.memory.growth_per_session_kb"].value
+    if max_growth_kb is not None and growth > max_growth_kb:
+        failures.append(f"memory grew by {growth:.0f} KiB per session > {max_growth_kb}")
+    if failures:
+        print("Failed:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,426 @@
+"""Reproducible performance benchmarks for sherpa_streamlit.
+
+Every benchmark runs against a local :class:`StubSherpaServer`, so results
+only depend on the client and visualizer code and on the machine::
+
+    python benchmarks/run_benchmarks.py                  # run and print results
+    python benchmarks/run_benchmarks.py --save           # record benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --check          # exit 1 on regression
+
+Results are written as JSON: ``{"meta": {...}, "results": {name: {"value",
+"unit", "better"}}}``.
+"""
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import plac
+
+sys.path.insert(0, str(Path(__file__).parent))
+from stub_server import (  # noqa: E402
+    StubServerProcess,
+    StubSherpaServer,
+    synthetic_annotated_document,
+    synthetic_text,
+)
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+# Absolute targets enforced by --check, whatever the baseline says
+BUDGETS = {
+    "cold_start.time_to_first_render": 3.0,
+    "import.core.seconds": 1.0,
+    "import.core.heavy_modules": 0,
+}
+
+# Modules the headless client must not pull in
+HEAVY_MODULES = ("streamlit", "pandas", "PIL", "bs4", "annotated_text")
+
+
+class Result(NamedTuple):
+    value: float
+    unit: str
+    better: str = "lower"
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[StubSherpaServer], Dict[str, Result]]
+    quick: bool
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, quick: bool = True):
+    def decorator(func):
+        BENCHMARKS.append(Benchmark(name, func, quick))
+        return func
+
+    return decorator
+
+
+class Upload:
+    """Minimal file-like object accepted by the client upload methods."""
+
+    def __init__(self, name: str, type: str, data: bytes):  # noqa: A002
+        self.name = name
+        self.type = type
+        self.data = data
+
+    def getvalue(self) -> bytes:
+        return self.data
+
+
+def new_client(server):
+    from sherpa_streamlit.sherpa import StreamlitSherpaClient
+
+    return StreamlitSherpaClient(server.url, "bench", "bench")
+
+
+def timeit(func: Callable[[], object], repeat: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@benchmark("metadata")
+def bench_metadata(server: StubSherpaServer) -> Dict[str, Result]:
+    client = new_client(server)
+    project = server.project_names()[0]
+    server.reset_counters()
+    cold = timeit(lambda: client.get_annotators(project))
+    requests = sum(server.requests.values())
+    warm = timeit(lambda: client.get_annotators(project), repeat=100)
+    return {
+        "metadata.get_annotators.cold": Result(cold * 1000, "ms"),
+        "metadata.get_annotators.warm": Result(warm * 1e6, "us"),
+        "metadata.get_annotators.requests": Result(requests, "requests"),
+        **_metadata_hits(client, project),
+    }
+
+
+def _allocated(fn: Callable[[], Any], n: int = 20) -> float:
+    """Peak bytes allocated by one call of ``fn``, on average."""
+    gc.collect()
+    total = 0
+    for _ in range(n):
+        tracemalloc.start()
+        fn()
+        total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return total / n
+
+
+def _metadata_hits(client, project: str) -> Dict[str, Result]:
+    """Hits of the shared metadata cache vs the unpickled copies of a memo hit."""
+    import pickle
+
+    from sherpa_streamlit.util import get_cached_annotators
+
+    token = client.token
+    get_cached_annotators(token, project)
+    pickled = pickle.dumps(client.get_annotators(project))
+    memo = timeit(lambda: pickle.loads(pickled), repeat=100)
+    shared = timeit(lambda: get_cached_annotators(token, project), repeat=100)
+    return {
+        "metadata.hit.memo_copy": Result(memo * 1e6, "us"),
+        "metadata.hit.shared": Result(shared * 1e6, "us"),
+        "metadata.hit.memo_copy_bytes": Result(_allocated(lambda: pickle.loads(pickled)), "bytes"),
+        "metadata.hit.shared_bytes": Result(_allocated(lambda: get_cached_annotators(token, project)), "bytes"),
+    }
+
+
+@benchmark("annotate")
+def bench_annotate(server: StubSherpaServer, n: int = 50, workers: int = 8) -> Dict[str, Result]:
+    client = new_client(server)
+    project = server.project_names()[0]
+    text = synthetic_text(5000)
+    sequential = timeit(
+        lambda: [client.annotate_text(project, f"{project}_model_0", text) for _ in range(n)], repeat=3
+    )
+    with ThreadPoolExecutor(workers) as pool:
+        concurrent = timeit(
+            lambda: list(pool.map(lambda _: client.annotate_text(project, f"{project}_model_0", text), range(n))),
+            repeat=3,
+        )
+    return {
+        "annotate.text.sequential": Result(n / sequential, "docs/s", "higher"),
+        "annotate.text.concurrent": Result(n / concurrent, "docs/s", "higher"),
+    }
+
+
+@benchmark("compare")
+def bench_compare(server: StubSherpaServer) -> Dict[str, Result]:
+    """Fan-out to every annotator of a project, then span agreement of two large documents."""
+    from sherpa_streamlit.compare import agreement, annotate_many
+    from sherpa_streamlit.docview import AnnotatedDocumentView
+
+    client = new_client(server)
+    project = server.project_names()[0]
+    annotators = [a.name for a in client.get_annotators(project)]
+    text = synthetic_text(5000)
+    fanout = timeit(lambda: annotate_many(client, project, annotators, text=text), repeat=3)
+    single = timeit(lambda: client.annotate_text(project, annotators[0], text, raw=True), repeat=3)
+    labels = [f"label_{i}" for i in range(20)]
+    text = synthetic_text(20000 * 14)
+    ref, cand = (
+        AnnotatedDocumentView(synthetic_annotated_document(text, labels, n_annotations=20000, seed=seed))
+        for seed in (1, 2)
+    )
+    return {
+        f"compare.fanout.{len(annotators)}_vs_1": Result(fanout / single, "x single"),
+        "compare.agreement.overlap.20000": Result(timeit(lambda: agreement(ref, cand, "overlap")) * 1000, "ms"),
+    }
+
+
+@benchmark("upload")
+def bench_upload(server: StubSherpaServer, size_mb: int = 50) -> Dict[str, Result]:
+    from sherpa_streamlit.sherpa import CONVERSIONS
+
+    project = server.project_names()[0]
+    data = synthetic_text(1000).encode("utf-8") * (size_mb * 1000)
+    upload = Upload("large.txt", "text/plain", data)
+    # out of process, so that only the allocations of the client are traced
+    with StubServerProcess(latency=server.config.latency) as remote:
+        client = new_client(remote)
+        gc.collect()
+        tracemalloc.start()
+        elapsed = timeit(
+            lambda: client.annotate_binary(project, f"{project}_plan_0", upload)
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    client = new_client(server)
+    # the same file through three plans sharing a converter, uploaded once or three times
+    plans = [f"{project}_plan_{i}" for i in range(3)]
+    small = Upload("small.txt", "text/plain", data[: 5 * 2**20])
+
+    def uploads(reuse: bool) -> int:
+        CONVERSIONS.clear()
+        server.reset_counters()
+        for plan in plans:
+            client.annotate_binary(project, plan, small, reuse_conversion=reuse)
+        return sum(n for route, n in server.requests.items() if route.endswith("_annotate_binary"))
+
+    return {
+        "upload.binary.seconds": Result(elapsed, "s"),
+        "upload.binary.peak_ratio": Result(peak / len(data), "x payload"),
+        "upload.plans.3.uploads": Result(uploads(True), "uploads"),
+        "upload.plans.3.uploads_without_reuse": Result(uploads(False), "uploads"),
+    }
+
+
+@benchmark("decode")
+def bench_decode(server: StubSherpaServer, n_annotations: int = 20000) -> Dict[str, Result]:
+    """Model construction vs lazy view decoding of one large annotation response."""
+    from sherpa_client.models import AnnotatedDocument
+
+    from sherpa_streamlit.docview import AnnotatedDocumentView
+
+    labels = [f"label_{i}" for i in range(20)]
+    text = synthetic_text(n_annotations * 14)
+    content = json.dumps(synthetic_annotated_document(text, labels, n_annotations=n_annotations)).encode("utf-8")
+    models = timeit(lambda: AnnotatedDocument.from_dict(json.loads(content)), repeat=3)
+    view = timeit(lambda: list(AnnotatedDocumentView.from_json(content).annotations), repeat=3)
+    return {
+        f"decode.models.{n_annotations}": Result(models * 1000, "ms"),
+        f"decode.view.{n_annotations}": Result(view * 1000, "ms"),
+    }
+
+
+def _render(n_annotations: int) -> Tuple[float, int]:
+    from sherpa_client.models import AnnotatedDocument, Label
+
+    from sherpa_streamlit.sherpa import ExtendedAnnotator
+    from sherpa_streamlit.visualizer import annotations_html
+
+    labels = [f"label_{i}" for i in range(20)]
+    text = synthetic_text(n_annotations * 14, seed=n_annotations)
+    doc = AnnotatedDocument.from_dict(
+        synthetic_annotated_document(text, labels, n_annotations=n_annotations)
+    )
+    annotator = ExtendedAnnotator(
+        name="bench",
+        label="Bench",
+        type="crfsuite",
+        engine="crfsuite",
+        labels={lab: Label(name=lab, label=lab.upper(), color="#3cb44b") for lab in labels},
+    )
+    seconds = timeit(lambda: annotations_html(doc, annotator))
+    return seconds, len(annotations_html(doc, annotator).encode("utf-8"))
+
+
+@benchmark("render")
+def bench_render(server: StubSherpaServer) -> Dict[str, Result]:
+    seconds, size = _render(1000)
+    return {
+        "render.annotations.1000": Result(seconds, "s"),
+        "render.html_bytes.1000": Result(size, "bytes"),
+    }
+
+
+@benchmark("render_large", quick=False)
+def bench_render_large(server: StubSherpaServer) -> Dict[str, Result]:
+    results = {}
+    for n in (10000, 100000):
+        seconds, size = _render(n)
+        results[f"render.annotations.{n}"] = Result(seconds, "s")
+        results[f"render.html_bytes.{n}"] = Result(size, "bytes")
+    return results
+
+
+IMPORT_CORE = """
+import sys, time
+start = time.perf_counter()
+import sherpa_streamlit.sherpa
+elapsed = time.perf_counter() - start
+print(sum(m in sys.modules for m in {heavy!r}), elapsed)
+"""
+
+
+def _src_env() -> Dict[str, str]:
+    src = str(Path(__file__).parent.parent / "src")
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+
+
+@benchmark("import")
+def bench_import(server: StubSherpaServer, repeat: int = 3) -> Dict[str, Result]:
+    """Fresh interpreter importing only the client, as a batch worker would."""
+    timings = []
+    heavy = 0
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_CORE.format(heavy=HEAVY_MODULES)],
+            env=_src_env(),
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        n, elapsed = out.stdout.split()
+        heavy = max(heavy, int(n))
+        timings.append(float(elapsed))
+    return {
+        "import.core.seconds": Result(min(timings), "s"),
+        "import.core.heavy_modules": Result(heavy, "modules"),
+    }
+
+
+COLD_START = """
+import time
+start = time.perf_counter()
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+from sherpa_streamlit.visualizer import annotations_html
+client = StreamlitSherpaClient({url!r}, "bench", "bench")
+project = client.get_projects()[0]
+annotator = client.get_annotators(project.name)[0]
+sample = client.get_sample_doc(project.name)
+doc = client.annotate_text(project.name, annotator, sample.text)
+annotations_html(doc, annotator)
+print(time.perf_counter() - start)
+"""
+
+
+@benchmark("cold_start")
+def bench_cold_start(server: StubSherpaServer, repeat: int = 3) -> Dict[str, Result]:
+    """Fresh interpreter: imports, login, metadata, sample, annotation and first render."""
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", COLD_START.format(url=server.url)],
+            env=_src_env(),
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"cold_start.time_to_first_render": Result(min(timings), "s")}
+
+
+def compare(results: Dict[str, Result], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, r in results.items():
+        ref = baseline.get(name)
+        if ref is None or not ref["value"]:
+            continue
+        ratio = r.value / ref["value"]
+        if (r.better == "lower" and ratio > 1 + tolerance) or (
+            r.better == "higher" and ratio < 1 - tolerance
+        ):
+            regressions.append(f"{name}: {r.value:.4g} {r.unit} vs baseline {ref['value']:.4g} ({ratio:.2f}x)")
+    return regressions
+
+
+def over_budget(results: Dict[str, Result]) -> List[str]:
+    return [
+        f"{name}: {results[name].value:.4g} {results[name].unit} exceeds budget {budget}"
+        for name, budget in BUDGETS.items()
+        if name in results and results[name].value > budget
+    ]
+
+
+@plac.opt("only", "Comma-separated benchmark names to run", type=str)
+@plac.opt("output", "Write results to this JSON file", type=Path, abbrev="O")
+@plac.flg("save", "Record the results as the new baseline")
+@plac.flg("check", "Compare with the baseline and exit 1 on regression", abbrev="c")
+@plac.opt("tolerance", "Allowed relative slowdown when comparing", type=float)
+@plac.flg("full", "Also run the slow benchmarks")
+@plac.opt("latency", "Simulated server latency in seconds", type=float)
+def main(
+    only: Optional[str] = None,
+    output: Optional[Path] = None,
+    save: bool = False,
+    check: bool = False,
+    tolerance: float = 0.25,
+    full: bool = False,
+    latency: float = 0.0,
+):
+    selected = set(only.split(",")) if only else None
+    results: Dict[str, Result] = {}
+    with StubSherpaServer(latency=latency) as server:
+        for bench in BENCHMARKS:
+            if selected is not None and bench.name not in selected:
+                continue
+            if selected is None and not (bench.quick or full):
+                continue
+            for name, r in bench.func(server).items():
+                results[name] = r
+                print(f"{name:45s} {r.value:12.4f} {r.unit}")
+    payload = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency": latency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {k: r._asdict() for k, r in results.items()},
+    }
+    if output:
+        output.write_text(json.dumps(payload, indent=2))
+    if save:
+        BASELINE.write_text(json.dumps(payload, indent=2))
+    if check:
+        regressions = over_budget(results)
+        if BASELINE.exists():
+            regressions += compare(results, json.loads(BASELINE.read_text())["results"], tolerance)
+        else:
+            print(f"No baseline at {BASELINE}, only budgets are checked (run with --save)")
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,502 @@
+"""Local stand-in for the Sherpa REST API used by the benchmarks.
+
+The server answers the endpoints used by ``StreamlitSherpaClient`` with
+synthetic but well-formed payloads. Latency and payload sizes are
+configurable so that client-side costs can be measured reproducibly::
+
+    with StubSherpaServer(latency=0.01, annotations_per_kchar=50) as server:
+        client = StreamlitSherpaClient(server.url, "bench", "bench")
+"""
+import base64
+import gzip
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import attr
+
+WORDS = (
+    "the of and to in is was for on that with as by at from his her an were are which this be or "
+    "has had not but its also their first one new after who they have two been other all year "
+    "city world Paris London Kairntech Sherpa Grenoble France Europe company president market"
+).split()
+COLORS = ["#e6194B", "#3cb44b", "#ffe119", "#4363d8", "#f58231", "#911eb4", "#42d4f4", "#f032e6"]
+TOKEN_RE = re.compile(r"\S+")
+
+
+def synthetic_text(n_chars: int, seed: int = 0) -> str:
+    """Generate pseudo-natural text of about ``n_chars`` characters."""
+    rng = random.Random(seed)
+    parts: List[str] = []
+    size = 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+        sentence = sentence[0].upper() + sentence[1:] + "."
+        if rng.random() < 0.2:
+            sentence += "\n\n"
+        else:
+            sentence += " "
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)[:n_chars]
+
+
+def synthetic_annotated_document(
+    text: str,
+    labels: List[str],
+    n_annotations: Optional[int] = None,
+    annotations_per_kchar: float = 20.0,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Annotate ``text`` with synthetic, non-overlapping token annotations."""
+    rng = random.Random(seed)
+    tokens = [(m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+    if n_annotations is None:
+        n_annotations = int(len(text) * annotations_per_kchar / 1000)
+    n_annotations = min(n_annotations, len(tokens))
+    chosen = sorted(rng.sample(range(len(tokens)), n_annotations)) if tokens else []
+    annotations = []
+    for i in chosen:
+        start, end = tokens[i]
+        label = labels[i % len(labels)]
+        annotations.append(
+            {
+                "start": start,
+                "end": end,
+                "labelName": label,
+                "label": label.upper(),
+                "text": text[start:end],
+                "score": round(rng.random(), 3),
+            }
+        )
+    sentences = []
+    start = 0
+    for m in re.finditer(r"\.\s+", text):
+        sentences.append({"start": start, "end": m.end()})
+        start = m.end()
+    if start < len(text):
+        sentences.append({"start": start, "end": len(text)})
+    return {
+        "text": text,
+        "annotations": annotations,
+        "categories": [{"labelName": labels[0], "label": labels[0].upper(), "score": 0.9}],
+        "sentences": sentences,
+    }
+
+
+@attr.s(auto_attribs=True)
+class StubConfig:
+    latency: float = 0.0
+    projects: int = 5
+    annotators_per_project: int = 4
+    plans_per_project: int = 2
+    labels_per_project: int = 20
+    sample_chars: int = 2000
+    annotations_per_kchar: float = 20.0
+    job_polls: int = 2
+    # the first corpus jobs end up FAILED
+    failing_jobs: int = 0
+    # answer 415 to compressed request bodies, otherwise advertise the
+    # accepted request encodings in responses (RFC 7694)
+    reject_compressed: bool = False
+    # gzip responses of at least this size when the client accepts it
+    gzip_threshold: Optional[int] = 1024
+    # issue JWTs expiring after this many seconds and answer 401 to expired
+    # or revoked ones, None accepts any token
+    token_ttl: Optional[float] = None
+    endpoint_latency: Dict[str, float] = attr.ib(factory=dict)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops concurrent connections, which retry after a second
+    request_queue_size = 128
+
+
+class StubSherpaServer:
+    """Threaded HTTP server emulating the subset of Sherpa used by the client."""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0, **kwargs):
+        self.config = config or StubConfig(**kwargs)
+        self.requests: Counter = Counter()
+        # Content-Encoding of the request bodies received, "identity" when none
+        self.request_encodings: Counter = Counter()
+        self.jobs: Dict[str, int] = {}
+        self.failed_jobs: set = set()
+        # issued token -> expiry (epoch seconds)
+        self.tokens: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        handler = type("StubHandler", (_StubHandler,), {"stub": self})
+        self.httpd = _HTTPServer((host, port), handler)
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StubSherpaServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.request_encodings.clear()
+
+    # --- payloads
+
+    def project_names(self) -> List[str]:
+        return [f"project_{i}" for i in range(self.config.projects)]
+
+    def labels(self, project: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": f"{project}_label_{i}",
+                "label": f"Label {i}",
+                "color": COLORS[i % len(COLORS)],
+            }
+            for i in range(self.config.labels_per_project)
+        ]
+
+    def projects(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": name,
+                "label": name.replace("_", " ").title(),
+                "image": "",
+                "lang": "en",
+                "description": f"Synthetic project {name}",
+                "nature": "sequence_labelling",
+                "documents": 100,
+            }
+            for name in self.project_names()
+        ]
+
+    def annotators(self, project: str) -> Dict[str, List[Dict[str, Any]]]:
+        cfg = self.config
+        return {
+            "crfsuite": [
+                {"name": f"{project}_model_{i}", "label": f"Model {i}", "engine": "crfsuite", "favorite": i == 0}
+                for i in range(cfg.annotators_per_project)
+            ],
+            "plan": [
+                {"name": f"{project}_plan_{i}", "label": f"Plan {i}", "engine": "plan"}
+                for i in range(cfg.plans_per_project)
+            ],
+        }
+
+    def plan(self, project: str, name: str) -> Dict[str, Any]:
+        others = [p for p in self.project_names() if p != project][:2]
+        return {
+            "name": name,
+            "label": name.replace("_", " ").title(),
+            "parameters": {
+                "converter": {"name": "tika", "parameters": {}},
+                "pipeline": [{"annotator": f"{p}_model_0", "projectName": p} for p in others],
+            },
+        }
+
+    def issue_token(self) -> str:
+        if self.config.token_ttl is None:
+            return "stub-token"
+        expires = time.time() + self.config.token_ttl
+        claims = json.dumps({"sub": "bench", "exp": expires, "jti": time.time_ns()}).encode("utf-8")
+        token = f"e30.{base64.urlsafe_b64encode(claims).decode('ascii').rstrip('=')}.stub"
+        with self.lock:
+            self.tokens[token] = expires
+        return token
+
+    def authorized(self, authorization: str) -> bool:
+        if self.config.token_ttl is None:
+            return True
+        token = authorization[len("Bearer "):]
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def revoke_tokens(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def sample(self, project: str, size: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "identifier": f"{project}_doc_{i}",
+                "title": f"Document {i}",
+                "text": synthetic_text(self.config.sample_chars, seed=i),
+            }
+            for i in range(size)
+        ]
+
+    def annotate(self, project: str, text: str) -> Dict[str, Any]:
+        labels = [lab["name"] for lab in self.labels(project)]
+        return synthetic_annotated_document(
+            text, labels, annotations_per_kchar=self.config.annotations_per_kchar
+        )
+
+    def format_csv(self, project: str, texts: List[str]) -> bytes:
+        """Formatter output: one CSV row per annotation."""
+        rows = ["document,start,end,label,text"]
+        for i, text in enumerate(texts):
+            for a in self.annotate(project, text)["annotations"]:
+                surface = a["text"].replace('"', '""')
+                rows.append(f'{i},{a["start"]},{a["end"]},{a["labelName"]},"{surface}"')
+        return ("\n".join(rows) + "\n").encode("utf-8")
+
+    def job(self, project: str, job_id: str, job_type: str = "CORPUS_ANNOTATE") -> Dict[str, Any]:
+        with self.lock:
+            if job_id not in self.jobs and job_id.startswith("corpus_"):
+                if len(self.failed_jobs) < self.config.failing_jobs:
+                    self.failed_jobs.add(job_id)
+            polls = self.jobs.setdefault(job_id, 0)
+            self.jobs[job_id] = polls + 1
+        done = polls >= self.config.job_polls
+        status = "STARTED"
+        if done:
+            status = "FAILED" if job_id in self.failed_jobs else "COMPLETED"
+        return {
+            "createdAt": 0,
+            "createdBy": "bench",
+            "currentStepCount": min(polls, self.config.job_polls),
+            "description": "synthetic job",
+            "id": job_id,
+            "project": project,
+            "projectLabel": project,
+            "status": status,
+            "totalStepCount": self.config.job_polls,
+            "type": job_type,
+            "uploadIds": [],
+        }
+
+
+def _multipart_file(body: bytes) -> bytes:
+    """Return the content of the first part of a multipart body."""
+    head, _, rest = body.partition(b"\r\n\r\n")
+    boundary = head.split(b"\r\n", 1)[0]
+    return rest.split(b"\r\n" + boundary, 1)[0]
+
+
+def _input_texts(action: str, body: bytes, sample_chars: int) -> List[str]:
+    """Texts of an annotation request body."""
+    if action.endswith("_documents"):
+        return [d.get("text", "") for d in json.loads(body or b"[]")]
+    if action.endswith("_binary"):
+        return [_multipart_file(body)[:sample_chars].decode("utf-8", errors="replace")]
+    return [body.decode("utf-8")]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    stub: StubSherpaServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _send(self, payload: Any, status: int = 200):
+        self._send_body(json.dumps(payload).encode("utf-8"), "application/json", status)
+
+    def _send_body(self, body: bytes, content_type: str, status: int = 200, file_name: Optional[str] = None):
+        threshold = self.stub.config.gzip_threshold
+        gzipped = (
+            threshold is not None
+            and len(body) >= threshold
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        )
+        if gzipped:
+            body = gzip.compress(body, 6)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if file_name is not None:
+            self.send_header("Content-Disposition", f'attachment; filename="{file_name}"')
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Accept-Encoding", "identity" if self.stub.config.reject_compressed else "gzip, zstd")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _raw_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            length = int(self.headers.get("Content-Length", 0))
+            return self.rfile.read(length) if length else b""
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if not size:
+                # skip the trailers up to the final empty line
+                while self.rfile.readline().strip():
+                    pass
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def _body(self) -> bytes:
+        body = self._raw_body()
+        encoding = self.headers.get("Content-Encoding")
+        with self.stub.lock:
+            self.stub.request_encodings[encoding or "identity"] += 1
+        if encoding == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == "zstd":
+            import zstandard
+
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return body
+
+    def _route(self, method: str):
+        stub = self.stub
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p][1:]  # strip /api
+        route = list(parts)
+        if len(route) > 1 and route[0] == "projects":
+            route[1] = "*"
+            if len(route) > 3 and route[2] in ("annotators", "plans", "job"):
+                route[3] = "*"
+        with stub.lock:
+            stub.requests[f"{method} /{'/'.join(route)}"] += 1
+        cfg = stub.config
+        delay = cfg.endpoint_latency.get(parts[-1] if parts else "", cfg.latency)
+        body = self._body() if method == "POST" else b""
+        if delay:
+            time.sleep(delay)
+
+        if len(parts) < 2 or parts[0] != "projects":
+            return self._route_server(parts, body, url.path)
+        project, rest = parts[1], parts[2:]
+        if rest == ["annotators_by_type"]:
+            return self._send(stub.annotators(project))
+        if rest == ["labels"]:
+            return self._send(stub.labels(project))
+        if rest == ["documents", "_sample"]:
+            return self._send(stub.sample(project, int(query.get("sampleSize", ["10"])[0])))
+        if rest == ["documents"] and method == "POST":
+            return self._send(stub.job(project, f"import_{time.time_ns()}", "DOC_IMPORT"))
+        if len(rest) == 2 and rest[0] == "plans":
+            return self._send(stub.plan(project, rest[1]))
+        if len(rest) == 2 and rest[0] == "job":
+            return self._send(stub.job(project, rest[1]))
+        if len(rest) == 3 and rest[0] in ("annotators", "plans"):
+            action = rest[2]
+            if action == "_annotate":
+                return self._send(stub.annotate(project, body.decode("utf-8")))
+            if action == "_annotate_documents":
+                docs = json.loads(body or b"[]")
+                return self._send([stub.annotate(project, d.get("text", "")) for d in docs])
+            if action == "_annotate_binary":
+                # stands for the converter output: only the head of the file is kept
+                text = _multipart_file(body)[: cfg.sample_chars].decode("utf-8", errors="replace")
+                return self._send([stub.annotate(project, text)])
+            if action.startswith("_annotate_format_"):
+                csv = stub.format_csv(project, _input_texts(action, body, cfg.sample_chars))
+                return self._send_body(csv, "text/csv", file_name=f"{rest[1]}.csv")
+            if action == "_annotate_corpus":
+                return self._send(stub.job(project, f"corpus_{time.time_ns()}"))
+        return self._send({"error": f"unknown endpoint {url.path}"}, 404)
+
+    def _route_server(self, parts: List[str], body: bytes, path: str):
+        stub = self.stub
+        if parts == ["auth", "login"]:
+            return self._send({"access_token": stub.issue_token(), "username": "bench", "email": "bench"})
+        if parts == ["projects"]:
+            return self._send(stub.projects())
+        if parts == ["annotate", "_annotate_binary"]:
+            # converter only: the head of the file, without annotations
+            text = _multipart_file(body)[: stub.config.sample_chars].decode("utf-8", errors="replace")
+            return self._send([{"identifier": "converted", "text": text, "annotations": []}])
+        return self._send({"error": f"unknown endpoint {path}"}, 404)
+
+    def _unauthorized(self) -> bool:
+        if urlparse(self.path).path.rstrip("/").endswith("/auth/login"):
+            return False
+        if self.stub.authorized(self.headers.get("Authorization", "")):
+            return False
+        self._raw_body()
+        self._send({"error": "invalid token"}, 401)
+        return True
+
+    def do_GET(self):  # noqa: N802
+        if not self._unauthorized():
+            self._route("GET")
+
+    def do_POST(self):  # noqa: N802
+        if self._unauthorized():
+            return
+        if self.stub.config.reject_compressed and self.headers.get("Content-Encoding"):
+            self._raw_body()
+            return self._send({"error": "unsupported content encoding"}, 415)
+        self._route("POST")
+
+
+class StubServerProcess:
+    """Stub server running in a child process.
+
+    Used when the client is measured with ``tracemalloc``, which would
+    otherwise also trace the allocations of an in-process server.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.process: Optional[subprocess.Popen] = None
+        self.url = ""
+
+    def start(self) -> "StubServerProcess":
+        self.process = subprocess.Popen(
+            [sys.executable, __file__, "0", str(self.latency)],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        assert self.process.stdout is not None
+        line = self.process.stdout.readline()
+        if not line.startswith("Stub Sherpa server listening on "):
+            self.stop()
+            raise RuntimeError("The stub server process did not start")
+        self.url = line.rsplit(" ", 1)[-1].strip()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(port: int = 8008, latency: float = 0.0):
+    """Run the stub server in the foreground."""
+    server = StubSherpaServer(port=port, latency=latency)
+    print(f"Stub Sherpa server listening on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    import plac
+
+    plac.call(main)
@@ -1,4 +1,14 @@
 "Kairntech Sherpa building blocks for Streamlit apps"
 __version__ = "0.3.5"
 
-from .visualizer import visualize
+from .sherpa import StreamlitSherpaClient, ExtendedAnnotator, upload_file  # noqa: F401
+
+
+def __getattr__(name):
+    # The visualizer pulls in streamlit, pandas and PIL: only import it on demand
+    # so that headless users of the client stay lightweight
+    if name == "visualize":
+        from .visualizer import visualize
+
+        return visualize
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,185 @@
+"""Stores of Sherpa authentication tokens and session cookies.
+
+Clients look up a :class:`TokenStore` before logging in and reuse what they
+find until it is about to expire. Entries are keyed by a digest of the
+server, user and password, so a wrong password never matches a stored
+token and store files do not reveal user names.
+
+:class:`MemoryTokenStore` shares logins between the clients of a process,
+:class:`FileTokenStore` keeps them across restarts and between replicas on
+the same disk, encrypted with a secret (requires the optional
+``cryptography`` package)::
+
+    store = FileTokenStore("~/.sherpa/tokens", secret=os.environ["TOKEN_SECRET"])
+    client = StreamlitSherpaClient(server, user, password, token_store=store)
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+import attr
+
+if sys.platform == "win32":  # pragma: no cover
+    fcntl = None
+else:
+    import fcntl
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # pragma: no cover
+    Fernet = InvalidToken = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN = "token"
+COOKIE = "cookie"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class StoredLogin:
+    kind: str
+    token: Optional[str] = None
+    cookies: Dict[str, str] = attr.ib(factory=dict)
+    # epoch seconds, None when unknown (session cookies)
+    expires_at: Optional[float] = None
+
+    def is_valid(self, margin: float = 0.0, now: Optional[float] = None) -> bool:
+        if self.expires_at is None:
+            return True
+        return (time.time() if now is None else now) < self.expires_at - margin
+
+
+def login_key(server: str, user: str, password: str) -> str:
+    """Store key of a login, a digest of the server, user and password."""
+    return hashlib.blake2b(f"{server}\0{user}\0{password}".encode("utf-8"), digest_size=24).hexdigest()
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """The ``exp`` claim of a JWT, without verifying its signature."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenStore(ABC):
+    """Base class of token stores, a thread-safe mapping of login keys."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[StoredLogin]:
+        """The login stored for ``key``, if any."""
+
+    @abstractmethod
+    def put(self, key: str, login: StoredLogin):
+        """Store ``login`` for ``key``, replacing the previous one."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Forget the login of ``key``, if any."""
+
+
+class MemoryTokenStore(TokenStore):
+    """Logins shared by the clients of the current process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.logins: Dict[str, StoredLogin] = {}
+
+    def get(self, key: str) -> Optional[StoredLogin]:
+        with self.lock:
+            return self.logins.get(key)
+
+    def put(self, key: str, login: StoredLogin):
+        with self.lock:
+            self.logins[key] = login
+
+    def delete(self, key: str):
+        with self.lock:
+            self.logins.pop(key, None)
+
+
+class FileTokenStore(TokenStore):
+    """Logins encrypted in a file readable only by the current user.
+
+    The encryption key is derived from ``secret`` (by default the
+    ``SHERPA_STREAMLIT_TOKEN_SECRET`` environment variable). The file is
+    rewritten atomically and, on POSIX systems, updates hold an exclusive
+    lock on a sidecar ``.lock`` file, so several processes can share it.
+    """
+
+    def __init__(self, path: Union[str, Path], secret: Optional[str] = None):
+        if Fernet is None:
+            raise ImportError("FileTokenStore requires cryptography, install sherpa-streamlit[secure]")
+        secret = secret or os.environ.get("SHERPA_STREAMLIT_TOKEN_SECRET")
+        if not secret:
+            raise ValueError("FileTokenStore needs a secret or SHERPA_STREAMLIT_TOKEN_SECRET")
+        self.path = Path(path).expanduser()
+        self.fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret.encode("utf-8")).digest()))
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize the read-modify-write of the file between threads and processes."""
+        with self.lock:
+            if fcntl is None:  # pragma: no cover
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path.with_name(f".{self.path.name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                # closing the descriptor releases the lock
+                os.close(fd)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.fernet.decrypt(self.path.read_bytes()))
+        except FileNotFoundError:
+            return {}
+        except (InvalidToken, ValueError) as e:
+            logger.warning("Ignoring unreadable token store %s: %s", self.path, e)
+            return {}
+
+    def _write(self, logins: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.fernet.encrypt(json.dumps(logins).encode("utf-8")))
+        os.replace(tmp, self.path)
+
+    def get(self, key: str) -> Optional[StoredLogin]:
+        with self.lock:
+            data = self._read().get(key)
+        return StoredLogin(**data) if data else None
+
+    def put(self, key: str, login: StoredLogin):
+        with self._locked():
+            logins = self._read()
+            now = time.time()
+            # drop expired logins while rewriting the file
+            logins = {k: v for k, v in logins.items() if StoredLogin(**v).is_valid(now=now)}
+            logins[key] = attr.asdict(login)
+            self._write(logins)
+
+    def delete(self, key: str):
+        with self._locked():
+            logins = self._read()
+            if logins.pop(key, None) is not None:
+                self._write(logins)
+
+
+MEMORY_STORE = MemoryTokenStore()
@@ -0,0 +1,118 @@
+"""Background execution of annotation work for Streamlit sessions.
+
+Work is submitted to one executor shared by all sessions of the process and
+each session keeps its :class:`TaskQueue` in ``st.session_state``. The
+script thread only submits work and renders whatever is finished, so widgets
+stay responsive while annotations run::
+
+    tasks = session_tasks()
+    tasks.submit(client.annotate_text, project, annotator, text, description="Sample text")
+    for task in tasks.finished():
+        ...
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+import attr
+
+from .metrics import REGISTRY
+from .scheduling import in_current_context
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+_IDS = count(1)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Executor shared by all sessions, sized by ``SHERPA_STREAMLIT_WORKERS``."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            workers = int(os.environ.get("SHERPA_STREAMLIT_WORKERS", "8"))
+            _EXECUTOR = ThreadPoolExecutor(workers, thread_name_prefix="sherpa-annotate")
+        return _EXECUTOR
+
+
+@attr.s(auto_attribs=True)
+class Task:
+    id: int
+    description: str
+    future: Future
+    submitted: float
+    context: Dict[str, Any] = attr.ib(factory=dict)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        return "running" if self.started is not None else "queued"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or monotonic()) - self.submitted
+
+
+class TaskQueue:
+    """Tasks submitted by one session, oldest first."""
+
+    def __init__(self, max_finished: int = 20):
+        self.tasks: List[Task] = []
+        self.max_finished = max_finished
+
+    def submit(self, fn: Callable, *args, description: str = "", context: Optional[Dict[str, Any]] = None, **kwargs) -> Task:
+        task = Task(next(_IDS), description, Future(), monotonic(), context or {})
+
+        def run():
+            task.started = monotonic()
+            REGISTRY.histogram("sherpa_background_queue_seconds", "Background task queueing delay").observe(
+                task.started - task.submitted
+            )
+            return fn(*args, **kwargs)
+
+        def done(_):
+            task.finished = monotonic()
+
+        # in the lane of the submitting session
+        task.future = get_executor().submit(in_current_context(run))
+        task.future.add_done_callback(done)
+        self.tasks.append(task)
+        self._trim()
+        return task
+
+    def _trim(self):
+        finished = [t for t in self.tasks if t.future.done()]
+        for task in finished[: max(0, len(finished) - self.max_finished)]:
+            self.tasks.remove(task)
+
+    def pending(self) -> List[Task]:
+        return [t for t in self.tasks if not t.future.done()]
+
+    def finished(self) -> List[Task]:
+        return [t for t in self.tasks if t.future.done()]
+
+    def get(self, task_id: int) -> Optional[Task]:
+        return next((t for t in self.tasks if t.id == task_id), None)
+
+    def cancel_pending(self):
+        for task in self.pending():
+            task.future.cancel()
+
+    def clear_finished(self):
+        self.tasks = self.pending()
+
+
+def session_tasks(key: str = "sherpa_tasks") -> TaskQueue:
+    """The task queue of the current Streamlit session."""
+    import streamlit as st
+
+    if key not in st.session_state:
+        st.session_state[key] = TaskQueue()
+    return st.session_state[key]
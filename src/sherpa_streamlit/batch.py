@@ -0,0 +1,202 @@
+"""Annotation of a batch of uploaded files.
+
+A :class:`Batch` runs one annotation work per file in the shared background
+executor, at most ``workers`` at a time, and keeps the progress of each file.
+The outputs of each file are added to a zip bundle as soon as it finishes, so
+the bundle is complete when the last file is done::
+
+    batch = Batch(entries=result_entries, workers=4)
+    for f in files:
+        batch.submit(f.name, work_for(f))
+    batch.progress    # fraction of the files finished
+    batch.bundle()    # the zip file, once all files are finished
+"""
+import csv
+import io
+import shutil
+import threading
+import zipfile
+from collections import deque
+from time import monotonic
+from typing import IO, Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import attr
+
+from .background import get_executor
+from .metrics import REGISTRY
+from .scheduling import in_current_context
+from .spool import DEFAULT_SPOOL_THRESHOLD, spooled_file
+
+Entry = Tuple[str, Union[bytes, IO[bytes]]]
+
+
+@attr.s(auto_attribs=True)
+class BatchItem:
+    name: str
+    work: Callable[[], Any]
+    status: str = "queued"
+    result: Any = None
+    error: Optional[BaseException] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or monotonic()) - self.started
+
+
+class Batch:
+    """Files annotated concurrently, their outputs bundled in a zip as they finish.
+
+    ``entries`` gives the bundle entries, names and contents, of the result of
+    a file and ``summarize`` the columns of its row in :meth:`summary`.
+    """
+
+    def __init__(
+        self,
+        entries: Optional[Callable[[str, Any], Iterable[Entry]]] = None,
+        summarize: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        workers: int = 4,
+        spool_threshold: int = DEFAULT_SPOOL_THRESHOLD,
+        context: Optional[Dict[str, Any]] = None,
+    ):
+        self.entries = entries
+        self.summarize = summarize
+        self.workers = workers
+        self.context = context or {}
+        self.items: List[BatchItem] = []
+        self.lock = threading.Lock()
+        self._queue: Deque[BatchItem] = deque()
+        self._running = 0
+        self._spool = spooled_file(spool_threshold)
+        self._zip = zipfile.ZipFile(self._spool, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip_lock = threading.Lock()
+        self._names: Set[str] = set()
+
+    def submit(self, name: str, work: Callable[[], Any]) -> BatchItem:
+        # items may be started from the thread of another item, keep the lane of the caller
+        item = BatchItem(name, in_current_context(work))
+        with self.lock:
+            self.items.append(item)
+            self._queue.append(item)
+        self._dispatch()
+        return item
+
+    def _dispatch(self):
+        # start queued items while fewer than ``workers`` are running
+        while True:
+            with self.lock:
+                if self._running >= self.workers or not self._queue:
+                    return
+                item = self._queue.popleft()
+                self._running += 1
+            get_executor().submit(self._run, item)
+
+    def _run(self, item: BatchItem):
+        item.started = monotonic()
+        item.status = "running"
+        try:
+            item.result = item.work()
+        except Exception as e:  # noqa: B902
+            item.error = e
+        try:
+            if item.error is None:
+                self._add_to_bundle(item)
+        except Exception as e:  # noqa: B902
+            item.error = e
+        finally:
+            item.finished = monotonic()
+            item.status = "failed" if item.error is not None else "done"
+            REGISTRY.counter("sherpa_batch_files_total", "Files of batches").inc(status=item.status)
+            REGISTRY.histogram("sherpa_batch_file_seconds", "Batch file annotation time").observe(item.elapsed)
+            with self.lock:
+                self._running -= 1
+            self._dispatch()
+
+    def _entry_name(self, name: str) -> str:
+        unique, i = name, 1
+        while unique in self._names:
+            stem, dot, ext = name.rpartition(".")
+            unique = f"{stem}_{i}.{ext}" if dot and stem else f"{name}_{i}"
+            i += 1
+        self._names.add(unique)
+        return unique
+
+    def _add_to_bundle(self, item: BatchItem):
+        if self.entries is None:
+            return
+        with self._zip_lock:
+            if self._zip.fp is None:
+                # the batch was closed while the file was annotated
+                return
+            for name, content in self.entries(item.name, item.result):
+                name = self._entry_name(name)
+                if isinstance(content, (bytes, bytearray)):
+                    self._zip.writestr(name, content)
+                else:
+                    content.seek(0)
+                    with self._zip.open(name, "w") as out:
+                        shutil.copyfileobj(content, out)
+                    content.seek(0)
+
+    def cancel(self):
+        """Drop the files not started yet."""
+        with self.lock:
+            while self._queue:
+                item = self._queue.popleft()
+                item.status = "cancelled"
+
+    def pending(self) -> List[BatchItem]:
+        return [item for item in self.items if item.status in ("queued", "running")]
+
+    @property
+    def done(self) -> bool:
+        return not self.pending()
+
+    @property
+    def progress(self) -> float:
+        if not self.items:
+            return 1.0
+        return 1.0 - len(self.pending()) / len(self.items)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per file: name, status, time, error and the summarized result."""
+        rows = []
+        for item in self.items:
+            row = {"file": item.name, "status": item.status, "seconds": round(item.elapsed, 2)}
+            if item.error is not None:
+                row["error"] = str(item.error)
+            if item.status == "done" and self.summarize is not None:
+                row.update(self.summarize(item.result))
+            rows.append(row)
+        return rows
+
+    def bundle(self) -> Optional[IO[bytes]]:
+        """The zip of the outputs with a ``summary.csv``, once all files are finished.
+
+        ``None`` before, or after :meth:`close`.
+        """
+        if not self.done or self._spool.closed:
+            return None
+        with self._zip_lock:
+            if self._zip.fp is not None:
+                rows = self.summary()
+                columns = list(dict.fromkeys(k for row in rows for k in row))
+                text = io.StringIO()
+                writer = csv.DictWriter(text, columns)
+                writer.writeheader()
+                writer.writerows(rows)
+                self._zip.writestr(self._entry_name("summary.csv"), text.getvalue())
+                self._zip.close()
+        self._spool.seek(0)
+        return self._spool
+
+    def close(self):
+        """Cancel the files not started and delete the bundle."""
+        self.cancel()
+        with self._zip_lock:
+            if self._zip.fp is not None:
+                self._zip.close()
+            self._spool.close()
@@ -0,0 +1,527 @@
+"""Byte-bounded LRU caches for client methods.
+
+Drop-in replacement for ``methodtools.lru_cache``: every instance gets its own
+cache, but all caches also report to a shared :class:`CacheBudget` so the total
+memory held by cached Sherpa objects can be capped in bytes.
+
+:func:`shared_cache` memoizes functions for the whole process. A read-only
+copy of each value is made once, with :func:`freeze`, and every hit returns
+that same copy instead of an unpickled one.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic
+from functools import _make_key, update_wrapper  # type: ignore
+from itertools import count
+from types import FunctionType, MethodType, ModuleType
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import attr
+from weakref import WeakSet
+
+MB = 1024 * 1024
+
+_ATOMIC = (str, bytes, bytearray, int, float, complex, bool, type(None))
+_SKIPPED = (type, ModuleType, FunctionType, MethodType)
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+    evictions: int
+    bytes: int
+    maxbytes: Optional[int]
+
+
+def estimate_size(obj: Any) -> int:
+    """Estimate the deep size in bytes of an object graph.
+
+    Containers, dicts and plain objects (such as the attrs models of
+    ``sherpa_client``) are walked recursively, shared objects are counted once.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SKIPPED):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o, 64)
+        if isinstance(o, _ATOMIC):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            # slots of the base classes are not listed in the __slots__ of the type
+            for cls in type(o).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                for slot in (slots,) if isinstance(slots, str) else slots:
+                    if slot not in ("__dict__", "__weakref__"):
+                        stack.append(getattr(o, slot, None))
+    return total
+
+
+class CacheBudget:
+    """Global byte budget shared by a group of caches.
+
+    When the total size of the registered caches exceeds ``maxbytes``, the
+    least recently used entries are evicted across all of them.
+    """
+
+    def __init__(self, maxbytes: Optional[int] = None):
+        self.maxbytes = maxbytes
+        self.lock = threading.RLock()
+        self.bytes = 0
+        self.evictions = 0
+        self.caches: "WeakSet[LruCache]" = WeakSet()
+        self._ticks = count()
+
+    def tick(self) -> int:
+        return next(self._ticks)
+
+    def register(self, cache: "LruCache"):
+        with self.lock:
+            self.caches.add(cache)
+
+    def enforce(self):
+        with self.lock:
+            while self.maxbytes is not None and self.bytes > self.maxbytes:
+                oldest = None
+                for cache in self.caches:
+                    tick = cache.oldest_tick()
+                    if tick is not None and (oldest is None or tick < oldest[0]):
+                        oldest = (tick, cache)
+                if oldest is None:
+                    break
+                oldest[1].evict()
+                self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            infos = [c.info() for c in self.caches]
+            return CacheInfo(
+                hits=sum(i.hits for i in infos),
+                misses=sum(i.misses for i in infos),
+                maxsize=None,
+                currsize=sum(i.currsize for i in infos),
+                evictions=self.evictions,
+                bytes=self.bytes,
+                maxbytes=self.maxbytes,
+            )
+
+
+def _env_maxbytes() -> Optional[int]:
+    value = os.environ.get("SHERPA_STREAMLIT_CACHE_MAXBYTES")
+    return int(value) if value else 256 * MB
+
+
+GLOBAL_BUDGET = CacheBudget(_env_maxbytes())
+
+
+def set_cache_budget(maxbytes: Optional[int]):
+    """Change the global byte budget (``None`` means unbounded)."""
+    GLOBAL_BUDGET.maxbytes = maxbytes
+    GLOBAL_BUDGET.enforce()
+
+
+class LruCache:
+    """A single LRU store bounded by entry count and by bytes."""
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = 128,
+        maxbytes: Optional[int] = None,
+        budget: CacheBudget = GLOBAL_BUDGET,
+        name: str = "",
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.budget = budget
+        self.data: "OrderedDict[Any, list]" = OrderedDict()
+        self.hits = self.misses = self.evictions = self.bytes = 0
+        budget.register(self)
+
+    def peek(self, key, default=None):
+        """The value of ``key`` without counting a hit or a miss or refreshing it."""
+        with self.budget.lock:
+            entry = self.data.get(key)
+            return default if entry is None else entry[0]
+
+    def get(self, key, default=None):
+        with self.budget.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            entry[2] = self.budget.tick()
+            self.data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size: Optional[int] = None):
+        """Store ``value``, ``size`` defaults to :func:`estimate_size`."""
+        if size is None:
+            size = estimate_size(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        with self.budget.lock:
+            self.discard(key)
+            self.data[key] = [value, size, self.budget.tick()]
+            self.bytes += size
+            self.budget.bytes += size
+            while self.data and (
+                (self.maxsize is not None and len(self.data) > self.maxsize)
+                or (self.maxbytes is not None and self.bytes > self.maxbytes)
+            ):
+                self.evict()
+            self.budget.enforce()
+
+    def discard(self, key):
+        with self.budget.lock:
+            entry = self.data.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+                self.budget.bytes -= entry[1]
+
+    def evict(self):
+        with self.budget.lock:
+            _, entry = self.data.popitem(last=False)
+            self.bytes -= entry[1]
+            self.budget.bytes -= entry[1]
+            self.evictions += 1
+
+    def oldest_tick(self) -> Optional[int]:
+        with self.budget.lock:
+            for entry in self.data.values():
+                return entry[2]
+            return None
+
+    def clear(self):
+        with self.budget.lock:
+            self.budget.bytes -= self.bytes
+            self.data.clear()
+            self.hits = self.misses = self.evictions = self.bytes = 0
+
+    def info(self) -> CacheInfo:
+        with self.budget.lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                maxsize=self.maxsize,
+                currsize=len(self.data),
+                evictions=self.evictions,
+                bytes=self.bytes,
+                maxbytes=self.maxbytes,
+            )
+
+    def __del__(self):
+        try:
+            self.clear()
+        except Exception:  # noqa: B902
+            pass
+
+
+_MISSING = object()
+
+
+class _BoundCache:
+    def __init__(self, func: Callable, instance: Any, cache: LruCache, typed: bool):
+        self.__func__ = func
+        self.__self__ = instance
+        self.cache = cache
+        self.typed = typed
+        update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        key = _make_key(args, kwargs, self.typed)
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.__func__(self.__self__, *args, **kwargs)
+            self.cache.put(key, value)
+        return value
+
+    def cache_info(self) -> CacheInfo:
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    clear_cache = cache_clear
+
+
+class lru_cache:  # noqa: N801
+    """Per-instance method cache bounded by entries and bytes.
+
+    Usage mirrors ``methodtools.lru_cache``::
+
+        class Client:
+            @lru_cache(maxsize=32, maxbytes=16 * MB)
+            def get_projects(self):
+                ...
+
+    ``client.get_projects.cache_info()`` returns an extended
+    :class:`CacheInfo` with evictions and byte counts.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = 128,
+        typed: bool = False,
+        *,
+        maxbytes: Optional[int] = None,
+        budget: CacheBudget = GLOBAL_BUDGET,
+    ):
+        self.maxsize = maxsize
+        self.typed = typed
+        self.maxbytes = maxbytes
+        self.budget = budget
+        self.func: Optional[Callable] = None
+        self.attrname: Optional[str] = None
+
+    def __call__(self, func: Callable) -> "lru_cache":
+        self.func = func
+        update_wrapper(self, func)
+        return self
+
+    def __set_name__(self, owner, name):
+        self.attrname = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        bound = instance.__dict__.get(self.attrname)
+        if bound is None:
+            cache = LruCache(
+                self.maxsize, self.maxbytes, self.budget, self.func.__qualname__
+            )
+            bound = instance.__dict__.setdefault(
+                self.attrname, _BoundCache(self.func, instance, cache, self.typed)
+            )
+        return bound
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} from a shared cache is read-only")
+
+
+class FrozenList(list):
+    """A list that cannot be modified, its copies are plain lists."""
+
+    __slots__ = ()
+
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+class FrozenDict(dict):
+    """A dict that cannot be modified, its copies are plain dicts."""
+
+    __slots__ = ()
+
+    pop = popitem = clear = update = setdefault = _read_only
+    __setitem__ = __delitem__ = __ior__ = _read_only
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+
+def _thawed(cls: type, state: Dict[str, Any]) -> Any:
+    obj: Any = object.__new__(cls)
+    obj.__dict__.update(state)
+    return obj
+
+
+_FROZEN_TYPES: Dict[type, type] = {}
+_FROZEN_TYPES_LOCK = threading.Lock()
+
+
+def _frozen_type(cls: type) -> type:
+    """Read-only subclass of an attrs class, the class of its frozen copies."""
+    with _FROZEN_TYPES_LOCK:
+        frozen = _FROZEN_TYPES.get(cls)
+        if frozen is None:
+
+            def __new__(klass, *args, **kwargs):  # noqa: N807
+                # constructors (from_dict, attr.evolve) build mutable instances
+                return cls(*args, **kwargs)
+
+            def __reduce_ex__(self, protocol):  # noqa: N807
+                # pickled and copied as a mutable instance
+                return _thawed, (cls, dict(self.__dict__))
+
+            def __eq__(self, other):  # noqa: N807
+                # attrs only compares instances of the very same class
+                if not isinstance(other, cls):
+                    return NotImplemented
+                return all(
+                    getattr(self, f.name) == getattr(other, f.name)
+                    for f in attr.fields(cls)
+                    if f.eq
+                )
+
+            def __hash__(self):  # noqa: N807
+                if cls.__hash__ is None:
+                    raise TypeError(f"unhashable type: '{cls.__name__}'")
+                return cls.__hash__(self)
+
+            frozen = _FROZEN_TYPES[cls] = type(
+                cls.__name__,
+                (cls,),
+                {
+                    "__new__": __new__,
+                    "__setattr__": _read_only,
+                    "__delattr__": _read_only,
+                    "__reduce_ex__": __reduce_ex__,
+                    "__eq__": __eq__,
+                    "__hash__": __hash__,
+                    "__module__": cls.__module__,
+                    "__qualname__": cls.__qualname__,
+                },
+            )
+            _FROZEN_TYPES[frozen] = frozen
+        return frozen
+
+
+def freeze(obj: Any, _memo: Optional[Dict[int, Any]] = None) -> Any:
+    """Read-only copy of an object graph, ``obj`` itself is left unchanged.
+
+    Lists and dicts are copied as :class:`FrozenList` and :class:`FrozenDict`
+    and instances of attrs classes (the ``sherpa_client`` models) as instances
+    of read-only subclasses, so ``isinstance`` checks still hold. Objects
+    shared in the graph are copied once. Frozen values are returned as is and
+    copies of them made with :mod:`copy` or :mod:`pickle` are mutable.
+    """
+    memo = {} if _memo is None else _memo
+    if isinstance(obj, _ATOMIC):
+        return obj
+    done = memo.get(id(obj))
+    if done is not None:
+        return done
+    frozen: Any
+    if isinstance(obj, (FrozenList, FrozenDict)) or _FROZEN_TYPES.get(type(obj)) is type(obj):
+        frozen = obj
+    elif isinstance(obj, list):
+        frozen = FrozenList(freeze(v, memo) for v in obj)
+    elif isinstance(obj, dict):
+        frozen = FrozenDict((k, freeze(v, memo)) for k, v in obj.items())
+    elif isinstance(obj, tuple) and type(obj) is tuple:
+        frozen = tuple(freeze(v, memo) for v in obj)
+    elif attr.has(type(obj)) and hasattr(obj, "__dict__"):
+        frozen = object.__new__(_frozen_type(type(obj)))
+        # registered first, for the cycles of the graph
+        memo[id(obj)] = frozen
+        frozen.__dict__.update((name, freeze(value, memo)) for name, value in obj.__dict__.items())
+        return frozen
+    else:
+        return obj
+    memo[id(obj)] = frozen
+    return frozen
+
+
+class KeyLocks:
+    """One lock per key, dropped once no caller holds or waits for it.
+
+    A lock removed while callers still wait for it would let the next caller
+    create another one and run concurrently with them::
+
+        with locks.hold(key):
+            ...
+    """
+
+    def __init__(self):
+        self._locks: Dict[Any, List] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Any) -> Iterator[None]:
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class _SharedCache:
+    def __init__(self, func: Callable, ttl: Optional[float], cache: LruCache):
+        self.func = func
+        self.ttl = ttl
+        self.cache = cache
+        self._locks = KeyLocks()
+        update_wrapper(self, func)
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and (entry[1] is None or entry[1] > monotonic())
+
+    def __call__(self, *args, **kwargs):
+        key = _make_key(args, kwargs, False)
+        entry = self.cache.get(key)
+        if self._fresh(entry):
+            return entry[0]
+        # concurrent misses of a key wait for the first call
+        with self._locks.hold(key):
+            entry = self.cache.peek(key)
+            if not self._fresh(entry):
+                value = freeze(self.func(*args, **kwargs))
+                entry = (value, None if self.ttl is None else monotonic() + self.ttl)
+                self.cache.put(key, entry)
+        return entry[0]
+
+    def cache_info(self) -> CacheInfo:
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    clear = cache_clear
+
+
+def shared_cache(
+    ttl: Optional[float] = None,
+    maxsize: Optional[int] = 128,
+    *,
+    maxbytes: Optional[int] = None,
+    budget: CacheBudget = GLOBAL_BUDGET,
+) -> Callable[[Callable], _SharedCache]:
+    """Memoize a function for all threads of the process, returning frozen values.
+
+    Unlike ``st.experimental_memo``, hits return the cached object itself, a
+    read-only copy made by :func:`freeze`, rather than an unpickled copy. The
+    value returned by the function, which may be cached elsewhere, stays
+    mutable::
+
+        @shared_cache(ttl=3600)
+        def get_cached_projects(token):
+            ...
+    """
+
+    def decorator(func: Callable) -> _SharedCache:
+        return _SharedCache(func, ttl, LruCache(maxsize, maxbytes, budget, func.__qualname__))
+
+    return decorator
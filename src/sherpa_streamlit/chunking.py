@@ -0,0 +1,103 @@
+"""Splitting of long texts into overlapping chunks and stitching of the results.
+
+Chunks end on paragraph boundaries when possible, then on sentence
+boundaries, then on whitespace. Consecutive chunks overlap by about
+``overlap`` characters so that entities cut by one chunk boundary are seen
+whole by the neighbouring chunk. When stitching, each chunk owns the text up
+to the middle of its overlap with the next chunk and only spans starting in
+the owned region are kept, so each span is reported once.
+"""
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"[.!?;:]\s+|\n")
+SPACE_RE = re.compile(r"\s+")
+
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    # region of the document whose spans are taken from this chunk
+    own_start: int
+    own_end: int
+
+
+def _boundary(text: str, lo: int, hi: int, prefer_last: bool = True) -> Optional[int]:
+    """Offset just after the best separator in ``text[lo:hi]``."""
+    for pattern in (PARAGRAPH_RE, SENTENCE_RE, SPACE_RE):
+        ends = [m.end() for m in pattern.finditer(text, lo, hi)]
+        if ends:
+            return ends[-1] if prefer_last else ends[0]
+    return None
+
+
+def split_text(text: str, max_chars: int = 20000, overlap: int = 500) -> List[Chunk]:
+    """Split ``text`` into chunks of at most ``max_chars`` characters."""
+    if overlap * 2 >= max_chars:
+        raise ValueError("overlap must be smaller than half of max_chars")
+    n = len(text)
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    while True:
+        if n - start <= max_chars:
+            bounds.append((start, n))
+            break
+        # end on a separator in the second half of the window
+        end = _boundary(text, start + max_chars // 2, start + max_chars) or start + max_chars
+        bounds.append((start, end))
+        # restart on a separator about `overlap` characters before the end
+        next_start = _boundary(text, max(start + 1, end - overlap), end, prefer_last=False)
+        start = next_start if next_start is not None and next_start < end else end
+    chunks: List[Chunk] = []
+    for i, (s, e) in enumerate(bounds):
+        own_start = chunks[-1].own_end if chunks else 0
+        if i + 1 < len(bounds):
+            next_start = bounds[i + 1][0]
+            own_end = (next_start + e) // 2 if next_start < e else e
+        else:
+            own_end = n
+        chunks.append(Chunk(s, e, own_start, own_end))
+    return chunks
+
+
+def _shift(items: Sequence[Dict[str, Any]], chunk: Chunk) -> List[Dict[str, Any]]:
+    kept = []
+    for item in items:
+        start = item["start"] + chunk.start
+        if chunk.own_start <= start < chunk.own_end:
+            kept.append({**item, "start": start, "end": item["end"] + chunk.start})
+    return kept
+
+
+def stitch(text: str, chunks: Sequence[Chunk], results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the JSON documents annotated for each chunk into one document.
+
+    Annotation and sentence offsets are shifted to document coordinates,
+    spans outside the region owned by their chunk and exact duplicates are
+    dropped. Categories are merged by label, keeping the best score. The
+    identifier, title and metadata are those of the first chunk result.
+    """
+    annotations: List[Dict[str, Any]] = []
+    sentences: List[Dict[str, Any]] = []
+    categories: Dict[str, Dict[str, Any]] = {}
+    seen = set()
+    for chunk, result in zip(chunks, results):
+        for a in _shift(result.get("annotations") or [], chunk):
+            key = (a["start"], a["end"], a.get("labelName"))
+            if key not in seen:
+                seen.add(key)
+                annotations.append(a)
+        sentences.extend(_shift(result.get("sentences") or [], chunk))
+        for c in result.get("categories") or []:
+            best = categories.get(c.get("labelName"))
+            if best is None or (c.get("score") or 0) > (best.get("score") or 0):
+                categories[c.get("labelName")] = c
+    annotations.sort(key=lambda a: (a["start"], -a["end"]))
+    doc: Dict[str, Any] = {
+        k: results[0][k] for k in ("identifier", "title", "metadata") if results and k in results[0]
+    }
+    doc.update(text=text, annotations=annotations, categories=list(categories.values()))
+    if sentences:
+        doc["sentences"] = sentences
+    return doc
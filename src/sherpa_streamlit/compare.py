@@ -0,0 +1,226 @@
+"""Side-by-side comparison of several annotators.
+
+:func:`annotate_many` sends the same input to N annotators concurrently, so
+the wall time is that of the slowest one. The agreement functions compare the
+resulting spans with numpy, without per-annotation Python loops::
+
+    docs, errors = annotate_many(client, "project", ["crf", "spacy"], text=text)
+    scores = agreement(docs["crf"], docs["spacy"])  # per label P/R/F1
+    labels_a, labels_b, matrix = overlap_matrix(docs["crf"], docs["spacy"])
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sherpa_client.types import Unset
+
+from .docview import AnyDocument, SpanArray
+from .scheduling import in_current_context
+from .sherpa import ExtendedAnnotator, StreamlitSherpaClient
+
+MICRO = "(micro)"
+
+
+class SpanSet(NamedTuple):
+    starts: np.ndarray
+    ends: np.ndarray
+    labels: np.ndarray
+
+
+class LabelScore(NamedTuple):
+    label: str
+    reference: int
+    candidate: int
+    matched_reference: int
+    matched_candidate: int
+    precision: float
+    recall: float
+    f1: float
+
+
+def _name(annotator: Union[str, ExtendedAnnotator]) -> str:
+    return annotator.label if isinstance(annotator, ExtendedAnnotator) else annotator
+
+
+def annotate_many(
+    client: StreamlitSherpaClient,
+    project: str,
+    annotators: Sequence[Union[str, ExtendedAnnotator]],
+    *,
+    text: Optional[str] = None,
+    json_data: Optional[bytes] = None,
+    binary: Optional[bytes] = None,
+    file_name: str = "file",
+    max_workers: Optional[int] = None,
+    raw: bool = True,
+) -> Tuple[Dict[str, AnyDocument], Dict[str, BaseException]]:
+    """Annotate a text, a JSON document or a binary file with several annotators concurrently.
+
+    Binary files are annotated with plans, plans sharing a converter convert
+    the file once (see :meth:`StreamlitSherpaClient.convert_cached`).
+    Results and errors are keyed by annotator label (or name for strings), in
+    the order of ``annotators``.
+    """
+    if sum(x is not None for x in (text, json_data, binary)) != 1:
+        raise ValueError("Exactly one of text, json_data or binary must be given")
+
+    def annotate(annotator):
+        if text is not None:
+            return client.annotate_text(project, annotator, text, raw=raw)
+        if binary is not None:
+            # one file object per thread over the same bytes
+            datafile = BytesIO(binary)
+            datafile.name = file_name
+            return client.annotate_binary(project, annotator, datafile, raw=raw, reuse_conversion=True)[0]
+        datafile = BytesIO(json_data)
+        return client.annotate_json(project, annotator, datafile, raw=raw)[0]
+
+    docs: Dict[str, AnyDocument] = {}
+    errors: Dict[str, BaseException] = {}
+    if not annotators:
+        return docs, errors
+    with ThreadPoolExecutor(max_workers or len(annotators)) as pool:
+        futures = [(_name(a), pool.submit(in_current_context(annotate), a)) for a in annotators]
+        for name, future in futures:
+            try:
+                docs[name] = future.result()
+            except Exception as e:  # noqa: B902
+                errors[name] = e
+    return docs, errors
+
+
+def span_set(doc: AnyDocument) -> SpanSet:
+    """Offsets and label names of the annotations of a document as arrays."""
+    annotations = doc.annotations
+    if isinstance(annotations, SpanArray):
+        return SpanSet(
+            np.frombuffer(annotations.starts, dtype=np.int64),
+            np.frombuffer(annotations.ends, dtype=np.int64),
+            np.array([r.get("labelName") for r in annotations.raw], dtype=object),
+        )
+    if isinstance(annotations, Unset) or not annotations:
+        empty = np.empty(0, dtype=np.int64)
+        return SpanSet(empty, empty, np.empty(0, dtype=object))
+    return SpanSet(
+        np.fromiter((a.start for a in annotations), dtype=np.int64, count=len(annotations)),
+        np.fromiter((a.end for a in annotations), dtype=np.int64, count=len(annotations)),
+        np.array([a.label_name for a in annotations], dtype=object),
+    )
+
+
+def _label_ids(reference: SpanSet, candidate: SpanSet) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    labels, inverse = np.unique(
+        np.concatenate([reference.labels, candidate.labels]).astype(str), return_inverse=True
+    )
+    n = len(reference.labels)
+    return labels, inverse[:n], inverse[n:]
+
+
+def overlapping_pairs(reference: SpanSet, candidate: SpanSet, block: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices ``(i, j)`` of all reference/candidate spans that overlap.
+
+    Candidates are sorted by start so each block of reference spans is only
+    compared with the window of candidates that can reach it.
+    """
+    if not len(reference.starts) or not len(candidate.starts):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    order = np.argsort(candidate.starts, kind="stable")
+    cs, ce = candidate.starts[order], candidate.ends[order]
+    max_len = int((ce - cs).max())
+    rows, cols = [], []
+    for lo in range(0, len(reference.starts), block):
+        rs = reference.starts[lo : lo + block]
+        re = reference.ends[lo : lo + block]
+        first = np.searchsorted(cs, rs.min() - max_len, side="left")
+        last = np.searchsorted(cs, re.max(), side="left")
+        if first >= last:
+            continue
+        mask = (rs[:, None] < ce[None, first:last]) & (cs[None, first:last] < re[:, None])
+        i, j = np.nonzero(mask)
+        rows.append(i + lo)
+        cols.append(order[j + first])
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def overlap_matrix(
+    reference: Union[AnyDocument, SpanSet], candidate: Union[AnyDocument, SpanSet]
+) -> Tuple[List[str], List[str], np.ndarray]:
+    """Count overlapping span pairs by (reference label, candidate label)."""
+    ref = reference if isinstance(reference, SpanSet) else span_set(reference)
+    cand = candidate if isinstance(candidate, SpanSet) else span_set(candidate)
+    labels, ref_ids, cand_ids = _label_ids(ref, cand)
+    rows, cols = overlapping_pairs(ref, cand)
+    matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    np.add.at(matrix, (ref_ids[rows], cand_ids[cols]), 1)
+    ref_used = np.unique(ref_ids)
+    cand_used = np.unique(cand_ids)
+    return (
+        [str(lab) for lab in labels[ref_used]],
+        [str(lab) for lab in labels[cand_used]],
+        matrix[np.ix_(ref_used, cand_used)],
+    )
+
+
+def _scores(label, n_ref, n_cand, hit_ref, hit_cand) -> LabelScore:
+    precision = hit_cand / n_cand if n_cand else 0.0
+    recall = hit_ref / n_ref if n_ref else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return LabelScore(label, int(n_ref), int(n_cand), int(hit_ref), int(hit_cand), precision, recall, f1)
+
+
+def agreement(
+    reference: Union[AnyDocument, SpanSet],
+    candidate: Union[AnyDocument, SpanSet],
+    mode: str = "exact",
+) -> List[LabelScore]:
+    """Precision, recall and F1 of ``candidate`` against ``reference`` per label.
+
+    In ``exact`` mode spans match when offsets and label are equal, in
+    ``overlap`` mode when they overlap and have the same label. The last row
+    holds the micro average.
+    """
+    ref = reference if isinstance(reference, SpanSet) else span_set(reference)
+    cand = candidate if isinstance(candidate, SpanSet) else span_set(candidate)
+    labels, ref_ids, cand_ids = _label_ids(ref, cand)
+    hit_ref = np.zeros(len(ref_ids), dtype=bool)
+    hit_cand = np.zeros(len(cand_ids), dtype=bool)
+    if mode == "exact":
+        width = np.int64(max(int(ref.ends.max(initial=0)), int(cand.ends.max(initial=0))) + 1)
+        nlabels = np.int64(max(len(labels), 1))
+        ref_keys = (ref.starts * width + ref.ends) * nlabels + ref_ids
+        cand_keys = (cand.starts * width + cand.ends) * nlabels + cand_ids
+        hit_ref = np.isin(ref_keys, cand_keys)
+        hit_cand = np.isin(cand_keys, ref_keys)
+    elif mode == "overlap":
+        rows, cols = overlapping_pairs(ref, cand)
+        same = ref_ids[rows] == cand_ids[cols]
+        hit_ref[rows[same]] = True
+        hit_cand[cols[same]] = True
+    else:
+        raise ValueError(f"Unknown agreement mode {mode}")
+    n = len(labels)
+    n_ref = np.bincount(ref_ids, minlength=n)
+    n_cand = np.bincount(cand_ids, minlength=n)
+    tp_ref = np.bincount(ref_ids, weights=hit_ref, minlength=n)
+    tp_cand = np.bincount(cand_ids, weights=hit_cand, minlength=n)
+    scores = [
+        _scores(str(labels[i]), n_ref[i], n_cand[i], tp_ref[i], tp_cand[i]) for i in range(n)
+    ]
+    scores.append(_scores(MICRO, n_ref.sum(), n_cand.sum(), tp_ref.sum(), tp_cand.sum()))
+    return scores
+
+
+def pairwise_f1(docs: Dict[str, AnyDocument], mode: str = "exact") -> Tuple[List[str], np.ndarray]:
+    """Micro F1 between every pair of documents (symmetric matrix)."""
+    names = list(docs)
+    spans = [span_set(docs[name]) for name in names]
+    matrix = np.eye(len(names))
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            matrix[i, j] = matrix[j, i] = agreement(spans[i], spans[j], mode)[-1].f1
+    return names, matrix
@@ -0,0 +1,188 @@
+"""Negotiated compression of Sherpa request and response bodies.
+
+Responses are negotiated with ``Accept-Encoding`` and decoded incrementally,
+chunk by chunk, so the compressed and the decoded body are never both fully in
+memory.
+
+Request bodies are only compressed for servers that accept it: a server
+lists the encodings it accepts in requests in the ``Accept-Encoding`` header
+of its responses (RFC 7694), which :func:`learn_request_encodings` records
+per server. Only textual bodies (JSON, text) above a size threshold are
+compressed, zstd when the optional ``zstandard`` package is installed
+(``pip install sherpa-streamlit[zstd]``), gzip otherwise. Multipart uploads and binary bodies, often compressed already, are
+sent as is. The compressed body is streamed to the server as it is produced.
+"""
+import threading
+import zlib
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import httpx
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_THRESHOLD = 16 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/xml")
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Content encodings this client can produce and decode, preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def accept_encoding() -> str:
+    return ", ".join(available_encodings())
+
+
+def _needs_manual_decoding(encoding: str) -> bool:
+    # httpx decodes gzip itself; zstd is always decoded here, from the raw
+    # stream, whether or not the installed httpx supports it
+    return encoding == "zstd"
+
+
+_REQUEST_ENCODINGS: Dict[str, Tuple[str, ...]] = {}
+_REQUEST_ENCODINGS_LOCK = threading.Lock()
+
+
+def learn_request_encodings(server: str, response: httpx.Response):
+    """Record the request encodings a server accepts, from the ``Accept-Encoding`` of a response."""
+    header = response.headers.get("Accept-Encoding")
+    if header is None:
+        return
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        if params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    with _REQUEST_ENCODINGS_LOCK:
+        _REQUEST_ENCODINGS[server] = tuple(e for e in available_encodings() if e in accepted)
+
+
+def request_encoding(server: str) -> Optional[str]:
+    """The preferred encoding of request bodies a server is known to accept."""
+    with _REQUEST_ENCODINGS_LOCK:
+        encodings = _REQUEST_ENCODINGS.get(server, ())
+    return encodings[0] if encodings else None
+
+
+def is_compressible(request: Dict[str, Any]) -> bool:
+    """Whether the body of httpx request kwargs is textual content worth compressing."""
+    if request.get("files") is not None or request.get("data") is not None or request.get("content") is None:
+        return False
+    headers = request.get("headers") or {}
+    content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self._obj: Any
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level or 3).compressobj()
+        elif encoding == "gzip":
+            self._obj = zlib.compressobj(level or 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"Unsupported content encoding {encoding!r}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._obj.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str, level: Optional[int] = None) -> Iterator[bytes]:
+    """Compress a stream of chunks, yielding the compressed output as it is produced."""
+    compressor = _Compressor(encoding, level)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class CompressedBody:
+    """Compressed request body, compressed again each time it is sent.
+
+    httpx streams it with chunked transfer encoding. ``size`` is the number
+    of compressed bytes of the last send.
+    """
+
+    def __init__(self, content: Any, encoding: str, level: Optional[int] = None):
+        self.content = content
+        self.encoding = encoding
+        self.level = level
+        self.size = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.size = 0
+        for chunk in compress_chunks(_body_chunks(self.content), self.encoding, self.level):
+            self.size += len(chunk)
+            yield chunk
+
+
+def _body_chunks(content: Any) -> Iterator[bytes]:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if isinstance(content, (bytes, bytearray)):
+        for i in range(0, len(content), CHUNK_SIZE):
+            yield bytes(content[i : i + CHUNK_SIZE])
+    elif content is not None:
+        yield from content
+
+
+def compress_request(request: Dict[str, Any], encoding: str, level: Optional[int] = None) -> Dict[str, Any]:
+    """Return a copy of httpx request kwargs with a compressed, streamed body."""
+    request = dict(request)
+    headers = dict(request.get("headers") or {})
+    request["content"] = CompressedBody(request.get("content"), encoding, level)
+    headers["Content-Encoding"] = encoding
+    request["headers"] = headers
+    return request
+
+
+def rewind(request: Dict[str, Any]):
+    """Seek the file objects of a multipart request back to their start."""
+    files = request.get("files") or {}
+    for part in files.values() if isinstance(files, dict) else (f for _, f in files):
+        payload = part[1] if isinstance(part, tuple) else part
+        if hasattr(payload, "seek"):
+            payload.seek(0)
+
+
+def read_response(response: httpx.Response) -> httpx.Response:
+    """Read a streamed response, decoding encodings httpx does not support.
+
+    Returns a response whose ``content`` is the decoded body.
+    """
+    encoding = response.headers.get("Content-Encoding", "").strip().lower()
+    if not _needs_manual_decoding(encoding):
+        response.read()
+        return response
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    content = b"".join(decompressor.decompress(chunk) for chunk in response.iter_raw(CHUNK_SIZE))
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")]
+    decoded = httpx.Response(response.status_code, headers=headers, content=content, request=response.request)
+    decoded.read()
+    return decoded
+
+
+def write_response(response: httpx.Response, sink: IO[bytes]) -> int:
+    """Write the decoded body of a streamed response to ``sink``, chunk by chunk.
+
+    Returns the number of decoded bytes written.
+    """
+    encoding = response.headers.get("Content-Encoding", "").strip().lower()
+    if _needs_manual_decoding(encoding):
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        chunks: Iterable[bytes] = (decompressor.decompress(chunk) for chunk in response.iter_raw(CHUNK_SIZE))
+    else:
+        chunks = response.iter_bytes(CHUNK_SIZE)
+    size = 0
+    for chunk in chunks:
+        sink.write(chunk)
+        size += len(chunk)
+    return size
@@ -0,0 +1,314 @@
+"""Re-annotation of many project corpora with a bounded number of server jobs.
+
+:class:`CorpusOrchestrator` launches ``annotate_corpus`` jobs for a list of
+tasks, never running more than ``max_concurrent`` at once, polls them to
+completion, retries failed ones and summarizes durations and throughput.
+A job that cannot be polled ``max_poll_failures`` times in a row, with an
+exponential backoff between polls, is treated as failed::
+
+    orchestrator = CorpusOrchestrator(client, max_concurrent=4)
+    summary = orchestrator.run([
+        CorpusTask("project_a", "crf_model", "models"),
+        CorpusTask("project_b", "crf_model", "models"),
+    ])
+    print(summary.format())
+"""
+import logging
+from collections import deque
+from time import monotonic, sleep
+from typing import Callable, Deque, Dict, Iterable, List, NamedTuple, Optional
+
+import attr
+import plac
+from sherpa_client.models import SherpaJobBean, SherpaJobBeanStatus
+
+from .metrics import REGISTRY
+from .scheduling import BATCH, lane
+from .sherpa import StreamlitSherpaClient
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusTask(NamedTuple):
+    project: str
+    annotator: str
+    annotator_project: str
+
+
+@attr.s(auto_attribs=True)
+class JobRecord:
+    task: CorpusTask
+    attempts: int = 0
+    job: Optional[SherpaJobBean] = None
+    status: str = "PENDING"
+    error: Optional[str] = None
+    # documents of the project after the job, annotate_corpus annotates them all
+    documents: Optional[int] = None
+    started: float = 0.0
+    finished: float = 0.0
+    not_before: float = 0.0
+    poll_failures: int = 0
+    next_poll: float = 0.0
+
+    @property
+    def seconds(self) -> float:
+        """Duration of the last attempt, from the server timestamps when available."""
+        job = self.job
+        if job is not None and job.created_at and isinstance(job.completed_at, int):
+            return (job.completed_at - job.created_at) / 1000
+        return self.finished - self.started if self.finished else 0.0
+
+
+class ProjectSummary(NamedTuple):
+    project: str
+    jobs: int
+    succeeded: int
+    failed: int
+    attempts: int
+    seconds: float
+    documents: int
+    docs_per_second: float
+
+
+@attr.s(auto_attribs=True)
+class CorpusSummary:
+    records: List[JobRecord]
+    wall_seconds: float
+
+    @property
+    def succeeded(self) -> List[JobRecord]:
+        return [r for r in self.records if r.status == SherpaJobBeanStatus.COMPLETED.value]
+
+    @property
+    def failed(self) -> List[JobRecord]:
+        return [r for r in self.records if r.status != SherpaJobBeanStatus.COMPLETED.value]
+
+    def projects(self) -> List[ProjectSummary]:
+        by_project: Dict[str, List[JobRecord]] = {}
+        for r in self.records:
+            by_project.setdefault(r.task.project, []).append(r)
+        summaries = []
+        for project, records in by_project.items():
+            done = [r for r in records if r.status == SherpaJobBeanStatus.COMPLETED.value]
+            seconds = sum(r.seconds for r in done)
+            documents = sum(r.documents or 0 for r in done)
+            summaries.append(
+                ProjectSummary(
+                    project=project,
+                    jobs=len(records),
+                    succeeded=len(done),
+                    failed=len(records) - len(done),
+                    attempts=sum(r.attempts for r in records),
+                    seconds=seconds,
+                    documents=documents,
+                    docs_per_second=documents / seconds if seconds else 0.0,
+                )
+            )
+        return summaries
+
+    @property
+    def documents(self) -> int:
+        return sum(r.documents or 0 for r in self.succeeded)
+
+    def format(self) -> str:
+        lines = [
+            f"{'project':30s} {'jobs':>5s} {'ok':>4s} {'failed':>6s} {'tries':>5s} "
+            f"{'seconds':>9s} {'docs':>8s} {'docs/s':>8s}"
+        ]
+        for p in self.projects():
+            lines.append(
+                f"{p.project:30s} {p.jobs:5d} {p.succeeded:4d} {p.failed:6d} {p.attempts:5d} "
+                f"{p.seconds:9.1f} {p.documents:8d} {p.docs_per_second:8.2f}"
+            )
+        throughput = self.documents / self.wall_seconds if self.wall_seconds else 0.0
+        lines.append(
+            f"{len(self.succeeded)}/{len(self.records)} jobs completed in {self.wall_seconds:.1f}s, "
+            f"{self.documents} documents ({throughput:.2f} docs/s)"
+        )
+        return "\n".join(lines)
+
+
+class CorpusOrchestrator:
+    """Run corpus annotation jobs with a concurrency cap and retries."""
+
+    def __init__(
+        self,
+        client: StreamlitSherpaClient,
+        max_concurrent: int = 4,
+        max_retries: int = 2,
+        poll_interval: float = 10.0,
+        retry_delay: float = 30.0,
+        max_poll_failures: int = 5,
+        email_notification: bool = False,
+        on_update: Optional[Callable[[JobRecord], None]] = None,
+    ):
+        self.client = client
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_poll_failures = max_poll_failures
+        self.email_notification = email_notification
+        self.on_update = on_update
+
+    def _update(self, record: JobRecord):
+        if self.on_update is not None:
+            self.on_update(record)
+
+    def _launch(self, record: JobRecord, pending: Deque[JobRecord]) -> bool:
+        task = record.task
+        record.attempts += 1
+        record.started = monotonic()
+        record.finished = 0.0
+        record.poll_failures = 0
+        record.next_poll = 0.0
+        try:
+            record.job = self.client.annotate_corpus(
+                task.project,
+                task.annotator,
+                task.annotator_project,
+                email_notification=self.email_notification,
+            )
+            record.status = record.job.status.value
+            record.error = None
+            self._update(record)
+            return True
+        except Exception as e:  # noqa: B902
+            record.error = str(e)
+            self._failed(record, pending)
+            return False
+
+    def _failed(self, record: JobRecord, pending: Deque[JobRecord]):
+        record.finished = monotonic()
+        if record.attempts <= self.max_retries:
+            logger.warning("Retrying %s after failure: %s", record.task, record.error or record.status)
+            REGISTRY.counter("sherpa_corpus_retries_total", "Retried corpus jobs").inc(
+                project=record.task.project
+            )
+            record.status = "RETRYING"
+            record.not_before = monotonic() + self.retry_delay
+            pending.append(record)
+        elif record.job is not None and self.client.is_finished(record.job):
+            record.status = record.job.status.value
+        else:
+            record.status = SherpaJobBeanStatus.FAILED.value
+        self._update(record)
+
+    def _poll(self, record: JobRecord, pending: Deque[JobRecord]) -> bool:
+        """Refresh a running job, return True when it is finished."""
+        job = record.job
+        if job is None:
+            return True
+        try:
+            job = record.job = self.client.get_job(job.project, job.id)
+        except Exception as e:  # noqa: B902
+            return self._poll_failed(record, e, pending)
+        record.poll_failures = 0
+        record.status = job.status.value
+        if not self.client.is_finished(job):
+            self._update(record)
+            return False
+        record.finished = monotonic()
+        if self.client.is_success(job):
+            record.documents = self._documents(record)
+            REGISTRY.histogram("sherpa_corpus_job_seconds", "Corpus annotation job duration").observe(
+                record.seconds, project=record.task.project
+            )
+            self._update(record)
+        else:
+            record.error = job.status_message if isinstance(job.status_message, str) else None
+            self._failed(record, pending)
+        return True
+
+    def _poll_failed(self, record: JobRecord, error: Exception, pending: Deque[JobRecord]) -> bool:
+        """Back off after a polling error, give the job up after too many in a row."""
+        record.poll_failures += 1
+        if record.poll_failures < self.max_poll_failures:
+            delay = min(self.poll_interval * 2 ** record.poll_failures, max(self.poll_interval, self.retry_delay))
+            logger.warning("Could not poll %s, next poll in %.1fs: %s", record.task, delay, error)
+            record.next_poll = monotonic() + delay
+            return False
+        record.error = f"job could not be polled {record.poll_failures} times: {error}"
+        self._failed(record, pending)
+        return True
+
+    def _documents(self, record: JobRecord) -> Optional[int]:
+        """Total documents of the project once the job is done, None when unknown.
+
+        The job has succeeded whatever happens here, an error only loses the count.
+        """
+        try:
+            # the cached project beans predate the job
+            self.client.get_projects.cache_clear()
+            self.client.get_project_by_name.cache_clear()
+            project = self.client.get_project_by_name(record.task.project)
+        except Exception as e:  # noqa: B902
+            logger.warning("Could not count the documents of %s: %s", record.task.project, e)
+            return None
+        documents = getattr(project, "documents", None)
+        return documents if isinstance(documents, int) else None
+
+    def run(self, tasks: Iterable[CorpusTask]) -> CorpusSummary:
+        """Run all tasks to completion, in the batch lane of the client."""
+        with lane(BATCH):
+            return self._run(tasks)
+
+    def _run(self, tasks: Iterable[CorpusTask]) -> CorpusSummary:
+        start = monotonic()
+        records = [JobRecord(CorpusTask(*task)) for task in tasks]
+        pending: Deque[JobRecord] = deque(records)
+        running: List[JobRecord] = []
+        while pending or running:
+            now = monotonic()
+            for _ in range(len(pending)):
+                if len(running) >= self.max_concurrent:
+                    break
+                record = pending.popleft()
+                if record.not_before > now:
+                    pending.append(record)
+                    continue
+                if self._launch(record, pending):
+                    running.append(record)
+            if running or pending:
+                sleep(self.poll_interval)
+            now = monotonic()
+            running = [r for r in running if r.next_poll > now or not self._poll(r, pending)]
+        return CorpusSummary(records, monotonic() - start)
+
+
+def parse_task(spec: str) -> CorpusTask:
+    project, annotator, annotator_project = spec.split(":")
+    return CorpusTask(project, annotator, annotator_project)
+
+
+@plac.pos("server", "Sherpa server URL")
+@plac.pos("user", "User name")
+@plac.pos("password", "Password")
+@plac.pos("tasks", "Tasks as project:annotator:annotator_project")
+@plac.opt("max_concurrent", "Maximum number of jobs running at once", type=int)
+@plac.opt("max_retries", "Retries of a failed job", type=int)
+@plac.opt("poll_interval", "Seconds between job polls", type=float)
+def main(
+    server: str,
+    user: str,
+    password: str,
+    *tasks: str,
+    max_concurrent: int = 4,
+    max_retries: int = 2,
+    poll_interval: float = 10.0,
+):
+    """Re-annotate several project corpora and print a summary."""
+    logging.basicConfig(level=logging.INFO)
+    client = StreamlitSherpaClient(server, user, password)
+    orchestrator = CorpusOrchestrator(
+        client,
+        max_concurrent=max_concurrent,
+        max_retries=max_retries,
+        poll_interval=poll_interval,
+        on_update=lambda r: logger.info("%s %s (attempt %d)", r.task, r.status, r.attempts),
+    )
+    print(orchestrator.run([parse_task(t) for t in tasks]).format())
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,202 @@
+"""Lightweight, lazily materialized views of annotated documents.
+
+Decoding a large annotation response with ``AnnotatedDocument.from_dict``
+builds one attrs object per annotation, category and sentence. The views in
+this module keep the decoded JSON instead and expose spans through
+array-backed sequences; ``sherpa_client`` models are only built on demand::
+
+    docs = documents_from_json(response.content)
+    for a in docs[0].annotations:  # Span tuples, no model construction
+        print(a.start, a.end, a.label_name)
+    docs[0].to_annotated_document()  # full AnnotatedDocument when needed
+"""
+import json
+from array import array
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union, overload
+
+from sherpa_client.models import (
+    AnnotatedDocAnnotation,
+    AnnotatedDocCategory,
+    AnnotatedDocument,
+    DocSentence,
+)
+from sherpa_client.types import Unset
+
+from .intervals import IntervalIndex
+
+try:
+    import orjson
+
+    def loads(content: Union[bytes, str]) -> Any:
+        return orjson.loads(content)
+
+except ImportError:  # pragma: no cover
+
+    def loads(content: Union[bytes, str]) -> Any:
+        return json.loads(content)
+
+
+class Span(NamedTuple):
+    """Plain tuple standing for an annotation, category or sentence."""
+
+    start: Optional[int]
+    end: Optional[int]
+    label_name: Optional[str]
+    label: Optional[str]
+    score: Optional[float]
+
+
+class SpanArray(Sequence[Span]):
+    """Spans of a document backed by the decoded JSON and offset arrays."""
+
+    __slots__ = ("raw", "model", "_starts", "_ends")
+
+    def __init__(self, raw: List[Dict[str, Any]], model: Any):
+        self.raw = raw
+        self.model = model
+        self._starts: Optional[array] = None
+        self._ends: Optional[array] = None
+
+    def _offsets(self) -> Tuple[array, array]:
+        if self._starts is None or self._ends is None:
+            self._starts = array("q", (r.get("start", -1) for r in self.raw))
+            self._ends = array("q", (r.get("end", -1) for r in self.raw))
+        return self._starts, self._ends
+
+    @property
+    def starts(self) -> array:
+        return self._offsets()[0]
+
+    @property
+    def ends(self) -> array:
+        return self._offsets()[1]
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    @overload
+    def __getitem__(self, i: int) -> Span:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> "SpanArray":
+        ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return SpanArray(self.raw[i], self.model)
+        r = self.raw[i]
+        return Span(r.get("start"), r.get("end"), r.get("labelName"), r.get("label"), r.get("score"))
+
+    def __iter__(self) -> Iterator[Span]:
+        for r in self.raw:
+            yield Span(r.get("start"), r.get("end"), r.get("labelName"), r.get("label"), r.get("score"))
+
+    def model_at(self, i: int):
+        """Build the ``sherpa_client`` model of the i-th span."""
+        return self.model.from_dict(self.raw[i])
+
+    def to_models(self) -> list:
+        return [self.model.from_dict(r) for r in self.raw]
+
+
+class AnnotatedDocumentView:
+    """Read-only stand-in for :class:`AnnotatedDocument` over decoded JSON."""
+
+    __slots__ = ("data", "_annotations", "_categories", "_sentences", "_document", "_index", "_search")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self._annotations: Optional[SpanArray] = None
+        self._categories: Optional[SpanArray] = None
+        self._sentences: Optional[SpanArray] = None
+        self._document: Optional[AnnotatedDocument] = None
+        self._index: Optional[IntervalIndex] = None
+        # filled by search.document_index
+        self._search: Any = None
+
+    @classmethod
+    def from_json(cls, content: Union[bytes, str]) -> "AnnotatedDocumentView":
+        return cls(loads(content))
+
+    @property
+    def text(self) -> str:
+        return self.data["text"]
+
+    @property
+    def identifier(self) -> Optional[str]:
+        return self.data.get("identifier")
+
+    @property
+    def title(self) -> Optional[str]:
+        return self.data.get("title")
+
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("metadata")
+
+    @property
+    def annotations(self) -> SpanArray:
+        if self._annotations is None:
+            self._annotations = SpanArray(self.data.get("annotations") or [], AnnotatedDocAnnotation)
+        return self._annotations
+
+    @property
+    def categories(self) -> SpanArray:
+        if self._categories is None:
+            self._categories = SpanArray(self.data.get("categories") or [], AnnotatedDocCategory)
+        return self._categories
+
+    @property
+    def sentences(self) -> SpanArray:
+        if self._sentences is None:
+            self._sentences = SpanArray(self.data.get("sentences") or [], DocSentence)
+        return self._sentences
+
+    @property
+    def index(self) -> IntervalIndex:
+        """Interval index of the annotations."""
+        if self._index is None:
+            annotations = self.annotations
+            self._index = IntervalIndex(annotations.starts, annotations.ends)
+        return self._index
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.data
+
+    def to_annotated_document(self) -> AnnotatedDocument:
+        if self._document is None:
+            self._document = AnnotatedDocument.from_dict(self.data)
+        return self._document
+
+    def __repr__(self):
+        return (
+            f"AnnotatedDocumentView(text={len(self.text)} chars, "
+            f"annotations={len(self.annotations)}, categories={len(self.categories)})"
+        )
+
+
+AnyDocument = Union[AnnotatedDocument, AnnotatedDocumentView]
+
+
+def documents_from_json(content: Union[bytes, str]) -> List[AnnotatedDocumentView]:
+    """Decode a response holding one document or a list of documents."""
+    data = loads(content)
+    if isinstance(data, dict):
+        data = [data]
+    return [AnnotatedDocumentView(d) for d in data]
+
+
+def to_annotated_document(doc: AnyDocument) -> AnnotatedDocument:
+    """Materialize a view, return models unchanged."""
+    if isinstance(doc, AnnotatedDocumentView):
+        return doc.to_annotated_document()
+    return doc
+
+
+def annotation_index(doc: AnyDocument) -> IntervalIndex:
+    """Interval index of the annotations of a document, cached by views."""
+    if isinstance(doc, AnnotatedDocumentView):
+        return doc.index
+    annotations = [] if isinstance(doc.annotations, Unset) else doc.annotations
+    return IntervalIndex([a.start for a in annotations], [a.end for a in annotations])
@@ -0,0 +1,65 @@
+"""Static interval tree over span offsets.
+
+:class:`IntervalIndex` sorts spans by start (longest first on ties) and
+treats the sorted array as an implicit balanced tree where each node keeps
+the largest end of its subtree. Finding the spans that cover an offset or
+overlap a range visits ``O(log n + k)`` nodes for ``k`` results, which are
+returned in document order (start, then longest first)::
+
+    index = IntervalIndex(starts, ends)
+    index.covering(42)          # spans with start <= 42 < end
+    index.overlapping(100, 200)  # spans with start < 200 and end > 100
+"""
+from array import array
+from typing import List, Sequence
+
+
+class IntervalIndex:
+    """Spans given by parallel ``starts`` and ``ends``, queried by position."""
+
+    __slots__ = ("order", "starts", "ends", "max_ends")
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int]):
+        if len(starts) != len(ends):
+            raise ValueError("starts and ends must have the same length")
+        order = sorted(range(len(starts)), key=lambda i: (starts[i], -ends[i]))
+        self.order = array("q", order)
+        self.starts = array("q", (starts[i] for i in order))
+        self.ends = array("q", (ends[i] for i in order))
+        self.max_ends = array("q", self.ends)
+        self._fill_max_ends(0, len(order))
+
+    def _fill_max_ends(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        best = max(self.ends[mid], self._fill_max_ends(lo, mid), self._fill_max_ends(mid + 1, hi))
+        self.max_ends[mid] = best
+        return best
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def overlapping(self, start: int, end: int) -> List[int]:
+        """Indices of the spans overlapping ``[start, end)``, in document order."""
+        found: List[int] = []
+        self._collect(0, len(self.order), start, end, found)
+        return found
+
+    def covering(self, offset: int) -> List[int]:
+        """Indices of the spans containing ``offset``, outermost first."""
+        return self.overlapping(offset, offset + 1)
+
+    def _collect(self, lo: int, hi: int, start: int, end: int, found: List[int]):
+        # in-order walk of the implicit tree, skipping subtrees that end too early
+        # and right subtrees that start too late
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.max_ends[mid] <= start:
+                return
+            self._collect(lo, mid, start, end, found)
+            if self.starts[mid] >= end:
+                return
+            if self.ends[mid] > start and self.ends[mid] > self.starts[mid]:
+                found.append(self.order[mid])
+            lo = mid + 1
@@ -0,0 +1,253 @@
+"""Prometheus-style metrics for the Sherpa client and the visualizer.
+
+Metrics are recorded in an in-process :class:`MetricsRegistry` (``REGISTRY``
+by default). Exporters read the registry: :func:`render_text` produces the
+Prometheus text exposition format and :func:`start_http_server` serves it on
+``/metrics``.
+"""
+import math
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, math.inf
+)
+SIZE_BUCKETS = tuple(float(2 ** i) for i in range(8, 31, 2)) + (math.inf,)
+
+
+class Sample(NamedTuple):
+    name: str
+    labels: LabelSet
+    value: float
+
+
+def _labelset(labels: Dict[str, object]) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str = ""):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        """Current values, one sample per series."""
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str = ""):
+        super().__init__(name, documentation)
+        self.values: Dict[LabelSet, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _labelset(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_labelset(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            return [Sample(self.name, k, v) for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _labelset(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.values: Dict[LabelSet, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labelset(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # one slot per bucket, then count and sum
+                counts = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def count(self, **labels) -> float:
+        counts = self.values.get(_labelset(labels))
+        return counts[-2] if counts else 0.0
+
+    def sum(self, **labels) -> float:
+        counts = self.values.get(_labelset(labels))
+        return counts[-1] if counts else 0.0
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self.lock:
+            for key, counts in self.values.items():
+                for bound, c in zip(self.buckets, counts):
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    samples.append(Sample(f"{self.name}_bucket", key + (("le", le),), c))
+                samples.append(Sample(f"{self.name}_count", key, counts[-2]))
+                samples.append(Sample(f"{self.name}_sum", key, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Thread-safe collection of metrics and of collector callbacks."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[Metric, List[Sample]]]]] = []
+
+    def _get_or_create(self, cls, name, documentation, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str = "") -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(
+        self, name: str, documentation: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[Metric, List[Sample]]]]):
+        """Register a callback computing extra metrics at collection time."""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def collect(self) -> List[Tuple[Metric, List[Sample]]]:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        collected = [(m, m.samples()) for m in metrics]
+        for collector in collectors:
+            collected.extend(collector())
+        return collected
+
+    def snapshot(self) -> Dict[str, float]:
+        """Flatten all samples to ``{"name{labels}": value}``."""
+        return {
+            _format_name(s.name, s.labels): s.value
+            for _, samples in self.collect()
+            for s in samples
+            if not s.name.endswith("_bucket")
+        }
+
+    def clear(self):
+        with self.lock:
+            self.metrics.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _format_name(name: str, labels: LabelSet) -> str:
+    if not labels:
+        return name
+    escaped = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return f"{name}{{{escaped}}}"
+
+
+def render_text(registry: MetricsRegistry = REGISTRY) -> str:
+    """Render the registry in the Prometheus text exposition format."""
+    lines = []
+    for metric, samples in registry.collect():
+        if metric.documentation:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for s in samples:
+            lines.append(f"{_format_name(s.name, s.labels)} {s.value!r}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_text(self.registry).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+def start_http_server(
+    port: int = 9464, addr: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Serve the registry on ``http://addr:port/metrics`` from a daemon thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def timed(metric: str, registry: Optional[MetricsRegistry] = None, **labels):
+    """Decorator observing the duration of each call in a histogram.
+
+    The ``method`` label defaults to the decorated function name.
+    """
+
+    def decorator(func):
+        method_labels = {"method": func.__name__, **labels}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            histogram = (registry or REGISTRY).histogram(metric)
+            with histogram.time(**method_labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,119 @@
+"""Opt-in per-rerun profiling of the visualizer.
+
+A :class:`RerunProfiler` records wall time and memory allocations for named
+phases of a Streamlit rerun and can dump ``cProfile`` statistics and
+``tracemalloc`` snapshots to a directory for offline analysis::
+
+    profiler = RerunProfiler(enabled=True, dump_dir="profiles")
+    with profiler:
+        with profiler.phase("connect"):
+            ...
+    profiler.records  # [PhaseRecord(phase="connect", seconds=..., ...)]
+"""
+import cProfile
+import os
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import List, NamedTuple, Optional, Union
+
+PHASES = (
+    "connect", "projects", "project", "sample", "annotators", "annotator", "annotate", "render"
+)
+
+
+class PhaseRecord(NamedTuple):
+    phase: str
+    seconds: float
+    allocated_bytes: int
+    peak_bytes: int
+
+
+class RerunProfiler:
+    """Collect a time and allocation breakdown of one rerun by phase."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        dump_dir: Union[str, Path, None] = None,
+        trace_allocations: bool = True,
+    ):
+        self.enabled = enabled
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.trace_allocations = trace_allocations
+        self.records: List[PhaseRecord] = []
+        self.total_seconds = 0.0
+        self.dumped: List[Path] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._started_tracing = False
+        self._start = 0.0
+
+    def __enter__(self) -> "RerunProfiler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> "RerunProfiler":
+        if self.enabled:
+            self._start = perf_counter()
+            if self.trace_allocations and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if self.dump_dir is not None:
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+        return self
+
+    def stop(self):
+        if not self.enabled or not self._start:
+            return
+        self.total_seconds = perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+        if self.dump_dir is not None:
+            self.dump()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._start = 0.0
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            allocated = peak = 0
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                allocated = current - before
+                peak = max(peak - before, 0)
+            self.records.append(PhaseRecord(name, seconds, allocated, peak))
+
+    def dump(self) -> List[Path]:
+        """Write the cProfile stats and tracemalloc snapshot of this rerun."""
+        if self.dump_dir is None:
+            return self.dumped
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.dump_dir / f"rerun-{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}"
+        if self._profile is not None:
+            path = stem.with_suffix(".prof")
+            self._profile.dump_stats(str(path))
+            self.dumped.append(path)
+        if tracemalloc.is_tracing():
+            path = stem.with_suffix(".tracemalloc")
+            tracemalloc.take_snapshot().dump(str(path))
+            self.dumped.append(path)
+        return self.dumped
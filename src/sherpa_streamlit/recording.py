@@ -0,0 +1,415 @@
+"""Recording of Sherpa traffic to trace files and their replay without a server.
+
+A :class:`TraceRecorder` given to :class:`~sherpa_streamlit.sherpa.StreamlitSherpaClient`
+(or enabled for the whole process with the ``SHERPA_STREAMLIT_RECORD``
+environment variable set to the trace path) writes every HTTP exchange of the
+client to a gzipped JSON lines file: endpoint, method, path and query, status,
+request and response sizes, latency and the response body. Bodies are stored
+once per distinct content. Authorization headers and cookies are never
+recorded, secret query parameters and JSON fields (passwords, tokens) are
+replaced by ``***``.
+
+A :class:`TraceReplayServer` serves the recorded responses, in order for
+each request, after the recorded latency scaled by ``latency_scale``, so the
+client and the visualizer can be profiled against a real workload offline::
+
+    with TraceReplayServer("session.jsonl.gz", latency_scale=0.5) as server:
+        client = StreamlitSherpaClient(server.url, "user", "password")
+
+or from the command line::
+
+    python -m sherpa_streamlit.recording session.jsonl.gz --port 8008
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import httpx
+import plac
+
+from .spool import file_size, iter_file
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+REDACTED = "***"
+# query parameters and JSON fields whose values are never written to a trace
+SECRET_NAMES = re.compile(r"pass|token|secret|auth|cookie|api_?key", re.IGNORECASE)
+_SECRET_FIELDS = re.compile(
+    rb'("(?:[A-Za-z_]*(?:password|token|secret)|api_?key|authorization)"\s*:\s*)"(?:[^"\\]|\\.)*"',
+    re.IGNORECASE,
+)
+_TEXT_TYPES = ("application/json", "text/", "application/xml", "application/javascript")
+
+RequestKey = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+def request_key(method: str, path: str, query: Iterable[Tuple[str, str]]) -> RequestKey:
+    """Key matching a replayed request to recorded ones, secrets redacted."""
+    return method.upper(), path.rstrip("/"), tuple(sorted(redact_query(query)))
+
+
+def redact_query(query: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return [(k, REDACTED if SECRET_NAMES.search(k) else v) for k, v in query]
+
+
+def redact_body(body: bytes) -> bytes:
+    """Body with the values of secret JSON fields replaced."""
+    return _SECRET_FIELDS.sub(rb'\1"' + REDACTED.encode("ascii") + rb'"', body)
+
+
+def _is_text(content_type: str) -> bool:
+    return content_type.lower().startswith(_TEXT_TYPES)
+
+
+class TraceRecorder:
+    """HTTP exchanges of Sherpa clients written to a gzipped JSON lines file.
+
+    The first line is a header, the following ones are either calls or the
+    bodies (blobs) they reference, each blob written before its first call.
+    With ``record_bodies=False`` or beyond ``max_body_bytes`` only the size of
+    a response body is kept and its replay is empty.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        record_bodies: bool = True,
+        max_body_bytes: Optional[int] = None,
+        flush_every: int = 20,
+    ):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.record_bodies = record_bodies
+        self.max_body_bytes = max_body_bytes
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.calls = 0
+        self._blobs: Set[str] = set()
+        self._start = time.monotonic()
+        self._file: Optional[IO[str]] = gzip.open(self.path, "wt", encoding="utf-8")
+        self._write({"trace": TRACE_VERSION, "started": time.time(), "pid": os.getpid()})
+
+    def _write(self, line: Dict[str, Any]):
+        if self._file is None:
+            raise ValueError(f"Trace {self.path} is closed")
+        self._file.write(json.dumps(line, separators=(",", ":")))
+        self._file.write("\n")
+
+    @staticmethod
+    def _body(response: httpx.Response, sink: Optional[IO[bytes]]) -> bytes:
+        if sink is None:
+            return response.content
+        position = sink.tell()
+        try:
+            return b"".join(iter_file(sink))
+        finally:
+            sink.seek(position)
+
+    def record(
+        self,
+        endpoint: str,
+        request: Dict[str, Any],
+        response: httpx.Response,
+        seconds: float,
+        request_bytes: int,
+        wire_bytes: int,
+        sink: Optional[IO[bytes]] = None,
+    ):
+        """Record one exchange, ``sink`` holding the body of a streamed response."""
+        url = httpx.URL(request["url"], params=request.get("params"))
+        content_type = response.headers.get("Content-Type", "")
+        size = file_size(sink) if sink is not None else len(response.content)
+        body = None
+        if self.record_bodies and (self.max_body_bytes is None or size <= self.max_body_bytes):
+            body = self._body(response, sink)
+        if body is not None and _is_text(content_type):
+            body = redact_body(body)
+        call = {
+            "endpoint": endpoint,
+            "method": request["method"].upper(),
+            "path": url.path,
+            "query": redact_query(url.params.multi_items()),
+            "status": response.status_code,
+            "seconds": round(seconds, 6),
+            "request_bytes": request_bytes,
+            "wire_bytes": wire_bytes,
+            "response_bytes": size,
+            "content_type": content_type,
+            "content_disposition": response.headers.get("Content-Disposition"),
+            "body": hashlib.blake2b(body, digest_size=16).hexdigest() if body is not None else None,
+        }
+        with self.lock:
+            if self._file is None:
+                return
+            call["seq"] = self.calls
+            call["at"] = round(time.monotonic() - self._start, 6)
+            if body is not None and call["body"] not in self._blobs:
+                self._blobs.add(call["body"])
+                self._write(_blob(call["body"], body, content_type))
+            self._write(call)
+            self.calls += 1
+            if self.calls % self.flush_every == 0:
+                self._file.flush()
+
+    def flush(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _blob(digest: str, body: bytes, content_type: str) -> Dict[str, Any]:
+    if _is_text(content_type):
+        try:
+            return {"blob": digest, "encoding": "utf-8", "data": body.decode("utf-8")}
+        except UnicodeDecodeError:
+            pass
+    return {"blob": digest, "encoding": "base64", "data": base64.b64encode(body).decode("ascii")}
+
+
+_ENV_RECORDER: Optional[TraceRecorder] = None
+_ENV_RECORDER_LOCK = threading.Lock()
+
+
+def recorder_from_env() -> Optional[TraceRecorder]:
+    """Recorder shared by the process when ``SHERPA_STREAMLIT_RECORD`` names a trace file.
+
+    ``{pid}`` in the path is replaced by the process id, so several
+    processes never write to the same trace.
+    """
+    global _ENV_RECORDER
+    path = os.environ.get("SHERPA_STREAMLIT_RECORD")
+    if not path:
+        return None
+    with _ENV_RECORDER_LOCK:
+        if _ENV_RECORDER is None:
+            _ENV_RECORDER = TraceRecorder(path.replace("{pid}", str(os.getpid())))
+            atexit.register(_ENV_RECORDER.close)
+            logger.info("Recording Sherpa traffic to %s", _ENV_RECORDER.path)
+        return _ENV_RECORDER
+
+
+class Trace:
+    """Calls of a trace file with their bodies."""
+
+    def __init__(self, header: Dict[str, Any], calls: List[Dict[str, Any]], blobs: Dict[str, bytes]):
+        self.header = header
+        self.calls = calls
+        self.blobs = blobs
+
+    def body(self, call: Dict[str, Any]) -> bytes:
+        digest = call.get("body")
+        return self.blobs.get(digest, b"") if isinstance(digest, str) else b""
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per endpoint: calls, statuses, latency and sizes."""
+        groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for call in self.calls:
+            groups[call["endpoint"]].append(call)
+        rows = []
+        for endpoint, calls in sorted(groups.items()):
+            seconds = [c["seconds"] for c in calls]
+            rows.append(
+                {
+                    "endpoint": endpoint,
+                    "calls": len(calls),
+                    "statuses": dict(Counter(c["status"] for c in calls)),
+                    "seconds": round(sum(seconds), 3),
+                    "mean_seconds": round(sum(seconds) / len(calls), 4),
+                    "max_seconds": round(max(seconds), 4),
+                    "request_bytes": sum(c["request_bytes"] for c in calls),
+                    "response_bytes": sum(c["response_bytes"] for c in calls),
+                }
+            )
+        return rows
+
+
+def load_trace(path: Union[str, Path]) -> Trace:
+    """Read a trace file, up to its last complete line if it was not closed."""
+    header: Dict[str, Any] = {}
+    calls: List[Dict[str, Any]] = []
+    blobs: Dict[str, bytes] = {}
+    with gzip.open(Path(path).expanduser(), "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                item = json.loads(line)
+                if "trace" in item:
+                    header = item
+                elif "blob" in item:
+                    data = item["data"]
+                    blobs[item["blob"]] = (
+                        data.encode("utf-8") if item["encoding"] == "utf-8" else base64.b64decode(data)
+                    )
+                else:
+                    calls.append(item)
+        except EOFError:
+            logger.warning("Trace %s is truncated, replaying its first %d calls", path, len(calls))
+    if header.get("trace", TRACE_VERSION) > TRACE_VERSION:
+        raise ValueError(f"Unsupported trace version {header['trace']} in {path}")
+    return Trace(header, calls, blobs)
+
+
+class TraceReplayServer:
+    """Threaded HTTP server answering Sherpa requests from a trace.
+
+    Each request gets the next recorded response of the same method, path
+    and query, the last one once they are all served. Logins, which are not
+    recorded, are accepted with a dummy token or session cookie. Requests
+    absent from the trace are answered with 404 and counted in ``misses``.
+    """
+
+    def __init__(
+        self, trace: Union[str, Path, Trace], latency_scale: float = 1.0, host: str = "127.0.0.1", port: int = 0
+    ):
+        self.trace = trace if isinstance(trace, Trace) else load_trace(trace)
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.responses: Dict[RequestKey, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.last: Dict[RequestKey, Dict[str, Any]] = {}
+        self.served = 0
+        self.misses: Counter = Counter()
+        for call in self.trace.calls:
+            self.responses[request_key(call["method"], call["path"], call["query"])].append(call)
+        handler = type("ReplayHandler", (_ReplayHandler,), {"replay": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode("ascii")
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "TraceReplayServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def next_call(self, key: RequestKey) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            queue = self.responses.get(key)
+            if queue:
+                self.last[key] = queue.popleft()
+            call = self.last.get(key)
+            if call is not None:
+                self.served += 1
+            return call
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    replay: TraceReplayServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Iterable[Tuple[str, str]] = ()):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _login(self, method: str, path: str) -> bool:
+        if method == "POST" and path.endswith("/auth/login"):
+            body = json.dumps({"access_token": "replay", "username": "replay"}).encode("utf-8")
+            self._send(200, body, "application/json")
+            return True
+        if method == "GET" and path.endswith("/users"):
+            headers = [("Set-Cookie", "vertx-web.session=replay; Path=/")]
+            self._send(200, b"[]", "application/json", headers)
+            return True
+        return False
+
+    def _replay(self, method: str):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlsplit(self.path)
+        path = unquote(url.path).rstrip("/")
+        key = request_key(method, path, parse_qsl(url.query, keep_blank_values=True))
+        call = self.replay.next_call(key)
+        if call is None:
+            if not self._login(method, path):
+                with self.replay.lock:
+                    self.replay.misses[key] += 1
+                body = json.dumps({"error": f"{method} {path} is not in the trace"}).encode("utf-8")
+                self._send(404, body, "application/json")
+            return
+        delay = call["seconds"] * self.replay.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        disposition = call.get("content_disposition")
+        headers = [("Content-Disposition", disposition)] if disposition else []
+        self._send(call["status"], self.replay.trace.body(call), call.get("content_type", ""), headers)
+
+    def do_GET(self):  # noqa: N802
+        self._replay("GET")
+
+    def do_POST(self):  # noqa: N802
+        self._replay("POST")
+
+
+@plac.pos("trace", "Trace file recorded with SHERPA_STREAMLIT_RECORD")
+@plac.flg("summary", "Print the calls per endpoint and exit")
+@plac.opt("port", "Port of the replay server", type=int)
+@plac.opt("latency_scale", "Factor applied to the recorded latencies", type=float)
+def main(trace: str, summary: bool = False, port: int = 8008, latency_scale: float = 1.0):
+    """Summarize a trace or serve it as a Sherpa server."""
+    logging.basicConfig(level=logging.INFO)
+    loaded = load_trace(trace)
+    if summary:
+        for row in loaded.summary():
+            print(json.dumps(row))
+        return
+    server = TraceReplayServer(loaded, latency_scale=latency_scale, port=port)
+    print(f"Replaying {len(loaded.calls)} calls of {trace} on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        if server.misses:
+            print(f"{sum(server.misses.values())} requests were not in the trace")
+
+
+if __name__ == "__main__":
+    plac.call(main)
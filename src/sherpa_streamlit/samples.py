@@ -0,0 +1,144 @@
+"""Pools of sample documents served locally.
+
+A :class:`SamplePool` fetches a batch of sample documents of a project in one
+call, keeps only their identifier, title and text, and hands them out in
+rotation or at random. When fewer than ``low_water`` samples have not been
+served yet, a new batch is fetched in a background thread, so users asking
+for another example never wait for the server::
+
+    pool = sample_pool(client, "project")
+    pool.next().text      # next unseen sample
+    pool.random().text    # any sample of the pool
+"""
+import logging
+import random
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from .metrics import REGISTRY
+from .sherpa import StreamlitSherpaClient
+
+logger = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    identifier: Optional[str]
+    title: Optional[str]
+    text: str
+
+
+class SamplePool:
+    """Sample documents of one project, refilled in the background."""
+
+    def __init__(
+        self,
+        client: StreamlitSherpaClient,
+        project: str,
+        size: int = 20,
+        low_water: int = 5,
+        seed: Optional[int] = None,
+    ):
+        self.client = client
+        self.project = project
+        self.size = size
+        self.low_water = low_water
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.unseen: Deque[Sample] = deque()
+        self.seen: Deque[Sample] = deque(maxlen=size)
+        self.identifiers: Dict[Optional[str], Sample] = {}
+        self._refilling = False
+        # set when a batch brought nothing new, the project has no more samples to offer
+        self.exhausted = False
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.unseen) + len(self.seen)
+
+    def _add(self, docs: List[Dict[str, Any]]) -> int:
+        added = 0
+        with self.lock:
+            for d in docs:
+                sample = Sample(d.get("identifier"), d.get("title"), d.get("text") or "")
+                if sample.identifier is not None and sample.identifier in self.identifiers:
+                    continue
+                if len(self.unseen) >= self.size:
+                    break
+                self.identifiers[sample.identifier] = sample
+                self.unseen.append(sample)
+                added += 1
+        return added
+
+    def fill(self) -> int:
+        """Fetch one batch synchronously, return the number of new samples."""
+        REGISTRY.counter("sherpa_sample_fetches_total", "Sample batches fetched").inc(project=self.project)
+        added = self._add(self.client.get_samples(self.project, self.size))
+        self.exhausted = added == 0
+        return added
+
+    def _refill(self):
+        try:
+            self.fill()
+        except Exception as e:  # noqa: B902
+            logger.warning("Could not refill the samples of %s: %s", self.project, e)
+        finally:
+            with self.lock:
+                self._refilling = False
+
+    def _maybe_refill(self):
+        with self.lock:
+            if self._refilling or self.exhausted or len(self.unseen) >= self.low_water:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name=f"sherpa-samples-{self.project}", daemon=True).start()
+
+    def next(self) -> Optional[Sample]:
+        """The next sample not served yet, or the oldest served one when all were."""
+        with self.lock:
+            empty = not self.unseen and not self.seen
+        if empty:
+            self.fill()
+        with self.lock:
+            if self.unseen:
+                sample = self.unseen.popleft()
+            elif self.seen:
+                sample = self.seen.popleft()
+            else:
+                return None
+            if len(self.seen) == self.seen.maxlen:
+                self.identifiers.pop(self.seen[0].identifier, None)
+            self.seen.append(sample)
+        REGISTRY.counter("sherpa_samples_served_total", "Samples served from pools").inc(project=self.project)
+        self._maybe_refill()
+        return sample
+
+    def random(self) -> Optional[Sample]:
+        """Any sample of the pool, served or not."""
+        with self.lock:
+            samples = list(self.unseen) + list(self.seen)
+        if not samples:
+            return self.next()
+        self._maybe_refill()
+        return self.rng.choice(samples)
+
+
+_POOLS: Dict[Tuple[str, str], SamplePool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def sample_pool(client: StreamlitSherpaClient, project: str, **kwargs) -> SamplePool:
+    """Pool shared by the sessions of a login for a project, created with ``kwargs``.
+
+    Pools are keyed by the login (server, user and password) of ``client``, so
+    users never get samples fetched with the credentials of others, and refill
+    with the client of the last session that asked for them.
+    """
+    key = (client._login_key, project)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = SamplePool(client, project, **kwargs)
+        else:
+            pool.client = client
+        return pool
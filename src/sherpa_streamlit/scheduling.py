@@ -0,0 +1,196 @@
+"""Client-side request scheduling: rate limits, priority lanes, concurrency caps.
+
+Every request sent by :class:`~sherpa_streamlit.sherpa.StreamlitSherpaClient`
+goes through the :class:`RequestScheduler` of its server:
+
+* endpoints are grouped in classes (``metadata``, ``annotate``, ``import``),
+  each optionally limited by a token bucket;
+* requests run in a lane, ``interactive`` (the default) or ``batch``.
+  Interactive requests are always served first and some concurrency slots
+  are reserved for them;
+* the number of requests in flight per server is capped.
+
+Bulk scripts run in the batch lane::
+
+    with lane("batch"):
+        client.annotate_corpus(...)
+
+The lane is a context variable, which executor threads do not inherit: work
+submitted to an executor is wrapped with :func:`in_current_context`.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from itertools import count
+from time import monotonic
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from .metrics import REGISTRY
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+METADATA = "metadata"
+ANNOTATE = "annotate"
+IMPORT = "import"
+
+_IMPORT_ENDPOINTS = {"launch_document_import"}
+
+_lane: ContextVar[Optional[str]] = ContextVar("sherpa_lane", default=None)
+
+T = TypeVar("T")
+
+
+def endpoint_class(endpoint: str) -> str:
+    """Class of a ``sherpa_client`` endpoint module name."""
+    if endpoint in _IMPORT_ENDPOINTS:
+        return IMPORT
+    if endpoint.startswith("annotate"):
+        return ANNOTATE
+    return METADATA
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Run the requests of the current context in the given lane."""
+    if name not in LANES:
+        raise ValueError(f"Unknown lane {name}, expected one of {LANES}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane(default: str = INTERACTIVE) -> str:
+    return _lane.get() or default
+
+
+def in_current_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap ``fn`` to run in a copy of the calling context, lane included.
+
+    Each call gets its own copy, so the wrapper can run in several threads at once.
+    """
+    context = copy_context()
+
+    def run(*args, **kwargs) -> T:
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+class TokenBucket:
+    """Allow ``rate`` requests per second with bursts of up to ``burst``.
+
+    Not thread-safe on its own, the scheduler calls it under its lock.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: Optional[float] = None) -> bool:
+        self._refill(monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        self._refill(monotonic() if now is None else now)
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else 1.0
+
+
+class RequestScheduler:
+    """Admission control of the requests sent to one Sherpa server.
+
+    ``rates`` maps endpoint classes to ``(requests per second, burst)``,
+    missing classes are not rate limited. ``max_concurrent`` caps the number
+    of requests in flight (``None`` for no cap), ``interactive_reserve`` of
+    those slots can only be used by the interactive lane.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[Dict[str, Tuple[float, Optional[float]]]] = None,
+        max_concurrent: Optional[int] = 16,
+        interactive_reserve: int = 2,
+    ):
+        self.buckets = {cls: TokenBucket(rate, burst) for cls, (rate, burst) in (rates or {}).items()}
+        self.max_concurrent = max_concurrent
+        self.interactive_reserve = interactive_reserve
+        self.active = 0
+        self.cond = threading.Condition()
+        # waiting tickets: (lane priority, arrival) -> endpoint class
+        self.waiting: Dict[Tuple[int, int], str] = {}
+        self._arrivals = count()
+
+    def _capacity(self, lane_name: str) -> Optional[int]:
+        if self.max_concurrent is None:
+            return None
+        if lane_name == INTERACTIVE:
+            return self.max_concurrent
+        return max(1, self.max_concurrent - self.interactive_reserve)
+
+    def _is_next(self, ticket: Tuple[int, int], cls: str) -> bool:
+        for other, other_cls in self.waiting.items():
+            if other >= ticket:
+                continue
+            # older or higher priority requests of the same class go first and
+            # waiting interactive requests hold back all batch ones
+            if other_cls == cls or other[0] < ticket[0]:
+                return False
+        return True
+
+    @contextmanager
+    def slot(self, cls: str, lane_name: str = INTERACTIVE) -> Iterator[float]:
+        """Wait for a slot and a token, yield the queueing delay in seconds."""
+        start = monotonic()
+        ticket = (LANES.index(lane_name), next(self._arrivals))
+        capacity = self._capacity(lane_name)
+        bucket = self.buckets.get(cls)
+        with self.cond:
+            self.waiting[ticket] = cls
+            try:
+                while True:
+                    timeout = None
+                    if self._is_next(ticket, cls) and (capacity is None or self.active < capacity):
+                        if bucket is None or bucket.try_take():
+                            break
+                        timeout = bucket.wait_time()
+                    self.cond.wait(timeout)
+            finally:
+                del self.waiting[ticket]
+                # let the next waiter re-check its turn
+                self.cond.notify_all()
+            self.active += 1
+        delay = monotonic() - start
+        REGISTRY.histogram("sherpa_queue_seconds", "Client-side queueing delay").observe(
+            delay, endpoint_class=cls, lane=lane_name
+        )
+        try:
+            yield delay
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+
+_SCHEDULERS: Dict[str, RequestScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(server: str, **kwargs) -> RequestScheduler:
+    """Scheduler shared by all clients of a server, created with ``kwargs``."""
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(server)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[server] = RequestScheduler(**kwargs)
+        return scheduler
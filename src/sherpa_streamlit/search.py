@@ -0,0 +1,119 @@
+"""Search and navigation within one annotated document.
+
+:class:`DocumentIndex` is built once per document. It maps label names and
+normalized surface forms to their spans and keeps an inverted index of the
+words of the text, so that queries do not scan the annotations or the whole
+text::
+
+    index = document_index(doc)
+    index.find("acme corp")              # text matches, at word starts
+    index.label_hits("ORG")              # all spans of a label
+    index.surface_hits("ACME  Corp")     # annotations with that surface form
+    index.next_hit(hits, offset)         # navigation, wrapping around
+"""
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sherpa_client.types import Unset
+
+from .docview import AnnotatedDocumentView, AnyDocument, annotation_index
+
+WORD_RE = re.compile(r"\w+")
+
+
+class Hit(NamedTuple):
+    start: int
+    end: int
+
+
+def normalize(text: str) -> str:
+    """Case-folded text with collapsed whitespace."""
+    return " ".join(text.casefold().split())
+
+
+class DocumentIndex:
+    """Label, surface form and word index of a document."""
+
+    def __init__(self, doc: AnyDocument):
+        text = doc.text
+        # annotation models or spans of a view
+        annotations: Sequence[Any] = [] if isinstance(doc.annotations, Unset) else doc.annotations
+        self.text = text
+        self.labels: Dict[str, List[Hit]] = {}
+        self.surfaces: Dict[str, List[Hit]] = {}
+        for i in annotation_index(doc).order:
+            a = annotations[i]
+            hit = Hit(a.start, a.end)
+            self.labels.setdefault(a.label_name, []).append(hit)
+            self.surfaces.setdefault(normalize(text[a.start : a.end]), []).append(hit)
+        lower = text.lower()
+        # offsets in the lowered text are only valid if lowering kept the length
+        self._lower: Optional[str] = lower if len(lower) == len(text) else None
+        self.words: Dict[str, array] = {}
+        for m in WORD_RE.finditer(self._lower or ""):
+            positions = self.words.get(m.group())
+            if positions is None:
+                positions = self.words[m.group()] = array("q")
+            positions.append(m.start())
+        self._vocabulary = sorted(self.words)
+
+    def label_hits(self, label_name: str) -> List[Hit]:
+        """Spans of a label, in document order."""
+        return self.labels.get(label_name, [])
+
+    def surface_hits(self, surface: str) -> List[Hit]:
+        """Annotations whose normalized text equals the normalized ``surface``."""
+        return self.surfaces.get(normalize(surface), [])
+
+    def find(self, query: str) -> List[Hit]:
+        """Case-insensitive matches of ``query`` starting at the start of a word."""
+        q = query.lower()
+        m = WORD_RE.search(q)
+        if m is None or self._lower is None or len(q) != len(query):
+            return self._scan(query)
+        first = m.group()
+        if m.start() == 0 and m.end() == len(q):
+            # a single, possibly partial, word: every word it prefixes matches
+            lo = bisect_left(self._vocabulary, q)
+            hi = bisect_left(self._vocabulary, q + "\U0010ffff")
+            starts = sorted(p for w in self._vocabulary[lo:hi] for p in self.words[w])
+        else:
+            starts = sorted(
+                p - m.start()
+                for p in self.words.get(first, ())
+                if p >= m.start() and self._lower.startswith(q, p - m.start())
+            )
+        return [Hit(s, s + len(q)) for s in starts]
+
+    def _scan(self, query: str) -> List[Hit]:
+        if not query.strip():
+            return []
+        return [Hit(m.start(), m.end()) for m in re.finditer(re.escape(query), self.text, re.IGNORECASE)]
+
+    @staticmethod
+    def next_hit(hits: Sequence[Hit], offset: int) -> Optional[Hit]:
+        """First hit starting after ``offset``, wrapping around to the first one."""
+        if not hits:
+            return None
+        i = bisect_right(hits, (offset, sys.maxsize))
+        return hits[i % len(hits)]
+
+    @staticmethod
+    def previous_hit(hits: Sequence[Hit], offset: int) -> Optional[Hit]:
+        """Last hit starting before ``offset``, wrapping around to the last one."""
+        if not hits:
+            return None
+        i = bisect_left(hits, (offset, -1))
+        return hits[i - 1]
+
+
+def document_index(doc: AnyDocument) -> DocumentIndex:
+    """Search index of a document, cached by views."""
+    if isinstance(doc, AnnotatedDocumentView):
+        if doc._search is None:
+            doc._search = DocumentIndex(doc)
+        return doc._search
+    return DocumentIndex(doc)
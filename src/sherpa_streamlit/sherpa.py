@@ -1,11 +1,19 @@
+import hashlib
 import json
-from time import sleep
-from typing import Any, Dict, Type, TypeVar, Union
-from typing import Tuple, Sequence, List
+import mimetypes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+from io import BytesIO
+from pathlib import Path
+import threading
+from time import monotonic, sleep, time
+from typing import IO, Any, BinaryIO, Dict, Optional, Type, TypeVar, Union
+from typing import Tuple, Sequence, List, Set, Deque, cast
 
 import attr
+import httpx
 import shortuuid
-from methodtools import lru_cache
 from multipart.multipart import parse_options_header
 from sherpa_client.api.annotate import (
     annotate_format_binary_with_plan_ref,
@@ -23,7 +31,7 @@ from sherpa_client.api.labels import get_labels
 from sherpa_client.api.plans import get_plan
 from sherpa_client.api.projects import get_projects, create_project
 from sherpa_client.api.shares import share_with_group, share_with_user
-from sherpa_client.client import SherpaClient
+from sherpa_client.client import Client, SherpaClient
 from sherpa_client.models import (
     Credentials,
     RequestJwtTokenProjectAccessMode,
@@ -45,10 +53,142 @@ from sherpa_client.models import (
     LaunchDocumentImportSegmentationPolicy, ShareMode,
 )
 from sherpa_client.types import File, Unset, UNSET, Response
-from streamlit.uploaded_file_manager import UploadedFile
+
+from .auth import COOKIE, MEMORY_STORE, TOKEN, StoredLogin, TokenStore, jwt_expiry, login_key
+from .cache import lru_cache, CacheInfo, KeyLocks, LruCache, MB, GLOBAL_BUDGET
+from .chunking import split_text, stitch
+from .compression import CHUNK_SIZE, DEFAULT_THRESHOLD, CompressedBody, accept_encoding, compress_request, \
+    is_compressible, learn_request_encodings, read_response, request_encoding, rewind, write_response
+from .docview import AnnotatedDocumentView, documents_from_json, loads
+from .metrics import REGISTRY, SIZE_BUCKETS, Counter, Gauge, Sample, timed
+from .recording import TraceRecorder, recorder_from_env
+from .spool import DEFAULT_SPOOL_THRESHOLD, file_size, spooled_file
+from .scheduling import INTERACTIVE, RequestScheduler, current_lane, endpoint_class, get_scheduler, \
+    in_current_context
 
 T = TypeVar("T", bound="ExtendedAnnotator")
 
+# Anything upload methods accept: streamlit's UploadedFile, a binary file object,
+# a path or raw bytes
+FileLike = Union[BinaryIO, Path, str, bytes, Any]
+
+METHOD_SECONDS = "sherpa_client_method_seconds"
+SESSION_COOKIE = "vertx-web.session"
+
+
+def upload_file(datafile: FileLike) -> File:
+    """Build a multipart :class:`File` from any supported file-like input.
+
+    File objects are streamed by httpx rather than copied in memory.
+    """
+    if isinstance(datafile, (bytes, bytearray)):
+        return File(payload=BytesIO(datafile), file_name="file", mime_type="application/octet-stream")
+    if isinstance(datafile, (str, Path)):
+        path = Path(datafile)
+        payload: Any = BytesIO(path.read_bytes())
+        name = path.name
+    else:
+        name = os.path.basename(str(getattr(datafile, "name", "file")))
+        if hasattr(datafile, "read"):
+            if hasattr(datafile, "seek"):
+                datafile.seek(0)
+            payload = datafile
+        else:
+            # shares the buffer of the bytes, and lets httpx send it in chunks
+            payload = BytesIO(cast(Any, datafile).getvalue())
+    mime_type = getattr(datafile, "type", None) or mimetypes.guess_type(name)[0]
+    return File(payload=payload, file_name=name, mime_type=mime_type or "application/octet-stream")
+
+
+def file_digest(datafile: FileLike) -> str:
+    """Content digest of an upload, read in chunks and rewound."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(datafile, (bytes, bytearray)):
+        h.update(datafile)
+    elif isinstance(datafile, (str, Path)):
+        with Path(datafile).open("rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+    elif hasattr(datafile, "read"):
+        datafile.seek(0)
+        for chunk in iter(lambda: datafile.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+        datafile.seek(0)
+    else:
+        h.update(cast(Any, datafile).getvalue())
+    return h.hexdigest()
+
+
+def file_bytes(datafile: FileLike) -> bytes:
+    """Content of an upload, file objects are rewound."""
+    if isinstance(datafile, (bytes, bytearray)):
+        return bytes(datafile)
+    if isinstance(datafile, (str, Path)):
+        return Path(datafile).read_bytes()
+    if hasattr(datafile, "read"):
+        datafile.seek(0)
+        data = datafile.read()
+        datafile.seek(0)
+        return data
+    return cast(Any, datafile).getvalue()
+
+
+# Converter outputs as JSON documents, keyed by server, file digest, converter
+# and parameters, shared by the clients of the process
+CONVERSIONS = LruCache(maxsize=32, maxbytes=64 * MB, name="conversions")
+_CONVERTING = KeyLocks()
+
+
+def _payload_size(payload) -> int:
+    if isinstance(payload, CompressedBody):
+        return payload.size
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    # seek rather than getbuffer: exporting a BytesIO buffer forces a copy
+    if hasattr(payload, "seek") and hasattr(payload, "tell"):
+        pos = payload.tell()
+        size = payload.seek(0, 2)
+        payload.seek(pos)
+        return size
+    return 0
+
+
+def _request_size(request: Dict[str, Any]) -> int:
+    size = _payload_size(request.get("content"))
+    for part in (request.get("files") or {}).values():
+        size += _payload_size(part[1] if isinstance(part, tuple) else part)
+    return size
+
+
+_CACHE_METRICS = (
+    Counter("sherpa_cache_hits_total", "Client cache hits"),
+    Counter("sherpa_cache_misses_total", "Client cache misses"),
+    Counter("sherpa_cache_evictions_total", "Client cache evictions"),
+    Gauge("sherpa_cache_bytes", "Estimated size of client caches"),
+)
+
+
+def _cache_metrics():
+    with GLOBAL_BUDGET.lock:
+        caches = list(GLOBAL_BUDGET.caches)
+    totals: Dict[str, List[int]] = {}
+    for cache in caches:
+        info = cache.info()
+        t = totals.setdefault(cache.name, [0, 0, 0, 0])
+        t[0] += info.hits
+        t[1] += info.misses
+        t[2] += info.evictions
+        t[3] += info.bytes
+    return [
+        (metric, [Sample(metric.name, (("cache", n),), float(t[i])) for n, t in totals.items()])
+        for i, metric in enumerate(_CACHE_METRICS)
+    ]
+
+
+REGISTRY.add_collector(_cache_metrics)
+
 
 @attr.s(auto_attribs=True)
 class ExtendedAnnotator:
@@ -158,22 +298,139 @@ class ExtendedAnnotator:
 
 
 class StreamlitSherpaClient:
-    register = {}
+    # current and previous token of each client -> client, see from_token()
+    register: Dict[Optional[str], "StreamlitSherpaClient"] = {}
 
     def __init__(
-            self, server: str, user: str, password: str, use_token=True, **kawargs
+            self, server: str, user: str, password: str, use_token=True,
+            compress_threshold: Optional[int] = DEFAULT_THRESHOLD,
+            compression: Optional[str] = None,
+            lane: str = INTERACTIVE,
+            scheduler: Optional[RequestScheduler] = None,
+            token_store: Optional[TokenStore] = MEMORY_STORE,
+            refresh_margin: float = 300,
+            spool_threshold: int = DEFAULT_SPOOL_THRESHOLD,
+            recorder: Optional[TraceRecorder] = None,
+            **kawargs
     ):
+        """Log in to a Sherpa server.
+
+        Textual request bodies (JSON, text) of at least ``compress_threshold``
+        bytes are compressed with the best encoding the server accepts, once
+        it has advertised them in an ``Accept-Encoding`` response header, or
+        always with the ``compression`` content encoding if given.
+        ``compress_threshold=None`` disables request compression. Multipart
+        uploads are never compressed.
+
+        Requests go through the ``scheduler`` shared by all clients of the
+        server, in the ``lane`` of the client unless a
+        :func:`~sherpa_streamlit.scheduling.lane` context overrides it.
+
+        A valid login found in ``token_store`` (shared by the process by
+        default, ``None`` to always log in) is reused. Tokens are renewed
+        ``refresh_margin`` seconds before they expire and requests answered
+        with 401 are retried once after a full login.
+
+        Formatted outputs are streamed into spooled temporary files that move
+        to disk beyond ``spool_threshold`` bytes.
+
+        HTTP exchanges are written to the trace of ``recorder``, by default
+        the one named by the ``SHERPA_STREAMLIT_RECORD`` environment variable
+        if set (see :mod:`~sherpa_streamlit.recording`).
+        """
         url = server[0:-1] if server.endswith("/") else server
         self.client = SherpaClient(base_url=f"{url}/api", verify_ssl=False, timeout=100)
         self.use_token = use_token
-        if use_token:
+        self.lane = lane
+        self.scheduler = scheduler or get_scheduler(url)
+        self.compress_threshold = compress_threshold
+        self.compression = compression
+        # endpoints that answered 415 to a compressed body
+        self.uncompressed_endpoints: Set[str] = set()
+        self.token_store = token_store
+        self.refresh_margin = refresh_margin
+        self.spool_threshold = spool_threshold
+        self.recorder = recorder if recorder is not None else recorder_from_env()
+        self._credentials = Credentials(email=user, password=password)
+        self._login_key = login_key(url, user, password)
+        self._auth_lock = threading.Lock()
+        self.expires_at: Optional[float] = None
+        # registered tokens, the current one last
+        self._tokens: Deque[Optional[str]] = deque()
+        stored = token_store.get(self._login_key) if token_store is not None else None
+        if (
+                stored is not None
+                and stored.kind == (TOKEN if use_token else COOKIE)
+                and stored.is_valid(refresh_margin)
+        ):
+            self._restore(stored)
+            REGISTRY.counter("sherpa_logins_total", "Sherpa logins").inc(kind="reused")
+        else:
+            self._login()
+
+    def _restore(self, stored: StoredLogin):
+        # None for cookie logins, as in a new SherpaClient
+        self.client.token = cast(str, stored.token)
+        self.client.session_cookies = dict(stored.cookies)
+        self.expires_at = stored.expires_at
+        self._register()
+
+    def _register(self):
+        """Register the current token, dropping the one it replaced before.
+
+        The replaced token stays registered until the next renewal, for the
+        reruns that read it before this one.
+        """
+        token = self.token
+        if self._tokens and self._tokens[-1] == token:
+            return
+        register = StreamlitSherpaClient.register
+        self._tokens.append(token)
+        while len(self._tokens) > 2:
+            stale = self._tokens.popleft()
+            if register.get(stale) is self:
+                del register[stale]
+        register[token] = self
+
+    def _login(self):
+        """Full login, the new token or session is saved in the token store."""
+        if self.use_token:
             self.client.login_with_token(
-                Credentials(email=user, password=password),
+                self._credentials,
                 project_access_mode=RequestJwtTokenProjectAccessMode.READ,
             )
+            stored = StoredLogin(TOKEN, token=self.client.token, expires_at=jwt_expiry(self.client.token))
         else:
-            self.client.login_with_cookie(Credentials(email=user, password=password))
-        StreamlitSherpaClient.register[self.token] = self
+            self.client.login_with_cookie(self._credentials)
+            stored = StoredLogin(COOKIE, cookies=dict(self.client.session_cookies))
+        REGISTRY.counter("sherpa_logins_total", "Sherpa logins").inc(kind="full")
+        if self.token_store is not None:
+            self.token_store.put(self._login_key, stored)
+        self._restore(stored)
+
+    def _relogin(self, stale_token: Optional[str]):
+        """Log in again unless another thread already replaced ``stale_token``."""
+        with self._auth_lock:
+            if self.token == stale_token:
+                if self.token_store is not None:
+                    self.token_store.delete(self._login_key)
+                self._login()
+
+    def _expiring(self) -> bool:
+        return self.expires_at is not None and time() > self.expires_at - self.refresh_margin
+
+    def _authenticated(self, client: SherpaClient) -> SherpaClient:
+        """Renew an expiring token and return ``client`` with the current credentials."""
+        if self._expiring():
+            with self._auth_lock:
+                if self._expiring():
+                    self._login()
+        if client is self.client or (
+                client.token == self.client.token and client.session_cookies == self.client.session_cookies
+        ):
+            return client
+        # copies such as with_timeout() keep the credentials of their creation
+        return attr.evolve(client, token=self.client.token, session_cookies=dict(self.client.session_cookies))
 
     @property
     def token(self):
@@ -181,44 +438,187 @@ class StreamlitSherpaClient:
             return self.client.token
         elif (
                 self.client.session_cookies is not None
-                and "vertx-web.session" in self.client.session_cookies
+                and SESSION_COOKIE in self.client.session_cookies
         ):
-            return self.client.session_cookies["vertx-web.session"]
+            return self.client.session_cookies[SESSION_COOKIE]
         return None
 
     @staticmethod
     def from_token(token: str):
         return StreamlitSherpaClient.register.get(token, None)
 
+    def _caches(self):
+        return [
+            self.get_projects,
+            self.get_project_by_label,
+            self.get_project_by_name,
+            self.get_sample_doc,
+            self.get_annotators,
+            self.get_labels,
+            self.get_annotator_by_label,
+            self._get_plan,
+        ]
+
     def clear_cache(self):
-        self.get_projects.clear_cache()
-        self.get_project_by_label.clear_cache()
-        self.get_project_by_name.clear_cache()
-        self.get_annotators.clear_cache()
-        self.get_labels.clear_cache()
-        self.get_annotator_by_label.clear_cache()
-        self._get_plan.clear_cache()
-
-    def cache_info(self):
-        return {
-            self.get_projects.__qualname__: self.get_projects.cache_info(),
-            self.get_project_by_label.__qualname__: self.get_project_by_label.cache_info(),
-            self.get_project_by_name.__qualname__: self.get_project_by_name.cache_info(),
-            self.get_annotators.__qualname__: self.get_annotators.cache_info(),
-            self.get_labels.__qualname__: self.get_labels.cache_info(),
-            self.get_annotator_by_label.__qualname__: self.get_annotator_by_label.cache_info(),
-            self._get_plan.__qualname__: self._get_plan.cache_info(),
-        }
-
-    @lru_cache()
+        for cached in self._caches():
+            cached.cache_clear()
+
+    def cache_info(self) -> Dict[str, CacheInfo]:
+        infos = {cached.__qualname__: cached.cache_info() for cached in self._caches()}
+        infos["total"] = CacheInfo(
+            hits=sum(i.hits for i in infos.values()),
+            misses=sum(i.misses for i in infos.values()),
+            maxsize=None,
+            currsize=sum(i.currsize for i in infos.values()),
+            evictions=sum(i.evictions for i in infos.values()),
+            bytes=sum(i.bytes for i in infos.values()),
+            maxbytes=None,
+        )
+        return infos
+
+    def _call(
+            self, endpoint, *args, client: Optional[Client] = None, parse: bool = True,
+            sink: Optional[IO[bytes]] = None, **kwargs
+    ) -> Response:
+        """Send the request of a generated ``sherpa_client`` endpoint module.
+
+        Equivalent to ``endpoint.sync_detailed(*args, client=client, **kwargs)``
+        but records latency, status and payload sizes in the metrics registry.
+        With ``parse=False`` the body is not decoded into models and
+        ``parsed`` is ``None``. With a ``sink``, a successful body is streamed
+        into it and ``parsed`` is a :class:`File` of the rewound sink.
+        """
+        # always self.client or a copy of it, such as with_timeout()
+        client = self._authenticated(cast(SherpaClient, client or self.client))
+        name = endpoint.__name__.rsplit(".", 1)[-1]
+        request = endpoint._get_kwargs(*args, client=client, **kwargs)
+        if "json" in request:
+            request["content"] = json.dumps(request.pop("json")).encode("utf-8")
+            request["headers"]["Content-Type"] = "application/json"
+        size = _request_size(request)
+        REGISTRY.histogram(
+            "sherpa_request_bytes", "Request body size", buckets=SIZE_BUCKETS
+        ).observe(size, endpoint=name)
+        request["headers"]["Accept-Encoding"] = accept_encoding()
+        encoding = self._request_encoding(name, request, size)
+        compressed = compress_request(request, encoding) if encoding is not None else None
+        response, wire_bytes = self._exchange(name, client, request, compressed, sink)
+        if response.status_code == 401:
+            # expired or revoked login: log in again and retry once
+            self._relogin(client.token if self.use_token else client.session_cookies.get(SESSION_COOKIE))
+            client = self._authenticated(client)
+            for r in (request, compressed):
+                if r is not None:
+                    r["headers"].update(client.get_headers())
+                    r["cookies"] = client.get_cookies()
+            rewind(request)
+            response, wire_bytes = self._exchange(name, client, request, compressed, sink)
+        if compressed is not None and compressed["content"].size:
+            REGISTRY.histogram(
+                "sherpa_request_wire_bytes", "Compressed request body size", buckets=SIZE_BUCKETS
+            ).observe(compressed["content"].size, endpoint=name, encoding=encoding)
+        spooled = sink if sink is not None and response.is_success else None
+        REGISTRY.counter("sherpa_requests_total", "Sherpa HTTP requests").inc(
+            endpoint=name, status=response.status_code
+        )
+        REGISTRY.histogram(
+            "sherpa_response_bytes", "Response body size", buckets=SIZE_BUCKETS
+        ).observe(file_size(spooled) if spooled is not None else len(response.content), endpoint=name)
+        REGISTRY.histogram(
+            "sherpa_response_wire_bytes", "Response body size on the wire", buckets=SIZE_BUCKETS
+        ).observe(wire_bytes, endpoint=name)
+        if spooled is not None:
+            return Response(
+                status_code=response.status_code,
+                content=b"",
+                headers=response.headers,
+                parsed=File(payload=cast(BinaryIO, spooled)),
+            )
+        if not parse:
+            return Response(
+                status_code=response.status_code,
+                content=response.content,
+                headers=response.headers,
+                parsed=None,
+            )
+        with REGISTRY.histogram(
+            "sherpa_parse_seconds", "Response model decoding time"
+        ).time(endpoint=name):
+            return endpoint._build_response(response=response)
+
+    def _exchange(
+            self, name: str, client: SherpaClient, request: Dict[str, Any], compressed: Optional[Dict[str, Any]],
+            sink: Optional[IO[bytes]] = None,
+    ) -> Tuple[httpx.Response, int]:
+        with self.scheduler.slot(endpoint_class(name), current_lane(self.lane)), REGISTRY.histogram(
+            "sherpa_request_seconds", "Sherpa HTTP request latency"
+        ).time(endpoint=name):
+            if compressed is not None and name not in self.uncompressed_endpoints:
+                response, wire_bytes = self._send_recorded(name, client, compressed, sink)
+                learn_request_encodings(str(self.client.base_url), response)
+                if response.status_code != 415:
+                    return response, wire_bytes
+                # the server does not accept compressed bodies here: resend as is
+                self.uncompressed_endpoints.add(name)
+                rewind(request)
+            response, wire_bytes = self._send_recorded(name, client, request, sink)
+            learn_request_encodings(str(self.client.base_url), response)
+            return response, wire_bytes
+
+    def _request_encoding(self, endpoint: str, request: Dict[str, Any], size: int) -> Optional[str]:
+        if (
+                self.compress_threshold is None
+                or size < self.compress_threshold
+                or endpoint in self.uncompressed_endpoints
+                or not is_compressible(request)
+        ):
+            return None
+        return self.compression or request_encoding(str(self.client.base_url))
+
+    def _send_recorded(
+            self, name: str, client: SherpaClient, request: Dict[str, Any], sink: Optional[IO[bytes]] = None
+    ) -> Tuple[httpx.Response, int]:
+        if self.recorder is None:
+            return self._send(client, request, sink)
+        start = monotonic()
+        response, wire_bytes = self._send(client, request, sink)
+        self.recorder.record(
+            name, request, response, monotonic() - start, _request_size(request), wire_bytes,
+            sink if sink is not None and response.is_success else None,
+        )
+        return response, wire_bytes
+
+    @staticmethod
+    def _send(
+            client: SherpaClient, request: Dict[str, Any], sink: Optional[IO[bytes]] = None
+    ) -> Tuple[httpx.Response, int]:
+        """Send a request, return the decoded response and its size on the wire.
+
+        A successful body is written to ``sink`` if given, the returned
+        response is then empty.
+        """
+        with httpx.stream(verify=client.verify_ssl, **request) as streamed:
+            if sink is None or not streamed.is_success:
+                return read_response(streamed), streamed.num_bytes_downloaded
+            write_response(streamed, sink)
+            sink.seek(0)
+            headers = [
+                (k, v) for k, v in streamed.headers.items() if k.lower() not in ("content-encoding", "content-length")
+            ]
+            empty = httpx.Response(streamed.status_code, headers=headers, request=streamed.request)
+            return empty, streamed.num_bytes_downloaded
+
+    @lru_cache(maxsize=8, maxbytes=16 * MB)
+    @timed(METHOD_SECONDS)
     def get_projects(self) -> List[ProjectBean]:
-        r = get_projects.sync_detailed(client=self.client)
+        r = self._call(get_projects, client=self.client)
         if r.is_success:
             return r.parsed
         else:
             r.raise_for_status()
 
-    @lru_cache()
+    @lru_cache(maxbytes=4 * MB)
+    @timed(METHOD_SECONDS)
     def get_project_by_label(self, label: str) -> ProjectBean:
         projects = self.get_projects()
         for p in projects:
@@ -226,7 +626,8 @@ class StreamlitSherpaClient:
                 return p
         return None
 
-    @lru_cache()
+    @lru_cache(maxbytes=4 * MB)
+    @timed(METHOD_SECONDS)
     def get_project_by_name(self, name: str) -> ProjectBean:
         projects = self.get_projects()
         for p in projects:
@@ -234,11 +635,13 @@ class StreamlitSherpaClient:
                 return p
         return None
 
-    @lru_cache()
+    @lru_cache(maxsize=32, maxbytes=32 * MB)
+    @timed(METHOD_SECONDS)
     def get_sample_doc(self, project: Union[str, ProjectBean]) -> Document:
         pname = project.name if isinstance(project, ProjectBean) else project
         doc = None
-        r = export_documents_sample.sync_detailed(
+        r = self._call(
+            export_documents_sample,
             pname, sample_size=1, client=self.client
         )
         if r.is_success:
@@ -247,7 +650,20 @@ class StreamlitSherpaClient:
             r.raise_for_status()
         return doc
 
-    @lru_cache()
+    @timed(METHOD_SECONDS)
+    def get_samples(self, project: Union[str, ProjectBean], size: int) -> List[Dict[str, Any]]:
+        """Fetch up to ``size`` random documents of a project as decoded JSON, uncached."""
+        pname = project.name if isinstance(project, ProjectBean) else project
+        r = self._call(
+            export_documents_sample,
+            pname, sample_size=size, client=self.client, parse=False
+        )
+        if not r.is_success:
+            r.raise_for_status()
+        return loads(r.content)
+
+    @lru_cache(maxsize=64, maxbytes=64 * MB)
+    @timed(METHOD_SECONDS)
     def get_annotators(
             self,
             project: Union[str, ProjectBean],
@@ -256,7 +672,7 @@ class StreamlitSherpaClient:
     ) -> List[ExtendedAnnotator]:
         pname = project.name if isinstance(project, ProjectBean) else project
         # st.write("get_annotators(", project, ", ", annotator_types,", ", favorite_only, ")")
-        r = get_annotators_by_type.sync_detailed(pname, client=self.client)
+        r = self._call(get_annotators_by_type, pname, client=self.client)
         annotators: List[ExtendedAnnotator] = []
         if r.is_success:
             json_response: AnnotatorMultimap = r.parsed
@@ -295,10 +711,11 @@ class StreamlitSherpaClient:
             r.raise_for_status()
         return annotators
 
-    @lru_cache()
+    @lru_cache(maxsize=64, maxbytes=16 * MB)
+    @timed(METHOD_SECONDS)
     def get_labels(self, project: Union[str, ProjectBean]) -> Dict[str, Label]:
         pname = project.name if isinstance(project, ProjectBean) else project
-        r = get_labels.sync_detailed(pname, client=self.client)
+        r = self._call(get_labels, pname, client=self.client)
         labels = {}
         if r.is_success:
             json_response = r.parsed
@@ -306,7 +723,8 @@ class StreamlitSherpaClient:
                 labels[lab.name] = lab
         return labels
 
-    @lru_cache()
+    @lru_cache(maxbytes=16 * MB)
+    @timed(METHOD_SECONDS)
     def get_annotator_by_label(
             self,
             project: Union[str, ProjectBean],
@@ -321,40 +739,76 @@ class StreamlitSherpaClient:
                 return ann
         return None
 
-    @lru_cache()
+    @lru_cache(maxsize=256, maxbytes=32 * MB)
+    @timed(METHOD_SECONDS)
     def _get_plan(
             self, project: Union[str, ProjectBean], name: str
     ) -> NamedAnnotationPlan:
         pname = project.name if isinstance(project, ProjectBean) else project
-        r = get_plan.sync_detailed(pname, name, client=self.client)
+        r = self._call(get_plan, pname, name, client=self.client)
         if r.is_success:
             return r.parsed
         else:
             r.raise_for_status()
 
+    @timed(METHOD_SECONDS)
     def annotate_text(
             self,
             project: Union[str, ProjectBean],
             annotator: Union[str, ExtendedAnnotator],
             text: str,
-    ) -> AnnotatedDocument:
+            raw: bool = False,
+    ) -> Union[AnnotatedDocument, AnnotatedDocumentView]:
+        """Annotate a text, as a lazy :class:`AnnotatedDocumentView` if ``raw``."""
         pname = project.name if isinstance(project, ProjectBean) else project
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
         long_client = self.client.with_timeout(1000)
-        r = annotate_text_with.sync_detailed(
-            pname, aname, text_body=text, client=long_client
+        r = self._call(
+            annotate_text_with,
+            pname, aname, text_body=text, client=long_client, parse=not raw
         )
         # r = annotate_documents_with.sync_detailed(pname, aname,
         #                                           json_body=[InputDocument(text=text)],
         #                                           client=self.client)
         if r.is_success:
-            doc = r.parsed
+            doc = AnnotatedDocumentView.from_json(r.content) if raw else r.parsed
         else:
             r.raise_for_status()
         return doc
 
+    @timed(METHOD_SECONDS)
+    def annotate_long_text(
+            self,
+            project: Union[str, ProjectBean],
+            annotator: Union[str, ExtendedAnnotator],
+            text: str,
+            max_chars: int = 20000,
+            overlap: int = 500,
+            max_workers: int = 4,
+            raw: bool = False,
+    ) -> Union[AnnotatedDocument, AnnotatedDocumentView]:
+        """Annotate a long text as overlapping chunks sent concurrently.
+
+        Texts of at most ``max_chars`` characters are sent as is, see
+        :mod:`~sherpa_streamlit.chunking` for how chunks are split and stitched.
+        """
+        if len(text) <= max_chars:
+            return self.annotate_text(project, annotator, text, raw=raw)
+        chunks = split_text(text, max_chars, overlap)
+        with ThreadPoolExecutor(min(max_workers, len(chunks))) as pool:
+            results = list(
+                pool.map(
+                    in_current_context(
+                        lambda c: self.annotate_text(project, annotator, text[c.start:c.end], raw=True).data
+                    ),
+                    chunks,
+                )
+            )
+        doc = AnnotatedDocumentView(stitch(text, chunks, results))
+        return doc if raw else doc.to_annotated_document()
+
     @staticmethod
     def _file_from_response(r: Response):
         file: File = r.parsed
@@ -368,6 +822,7 @@ class StreamlitSherpaClient:
                 file.file_name = content_parameters[b"filename"].decode("utf-8")
         return file
 
+    @timed(METHOD_SECONDS)
     def annotate_format_text(
             self,
             project: Union[str, ProjectBean],
@@ -379,8 +834,10 @@ class StreamlitSherpaClient:
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
         long_client = self.client.with_timeout(1000)
-        r = annotate_format_text_with_plan_ref.sync_detailed(
-            pname, aname, text_body=text, client=long_client
+        r = self._call(
+            annotate_format_text_with_plan_ref,
+            pname, aname, text_body=text, client=long_client,
+            sink=spooled_file(self.spool_threshold)
         )
         # r = annotate_format_documents_with_plan_ref.sync_detailed(pname, aname,
         #                                                           json_body=[InputDocument(text=text)],
@@ -390,65 +847,122 @@ class StreamlitSherpaClient:
         else:
             r.raise_for_status()
 
+    @timed(METHOD_SECONDS)
     def annotate_binary(
             self,
             project: Union[str, ProjectBean],
             annotator: Union[str, ExtendedAnnotator],
-            datafile: UploadedFile,
-    ) -> List[AnnotatedDocument]:
+            datafile: FileLike,
+            raw: bool = False,
+            reuse_conversion: bool = False,
+    ) -> Union[List[AnnotatedDocument], List[AnnotatedDocumentView]]:
+        """Annotate a binary file with a plan.
+
+        If ``reuse_conversion`` and the plan has a converter, the file is
+        converted once with :meth:`convert_cached` and the converted documents
+        are annotated instead, so other plans using the same converter on the
+        same file do not upload and convert it again. This costs an extra
+        request for a file annotated only once, so it is meant for comparisons
+        and batches.
+        """
         pname = project.name if isinstance(project, ProjectBean) else project
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
+        converter = self._plan_converter(pname, aname) if reuse_conversion else None
+        if converter is not None:
+            documents = self.convert_cached(*converter, datafile)
+            return self.annotate_documents(pname, aname, documents, raw=raw)
         files = AnnotateFormatBinaryWithPlanRefMultipartData(
-            file=File(
-                file_name=datafile.name,
-                payload=datafile.getvalue(),
-                mime_type=datafile.type,
-            )
+            file=upload_file(datafile)
         )
         long_client = self.client.with_timeout(1000)
-        r = annotate_binary_with_plan_ref.sync_detailed(
-            pname, aname, multipart_data=files, client=long_client
+        r = self._call(
+            annotate_binary_with_plan_ref,
+            pname, aname, multipart_data=files, client=long_client, parse=not raw
         )
         if r.is_success:
-            docs = r.parsed
+            docs = documents_from_json(r.content) if raw else r.parsed
         else:
             r.raise_for_status()
         return docs
 
+    @timed(METHOD_SECONDS)
     def annotate_format_binary(
             self,
             project: Union[str, ProjectBean],
             annotator: Union[str, ExtendedAnnotator],
-            datafile: UploadedFile,
+            datafile: FileLike,
+            reuse_conversion: bool = False,
     ) -> File:
+        """Annotate and format a binary file with a plan, see :meth:`annotate_binary`."""
         pname = project.name if isinstance(project, ProjectBean) else project
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
+        converter = self._plan_converter(pname, aname) if reuse_conversion else None
+        if converter is not None:
+            documents = self.convert_cached(*converter, datafile)
+            return self.annotate_format_documents(pname, aname, documents)
         files = AnnotateFormatBinaryWithPlanRefMultipartData(
-            file=File(
-                file_name=datafile.name,
-                payload=datafile.getvalue(),
-                mime_type=datafile.type,
-            )
+            file=upload_file(datafile)
         )
         long_client = self.client.with_timeout(1000)
-        r = annotate_format_binary_with_plan_ref.sync_detailed(
-            pname, aname, multipart_data=files, client=long_client
+        r = self._call(
+            annotate_format_binary_with_plan_ref,
+            pname, aname, multipart_data=files, client=long_client,
+            sink=spooled_file(self.spool_threshold)
         )
         if r.is_success:
             return self._file_from_response(r)
         else:
             r.raise_for_status()
 
+    def _plan_converter(self, project: str, plan_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Name and parameters of the converter of a plan, if any."""
+        plan = self._get_plan(project, plan_name)
+        if plan is None or isinstance(plan.parameters, Unset):
+            return None
+        converter = plan.parameters.converter
+        if isinstance(converter, Unset) or converter is None or not converter.name:
+            return None
+        parameters = converter.parameters
+        return converter.name, parameters.to_dict() if hasattr(parameters, "to_dict") else dict(parameters or {})
+
+    @timed(METHOD_SECONDS)
+    def convert_cached(
+            self,
+            converter: str,
+            parameters: Dict[str, Any],
+            datafile: FileLike,
+            digest: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Converted documents of a file as JSON, converted at most once per process."""
+        key = (
+            self.client.base_url,
+            digest or file_digest(datafile),
+            converter,
+            json.dumps(parameters, sort_keys=True, default=str),
+        )
+        # concurrent requests for the same conversion wait for the first one
+        with _CONVERTING.hold(key):
+            documents = CONVERSIONS.get(key)
+            REGISTRY.counter("sherpa_conversions_total", "Binary conversions").inc(
+                converter=converter, cached=documents is not None
+            )
+            if documents is None:
+                documents = [d.to_dict() for d in self.convert_binary(converter, parameters, datafile, raw=True)]
+                CONVERSIONS.put(key, documents)
+        return documents
+
+    @timed(METHOD_SECONDS)
     def convert_binary(
             self,
             converter: str,
             parameters: dict,
-            datafile: UploadedFile,
-    ) -> List[AnnotatedDocument]:
+            datafile: FileLike,
+            raw: bool = False,
+    ) -> Union[List[AnnotatedDocument], List[AnnotatedDocumentView]]:
 
         plan = ConvertAnnotationPlan.from_dict({
             "converter": {
@@ -459,27 +973,22 @@ class StreamlitSherpaClient:
             ]
         })
         files = AnnotateBinaryForm(
-            file=File(
-                file_name=datafile.name,
-                payload=datafile.getvalue(),
-                mime_type=datafile.type,
-            ),
+            file=upload_file(datafile),
             plan=plan
         )
         long_client = self.client.with_timeout(1000)
-        r = annotate_binary.sync_detailed(
-            multipart_data=files, client=long_client
+        r = self._call(
+            annotate_binary,
+            multipart_data=files, client=long_client, parse=not raw
         )
-        if r.is_success:
-            docs = r.parsed
-        else:
+        if not r.is_success:
             r.raise_for_status()
-        return docs
+        return documents_from_json(r.content) if raw else cast(List[AnnotatedDocument], r.parsed)
 
     @staticmethod
-    def documents_from_file(datafile: UploadedFile):
-        jsondata = json.load(datafile)
-        documents = jsondata if isinstance(jsondata, Sequence) else [jsondata]
+    def documents_from_file(datafile: FileLike) -> List[Dict[str, Any]]:
+        jsondata = json.loads(file_bytes(datafile))
+        documents = jsondata if isinstance(jsondata, list) else [jsondata]
         # for document in documents:
         #     for kd in list(document.keys()):
         #         if kd not in ["identifier", 'title', 'text', 'metadata', 'sentences', 'categories', 'annotations']:
@@ -501,51 +1010,72 @@ class StreamlitSherpaClient:
         #                     del ann[ka]
         return documents
 
+    @timed(METHOD_SECONDS)
     def annotate_json(
             self,
             project: Union[str, ProjectBean],
             annotator: Union[str, ExtendedAnnotator],
-            datafile: UploadedFile,
-    ) -> List[AnnotatedDocument]:
+            datafile: FileLike,
+            raw: bool = False,
+    ) -> Union[List[AnnotatedDocument], List[AnnotatedDocumentView]]:
+        return self.annotate_documents(project, annotator, self.documents_from_file(datafile), raw=raw)
+
+    @timed(METHOD_SECONDS)
+    def annotate_documents(
+            self,
+            project: Union[str, ProjectBean],
+            annotator: Union[str, ExtendedAnnotator],
+            documents: Sequence[Dict[str, Any]],
+            raw: bool = False,
+    ) -> Union[List[AnnotatedDocument], List[AnnotatedDocumentView]]:
         pname = project.name if isinstance(project, ProjectBean) else project
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
-        documents = [
-            InputDocument.from_dict(doc) for doc in self.documents_from_file(datafile)
-        ]
+        inputs = [InputDocument.from_dict(doc) for doc in documents]
         long_client = self.client.with_timeout(1000)
-        r = annotate_documents_with.sync_detailed(
-            pname, aname, json_body=documents, client=long_client
+        r = self._call(
+            annotate_documents_with,
+            pname, aname, json_body=inputs, client=long_client, parse=not raw
         )
         if r.is_success:
-            docs = r.parsed
+            docs = documents_from_json(r.content) if raw else r.parsed
         else:
             r.raise_for_status()
         return docs
 
+    @timed(METHOD_SECONDS)
     def annotate_format_json(
             self,
             project: Union[str, ProjectBean],
             annotator: Union[str, ExtendedAnnotator],
-            datafile: UploadedFile,
+            datafile: FileLike,
+    ) -> File:
+        return self.annotate_format_documents(project, annotator, self.documents_from_file(datafile))
+
+    @timed(METHOD_SECONDS)
+    def annotate_format_documents(
+            self,
+            project: Union[str, ProjectBean],
+            annotator: Union[str, ExtendedAnnotator],
+            documents: Sequence[Dict[str, Any]],
     ) -> File:
         pname = project.name if isinstance(project, ProjectBean) else project
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
-        documents = [
-            InputDocument.from_dict(doc) for doc in self.documents_from_file(datafile)
-        ]
+        inputs = [InputDocument.from_dict(doc) for doc in documents]
         long_client = self.client.with_timeout(1000)
-        r = annotate_format_documents_with_plan_ref.sync_detailed(
-            pname, aname, json_body=documents, client=long_client
+        r = self._call(
+            annotate_format_documents_with_plan_ref,
+            pname, aname, json_body=inputs, client=long_client,
+            sink=spooled_file(self.spool_threshold)
         )
-        if r.is_success:
-            return self._file_from_response(r)
-        else:
+        if not r.is_success:
             r.raise_for_status()
+        return self._file_from_response(r)
 
+    @timed(METHOD_SECONDS)
     def create_project(
             self,
             label: str,
@@ -555,7 +1085,8 @@ class StreamlitSherpaClient:
     ):
         shortuuid.set_alphabet("123456789abcdefghijkmnopqrstuvwxyz_")
         pname = f"{prefix}_" + shortuuid.uuid()[: (16 - len(prefix))]
-        r = create_project.sync_detailed(
+        r = self._call(
+            create_project,
             client=self.client,
             json_body=ProjectConfigCreation(
                 name=pname, label=label, description=description, nature=nature
@@ -571,6 +1102,7 @@ class StreamlitSherpaClient:
         else:
             r.raise_for_status()
 
+    @timed(METHOD_SECONDS)
     def share_project(
             self,
             project: Union[str, ProjectBean],
@@ -579,14 +1111,16 @@ class StreamlitSherpaClient:
     ):
         pname = project.name if isinstance(project, ProjectBean) else project
         if group:
-            r = share_with_group.sync_detailed(
+            r = self._call(
+                share_with_group,
                 pname,
                 client=self.client,
                 json_body=ShareMode(read=True, write=True),
                 group_name=group
             )
         elif user:
-            r = share_with_user.sync_detailed(
+            r = self._call(
+                share_with_user,
                 pname,
                 client=self.client,
                 json_body=ShareMode(read=True, write=True),
@@ -597,19 +1131,17 @@ class StreamlitSherpaClient:
         if not r.is_success:
             r.raise_for_status()
 
-    def import_documents(self, project, datafile: UploadedFile,
+    @timed(METHOD_SECONDS)
+    def import_documents(self, project, datafile: FileLike,
                          ignore_labelling=False,
                          segmentation_policy="compute_if_missing",
                          split_corpus=False,
                          wait_for_completion: bool = False):
         multipart_data = LaunchDocumentImportMultipartData(
-            file=File(
-                file_name=datafile.name,
-                payload=datafile.getvalue(),
-                mime_type=datafile.type,
-            )
+            file=upload_file(datafile)
         )
-        r = launch_document_import.sync_detailed(
+        r = self._call(
+            launch_document_import,
             project, client=self.client, multipart_data=multipart_data,
             ignore_labelling=ignore_labelling,
             segmentation_policy=LaunchDocumentImportSegmentationPolicy(segmentation_policy),
@@ -623,6 +1155,7 @@ class StreamlitSherpaClient:
         else:
             r.raise_for_status()
 
+    @timed(METHOD_SECONDS)
     def annotate_corpus(
             self,
             project: Union[str, ProjectBean],
@@ -640,7 +1173,8 @@ class StreamlitSherpaClient:
         aname = (
             annotator.name if isinstance(annotator, ExtendedAnnotator) else annotator
         )
-        r = annotate_corpus_with.sync_detailed(
+        r = self._call(
+            annotate_corpus_with,
             pname, aname, client=self.client, annotator_project=apname, email_notification=email_notification
         )
         if r.is_success:
@@ -655,17 +1189,28 @@ class StreamlitSherpaClient:
     def is_success(job_bean):
         return job_bean and job_bean.status == SherpaJobBeanStatus.COMPLETED
 
-    def wait_for_completion(self, job_bean: SherpaJobBean):
+    @staticmethod
+    def is_finished(job_bean):
+        return job_bean and job_bean.status in [
+            SherpaJobBeanStatus.COMPLETED,
+            SherpaJobBeanStatus.CANCELLED,
+            SherpaJobBeanStatus.FAILED,
+        ]
+
+    @timed(METHOD_SECONDS)
+    def get_job(self, project: Union[str, ProjectBean], job_id: str) -> SherpaJobBean:
+        pname = project.name if isinstance(project, ProjectBean) else project
+        r = self._call(get_job, pname, job_id)
+        if not r.is_success:
+            r.raise_for_status()
+        return cast(SherpaJobBean, r.parsed)
+
+    @timed(METHOD_SECONDS)
+    def wait_for_completion(self, job_bean: SherpaJobBean, poll_interval: float = 10):
         if job_bean:
-            while job_bean.status not in [
-                SherpaJobBeanStatus.COMPLETED,
-                SherpaJobBeanStatus.CANCELLED,
-                SherpaJobBeanStatus.FAILED,
-            ]:
-                sleep(10)
-                job_bean = get_job.sync(
-                    job_bean.project, job_bean.id, client=self.client
-                )
+            while not self.is_finished(job_bean):
+                sleep(poll_interval)
+                job_bean = self.get_job(job_bean.project, job_bean.id)
         return job_bean
 
 # def main():
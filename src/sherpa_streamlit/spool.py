@@ -0,0 +1,95 @@
+"""Formatter outputs spooled to temporary files.
+
+Formatted results (CSV, XLSX, ZIP exports) are streamed from the response
+into a :class:`~tempfile.SpooledTemporaryFile`: small outputs stay in memory,
+outputs above the threshold are moved to an anonymous file on disk, which is
+deleted when it is closed. Each Streamlit session tracks the outputs it shows
+in a :class:`SpoolRegistry` that closes the oldest ones and all of them when
+the session ends::
+
+    spools = session_spools()
+    spools.track(formatted.payload)
+"""
+import tempfile
+import threading
+import weakref
+from typing import IO, Iterator, List
+
+from .cache import MB
+from .compression import CHUNK_SIZE
+
+DEFAULT_SPOOL_THRESHOLD = 8 * MB
+
+
+def spooled_file(threshold: int = DEFAULT_SPOOL_THRESHOLD) -> IO[bytes]:
+    """Binary file kept in memory until it grows past ``threshold`` bytes."""
+    return tempfile.SpooledTemporaryFile(max_size=threshold, mode="w+b", prefix="sherpa-")
+
+
+def is_on_disk(f: IO) -> bool:
+    """Whether a spooled file was moved to disk."""
+    return bool(getattr(f, "_rolled", False))
+
+
+def file_size(f: IO) -> int:
+    """Size of a seekable file, leaving its position unchanged."""
+    position = f.tell()
+    try:
+        return f.seek(0, 2)
+    finally:
+        f.seek(position)
+
+
+def iter_file(f: IO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Chunks of a file from its start."""
+    f.seek(0)
+    return iter(lambda: f.read(chunk_size), b"")
+
+
+def read_all(f: IO) -> bytes:
+    """Whole content of a file, from its start."""
+    f.seek(0)
+    return f.read()
+
+
+def _close_all(files: List[IO]):
+    for f in files:
+        f.close()
+    files.clear()
+
+
+class SpoolRegistry:
+    """Spooled outputs of one session, the oldest closed beyond ``max_files``."""
+
+    def __init__(self, max_files: int = 20):
+        self.max_files = max_files
+        self.files: List[IO] = []
+        self.lock = threading.Lock()
+        # close the files when the session state holding the registry is dropped
+        self._finalizer = weakref.finalize(self, _close_all, self.files)
+
+    def track(self, f: IO) -> IO:
+        if not hasattr(f, "close"):
+            return f
+        with self.lock:
+            if not any(t is f for t in self.files):
+                self.files.append(f)
+            while len(self.files) > self.max_files:
+                self.files.pop(0).close()
+        return f
+
+    def close(self):
+        with self.lock:
+            _close_all(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+
+def session_spools(key: str = "sherpa_spools") -> SpoolRegistry:
+    """The spooled outputs of the current Streamlit session."""
+    import streamlit as st
+
+    if key not in st.session_state:
+        st.session_state[key] = SpoolRegistry()
+    return st.session_state[key]
@@ -0,0 +1,131 @@
+"""Parsing and caching of the tabular outputs of formatters.
+
+CSV is parsed with the multithreaded ``pyarrow`` reader when it is installed
+(``pip install sherpa-streamlit[arrow]``) and kept as an Arrow table: only the rows of the displayed page are converted
+to pandas. XLSX sheets are parsed one at a time, on demand. Parsed tables are
+kept in a byte-bounded in-process cache keyed by the digest of the payload, so
+reruns showing the same result do not parse it again. Payloads may be bytes or
+seekable binary files, such as spooled formatter outputs, which are parsed
+from the file without reading them into memory first.
+"""
+import hashlib
+import weakref
+from io import BytesIO
+from typing import IO, Any, List, Optional, Union
+
+import pandas as pd
+
+from .cache import MB, LruCache
+from .compression import CHUNK_SIZE
+
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+CSV_MIME = "text/csv"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+TABLE_MIME_TYPES = (CSV_MIME, XLSX_MIME)
+
+Table = Union[pd.DataFrame, "pyarrow.Table"]
+Payload = Union[bytes, IO[bytes]]
+
+TABLES = LruCache(maxsize=32, maxbytes=128 * MB, name="tables")
+# digests of payload files, so reruns do not read them again
+_DIGESTS: "weakref.WeakKeyDictionary[IO[bytes], str]" = weakref.WeakKeyDictionary()
+
+
+def payload_bytes(payload: Union[bytes, Any]) -> bytes:
+    """Bytes of a :class:`File` payload, which may be bytes or a file object."""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, bytearray):
+        return bytes(payload)
+    if hasattr(payload, "getvalue"):
+        return payload.getvalue()
+    payload.seek(0)
+    return payload.read()
+
+
+def payload_digest(data: Payload) -> str:
+    """Digest of a payload, files are read in chunks once."""
+    if isinstance(data, (bytes, bytearray)):
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    digest = _DIGESTS.get(data)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        f = payload_file(data)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+        digest = _DIGESTS[data] = h.hexdigest()
+    return digest
+
+
+def payload_file(data: Payload) -> IO[bytes]:
+    """A binary file of a payload positioned at its start."""
+    if isinstance(data, (bytes, bytearray)):
+        return BytesIO(data)
+    data.seek(0)
+    return data
+
+
+def read_csv(data: Payload) -> Table:
+    if pyarrow is not None:
+        if isinstance(data, (bytes, bytearray)):
+            return pyarrow.csv.read_csv(pyarrow.BufferReader(data))
+        return pyarrow.csv.read_csv(payload_file(data))
+    return pd.read_csv(payload_file(data))
+
+
+def read_sheet(data: Payload, sheet: Union[str, int] = 0) -> pd.DataFrame:
+    return pd.read_excel(payload_file(data), sheet_name=sheet, engine="openpyxl")
+
+
+def sheet_names(data: Payload, digest: Optional[str] = None) -> List[str]:
+    """Sheet names of a workbook, without parsing any sheet."""
+    from openpyxl import load_workbook
+
+    key = (digest or payload_digest(data), "sheets")
+    names = TABLES.get(key)
+    if names is None:
+        workbook = load_workbook(payload_file(data), read_only=True)
+        try:
+            names = list(workbook.sheetnames)
+        finally:
+            workbook.close()
+        TABLES.put(key, names)
+    return names
+
+
+def load_table(
+    data: Payload,
+    mime_type: str,
+    sheet: Union[str, int, None] = None,
+    digest: Optional[str] = None,
+) -> Table:
+    """Parse a CSV payload or one sheet of an XLSX payload, with caching."""
+    key = (digest or payload_digest(data), sheet)
+    table = TABLES.get(key)
+    if table is None:
+        if mime_type == CSV_MIME:
+            table = read_csv(data)
+        elif mime_type == XLSX_MIME:
+            table = read_sheet(data, 0 if sheet is None else sheet)
+        else:
+            raise ValueError(f"Unsupported table format {mime_type}")
+        TABLES.put(key, table, size=table_size(table))
+    return table
+
+
+def table_size(table: Table) -> int:
+    if isinstance(table, pd.DataFrame):
+        return int(table.memory_usage(deep=True).sum())
+    return table.nbytes
+
+
+def table_rows(table: Table, start: int, stop: int) -> pd.DataFrame:
+    """Rows ``start:stop`` of a table as a DataFrame."""
+    if isinstance(table, pd.DataFrame):
+        return table.iloc[start:stop]
+    return table.slice(start, stop - start).to_pandas()
@@ -1,14 +1,20 @@
 import html
+import json
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple, List, Optional
+from string import Template
+from typing import Dict, NamedTuple, Tuple, List, Optional, Sequence
 
 import streamlit as st
-from PIL import Image
 from annotated_text import annotation
 from annotated_text.util import span, rem, div, em, px
 from bs4 import BeautifulSoup
 from htbuilder import styles, HtmlElement
-from sherpa_client.models import Document, ProjectBean
+from sherpa_client.models import Document, Label, ProjectBean
+
+from .cache import MB, shared_cache
+from .metrics import REGISTRY
 
 
 def ProjectBean_hash(self):
@@ -35,72 +41,63 @@ HASH_FUNCS = {
 }
 
 
+# Metadata is cached for the process and shared by all sessions as frozen,
+# read-only objects: hits return the cached object without copying it
+METADATA_TTL = 24 * 3600
+
+
+def _memo_miss(function: str):
+    REGISTRY.counter(
+        "sherpa_memo_misses_total", "Metadata cache misses"
+    ).inc(function=function)
+
+
 def get_client(token: str):
     from sherpa_streamlit.sherpa import StreamlitSherpaClient
 
     return StreamlitSherpaClient.from_token(token)
 
 
-@st.experimental_memo(suppress_st_warning=True, show_spinner=False, ttl=24 * 3600)
-def get_cached_projects(token: str, debug: bool = False) -> List[ProjectBean]:
-    if debug:
-        st.write("Cache miss: get_cached_projects(", token, ") ran")
+@st.experimental_singleton(show_spinner=False)
+def get_authenticated_client(server: str, user: str, password: str, use_token: bool = True):
+    """Log in once per process and credentials, then reuse the client across reruns."""
+    from sherpa_streamlit.sherpa import StreamlitSherpaClient
+
+    return StreamlitSherpaClient(server, user, password, use_token=use_token)
+
+
+@shared_cache(ttl=METADATA_TTL, maxbytes=32 * MB)
+def get_cached_projects(token: str) -> List[ProjectBean]:
+    _memo_miss("get_cached_projects")
     return get_client(token).get_projects()
 
 
-@st.experimental_memo(suppress_st_warning=True, show_spinner=False, ttl=24 * 3600)
-def get_cached_sample_doc(token: str, project: str, debug: bool = False) -> Document:
-    if debug:
-        st.write("Cache miss: get_cached_sample_doc(", token, ",", project, ") ran")
+@shared_cache(ttl=METADATA_TTL, maxbytes=32 * MB)
+def get_cached_sample_doc(token: str, project: str) -> Document:
+    _memo_miss("get_cached_sample_doc")
     return get_client(token).get_sample_doc(project)
 
 
-@st.experimental_memo(suppress_st_warning=True, show_spinner=False, ttl=24 * 3600)
+@shared_cache(ttl=METADATA_TTL, maxbytes=32 * MB)
 def get_cached_annotators(
     token: str,
     project: str,
     annotator_types: Tuple[str] = None,
     favorite_only: bool = False,
-    debug: bool = False,
 ):
-    if debug:
-        st.write(
-            "Cache miss: get_cached_annotators(",
-            token,
-            ",",
-            project,
-            ",",
-            annotator_types,
-            ",",
-            favorite_only,
-            ") ran",
-        )
+    _memo_miss("get_cached_annotators")
     return get_client(token).get_annotators(project, annotator_types, favorite_only)
 
 
-@st.experimental_memo(suppress_st_warning=True, show_spinner=False, ttl=24 * 3600)
+@shared_cache(ttl=METADATA_TTL, maxbytes=32 * MB)
 def get_cached_annotator_by_label(
     token: str,
     project: str,
     label: str,
     annotator_types: Tuple[str] = None,
     favorite_only: bool = False,
-    debug: bool = False,
 ):
-    if debug:
-        st.write(
-            "Cache miss: get_cached_annotator_by_label(",
-            token,
-            ",",
-            project,
-            ",",
-            label,
-            ",",
-            annotator_types,
-            ",",
-            favorite_only,
-            ") ran",
-        )
+    _memo_miss("get_cached_annotator_by_label")
     annotators = get_cached_annotators(token, project, annotator_types, favorite_only)
     for ann in annotators:
         if ann.label == label:
@@ -108,12 +105,11 @@ def get_cached_annotator_by_label(
     return None
 
 
-@st.experimental_memo(suppress_st_warning=True, show_spinner=False, ttl=24 * 3600)
+@shared_cache(ttl=METADATA_TTL, maxbytes=32 * MB)
 def get_cached_project_by_label(
-    token: str, label: str, debug: bool = False
+    token: str, label: str
 ) -> Optional[ProjectBean]:
-    if debug:
-        st.write("Cache miss: get_cached_project_by_label(", token, ",", label, ") ran")
+    _memo_miss("get_cached_project_by_label")
     projects = get_cached_projects(token)
     for p in projects:
         if p.label == label:
@@ -121,8 +117,10 @@ def get_cached_project_by_label(
     return None
 
 
-@st.experimental_memo(suppress_st_warning=True)
+@st.experimental_singleton(show_spinner=False)
 def get_logo():
+    from PIL import Image
+
     srcdir = Path(__file__).parent
     image = Image.open(srcdir / "kairntech-1000-Blockmark.png")
     return image
@@ -266,4 +264,133 @@ def clean_html(html: str):
     return soup.get_text()
 
 
-LOGO = get_logo()
+def clean_text(text: str) -> str:
+    """:func:`clean_html` for text fragments, skipping the parser when there is no markup."""
+    if "<" in text or "&" in text:
+        return clean_html(text)
+    return text
+
+
+# Shared by all annotations, the label classes only set the border colour
+ANNOTATED_TEXT_CSS = (
+    ".sa-doc{line-height:1.75rem;letter-spacing:0;white-space:pre-wrap;overflow-x:auto;"
+    "border:1px solid #e6e9ef;border-radius:0.25rem;padding:1rem;margin-bottom:2.5rem}"
+    ".sa-doc mark{background:none;border-style:solid;border-color:#333;border-radius:0.33rem;color:#333;"
+    "padding:0 0.67rem;white-space:normal}"
+    ".sa-doc mark mark{padding:0 0.2rem}"
+)
+# Tooltips are set on hover from the classes of the hovered annotation and of
+# the annotations around it, instead of a title on every span
+TOOLTIP_JS = Template(
+    'var T=$tooltips;document.addEventListener("mouseover",function(e){var t=e.target,n,l=[];'
+    'if(t.tagName!="MARK"||t.title)return;for(n=t;n.tagName=="MARK";n=n.parentNode)'
+    'l.unshift(n.dataset.l||T[n.className]||"");t.title=l.join(" > ")});'
+)
+_CSS_UNSAFE_RE = re.compile(r"[^#\w\s(),.%-]")
+
+
+def _script_json(value) -> str:
+    return json.dumps(value).replace("</", "<\\/")
+
+
+class LabelStyles(NamedTuple):
+    """CSS classes and tooltips of the labels of an annotator."""
+
+    classes: Dict[str, str]
+    titles: Dict[str, str]
+    header: str
+
+    def open_tag(self, label_name: str, title: str) -> str:
+        """Compact opening tag of an annotation, labels without colour get the default border."""
+        cls = self.classes.get(label_name)
+        if cls is None:
+            return f'<mark data-l="{html.escape(title)}">'
+        if title != self.titles[label_name]:
+            return f'<mark class={cls} data-l="{html.escape(title)}">'
+        return f"<mark class={cls}>"
+
+    def wrap(self, body: str) -> str:
+        """Embed already escaped markup with the stylesheet and tooltip script."""
+        return f'{self.header}<div class="sa-doc">{body}</div>'
+
+
+@lru_cache(maxsize=64)
+def _label_styles(labels: Tuple[Tuple[str, str, str], ...]) -> LabelStyles:
+    classes, titles, tooltips = {}, {}, {}
+    rules = [ANNOTATED_TEXT_CSS]
+    for i, (name, color, title) in enumerate(labels):
+        cls = f"l{i}"
+        classes[name] = cls
+        titles[name] = tooltips[cls] = clean_html(title)
+        rules.append(f".sa-doc .{cls}{{border-color:{_CSS_UNSAFE_RE.sub('', color)}}}")
+    script = TOOLTIP_JS.substitute(tooltips=_script_json(tooltips))
+    return LabelStyles(classes, titles, f"<style>{''.join(rules)}</style><script>{script}</script>")
+
+
+def label_styles(labels: Optional[Dict[str, Label]]) -> LabelStyles:
+    """Stylesheet with one class per coloured label, cached by label set."""
+    return _label_styles(
+        tuple(
+            sorted(
+                (name, label.color, label.label or name)
+                for name, label in (labels or {}).items()
+                if getattr(label, "color", None)
+            )
+        )
+    )
+
+
+# Search hits are highlighted with the CSS Custom Highlight API, over ranges of
+# the rendered text, so the annotation markup is left untouched. The document
+# frame only listens for the ranges, posted by a separate small frame: searching
+# re-renders that frame and leaves the document as it is
+HIGHLIGHT_CSS = "::highlight(sa-hit){background-color:#fff59d}::highlight(sa-current){background-color:#ffb74d}"
+HIGHLIGHT_LISTENER_JS = Template(
+    "(function(K){var d=document.querySelector('.sa-doc'),N=null;if(!d)return;"
+    "function nodes(){if(!N){var w=document.createTreeWalker(d,NodeFilter.SHOW_TEXT),p=0,n;N=[];"
+    "while(n=w.nextNode()){N.push([n,p]);p+=n.length}}return N}"
+    "function at(o){var lo=0,hi=N.length-1;while(lo<hi){var m=(lo+hi+1)>>1;if(N[m][1]<=o)lo=m;else hi=m-1}"
+    "return[N[lo][0],Math.min(o-N[lo][1],N[lo][0].length)]}"
+    "function range(h){var r=document.createRange(),s=at(h[0]),e=at(h[1]);r.setStart(s[0],s[1]);"
+    "r.setEnd(e[0],e[1]);return r}"
+    "function show(H,C){if(!nodes().length)return;var R=H.map(range),c=C>=0?R[C]:null;"
+    "if(window.CSS&&CSS.highlights){CSS.highlights.delete('sa-hit');CSS.highlights.delete('sa-current');"
+    "if(R.length)CSS.highlights.set('sa-hit',new Highlight(...R));if(c)CSS.highlights.set('sa-current',new Highlight(c))}"
+    "if(c)window.scrollTo(0,c.getBoundingClientRect().top+window.scrollY-100)}"
+    "window.addEventListener('message',function(e){var m=e.data;"
+    "if(m&&m.type==='sa-highlight'&&m.key===K)show(m.hits,m.current)});"
+    "for(var i=0;i<parent.frames.length;i++)parent.frames[i].postMessage({type:'sa-ready',key:K},'*')})($key);"
+)
+HIGHLIGHT_POST_JS = Template(
+    "(function(M){function post(){for(var i=0;i<parent.frames.length;i++)parent.frames[i].postMessage(M,'*')}"
+    "window.addEventListener('message',function(e){var m=e.data;"
+    "if(m&&m.type==='sa-ready'&&m.key===M.key)post()});post()})($message);"
+)
+
+
+def highlight_listener_html(key: str) -> str:
+    """Stylesheet and script of a document frame applying the hits posted for ``key``."""
+    return f"<style>{HIGHLIGHT_CSS}</style><script>{HIGHLIGHT_LISTENER_JS.substitute(key=_script_json(key))}</script>"
+
+
+def highlight_html(
+    hits: Sequence[Tuple[int, int]], current: Optional[int] = None, offset: int = 0, *, key: str
+) -> str:
+    """Frame posting hits, of markup rendered from ``offset``, to the document of ``key``.
+
+    The document scrolls to the ``current`` hit, no hits clear the highlights.
+    """
+    message = {
+        "type": "sa-highlight",
+        "key": key,
+        "hits": [[start - offset, end - offset] for start, end in hits],
+        "current": -1 if current is None else current,
+    }
+    return f"<script>{HIGHLIGHT_POST_JS.substitute(message=_script_json(message))}</script>"
+
+
+def __getattr__(name: str):
+    # The logo used to be loaded at import time, keep LOGO available lazily
+    if name == "LOGO":
+        return get_logo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,22 +1,40 @@
-from typing import List, Optional, Iterable, cast
+import html
+import json
+import math
+from collections import Counter
+import time
+from io import BytesIO
+from typing import IO, Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Iterable, Sequence, Tuple, cast
 
 import pandas as pd
 import plac
 import streamlit as st
 import streamlit.components.v1 as components
 from annotated_text import annotation
-from collections_extended import RangeMap
-from sherpa_client.models import AnnotatedDocument
-from sherpa_client.types import UNSET, File
+from sherpa_client.models import AnnotationPlan, Label, ProjectBean
+from sherpa_client.types import File, Unset
 from streamlit.uploaded_file_manager import UploadedFile
 
+from .background import Task, TaskQueue, session_tasks
+from .batch import Batch, BatchItem, Entry
+from .compare import agreement, annotate_many, overlap_matrix, pairwise_f1
+from .docview import AnyDocument, annotation_index
+from .metrics import REGISTRY, MetricsRegistry, timed
+from .profiling import RerunProfiler
+from .samples import Sample, sample_pool
+from .search import document_index, normalize
 from .sherpa import StreamlitSherpaClient, ExtendedAnnotator
+from .spool import file_size, is_on_disk, read_all, session_spools
+from .tables import TABLE_MIME_TYPES, XLSX_MIME, load_table, payload_digest, sheet_names, \
+    table_rows
 
 # fmt: off
-from .util import LOGO, annotated_text, clean_html, clean_annotation, get_cached_projects, \
-    get_cached_sample_doc, get_cached_annotators, get_cached_annotator_by_label, get_cached_project_by_label, get_client
+from .util import get_logo, annotated_text, clean_html, clean_text, get_cached_projects, \
+    get_cached_annotators, get_cached_annotator_by_label, get_cached_project_by_label, get_client, \
+    get_authenticated_client, highlight_html, highlight_listener_html, label_styles
 
 # fmt: on
+VISUALIZER_SECONDS = "sherpa_visualizer_seconds"
 FOOTER = """<span style="font-size: 0.75em">&hearts; Built with [Streamlit](https://streamlit.io/) and [`sherpa-streamlit`](https://github.com/oterrier/sherpa_streamlit)</span>"""
 
 
@@ -34,16 +52,42 @@ def visualize(  # noqa: C901
     show_json: bool = False,
     project_selector_title: str = "Select project",
     annotator_selector_title: str = "Select annotator",
+    compare: bool = False,
+    compare_selector_title: str = "Compare with",
     sidebar_title: Optional[str] = None,
     sidebar_description: Optional[str] = None,
     page_title: Optional[str] = None,
     page_description: Optional[str] = None,
     show_logo: bool = True,
     debug: bool = False,
+    background: bool = False,
+    poll_interval: float = 0.5,
+    profile: bool = False,
+    profile_dir: Optional[str] = None,
     color: Optional[str] = "#09A3D5",
+    multi_file: bool = False,
+    batch_workers: int = 4,
     key: Optional[str] = None,
 ) -> None:
-    """Embed the full visualizer with selected components."""
+    """Embed the full visualizer with selected components.
+
+    With ``profile=True`` the time and allocations of each phase of the rerun are
+    shown in the sidebar; ``profile_dir`` additionally dumps cProfile and
+    tracemalloc snapshots of every rerun to that directory.
+
+    With ``compare=True`` other annotators can be selected in the sidebar: texts
+    and JSON documents are then annotated by all of them concurrently and the
+    results are shown side by side with their agreement.
+
+    With ``background=True`` annotations run in a shared executor: the page
+    stays interactive, more documents can be queued and finished results are
+    listed and rendered, the page refreshing every ``poll_interval`` seconds
+    while some are pending.
+
+    With ``multi_file=True`` several files can be uploaded at once: they are
+    annotated ``batch_workers`` at a time, with the progress of each file, a
+    summary of all results and a zip bundle of the outputs.
+    """
     try:
         st.set_page_config(
             layout="wide",
@@ -59,11 +103,15 @@ def visualize(  # noqa: C901
     if st.config.get_option("theme.primaryColor") != color:
         st.config.set_option("theme.primaryColor", color)
 
-        # Necessary to apply theming
+        # Necessary to apply theming. The option is process-wide so this only
+        # happens for the first session, before any login or metadata call.
         st.experimental_rerun()
 
+    profiler = RerunProfiler(enabled=profile or profile_dir is not None, dump_dir=profile_dir)
+    profiler.start()
+
     if show_logo:
-        st.sidebar.image(LOGO, use_column_width="always")
+        st.sidebar.image(get_logo(), use_column_width="always")
     if sidebar_title:
         st.sidebar.title(sidebar_title)
     if sidebar_description:
@@ -71,42 +119,45 @@ def visualize(  # noqa: C901
     # Forms can be declared using the 'with' syntax
 
     try:
-        if show_connection:
-            with st.sidebar.form(key="connect_form"):
-                url_input = st.text_input(
-                    label="Sherpa URL", value="https://sherpa-sandbox.kairntech.com/"
+        with profiler.phase("connect"):
+            if show_connection:
+                with st.sidebar.form(key="connect_form"):
+                    url_input = st.text_input(
+                        label="Sherpa URL", value="https://sherpa-sandbox.kairntech.com/"
+                    )
+                    name_input = st.text_input(label="Name", value="")
+                    pwd_input = st.text_input(label="Password", value="", type="password")
+                    submit_button = st.form_submit_button(label="Connect")
+                    if submit_button:
+                        st.session_state["token"] = get_authenticated_client(
+                            url_input,
+                            name_input,
+                            pwd_input,
+                            use_token=authenticate_with_token,
+                        ).token
+            else:
+                url_input = st.secrets.sherpa_credentials.get(
+                    "url", "https://sherpa-sandbox.kairntech.com/"
                 )
-                name_input = st.text_input(label="Name", value="")
-                pwd_input = st.text_input(label="Password", value="", type="password")
-                submit_button = st.form_submit_button(label="Connect")
-                if submit_button:
-                    st.session_state["token"] = StreamlitSherpaClient(
-                        url_input,
-                        name_input,
-                        pwd_input,
-                        use_token=authenticate_with_token,
-                    ).token
-        else:
-            url_input = st.secrets.sherpa_credentials.get(
-                "url", "https://sherpa-sandbox.kairntech.com/"
-            )
-            name_input = st.secrets.sherpa_credentials.username
-            pwd_input = st.secrets.sherpa_credentials.password
-            st.session_state["token"] = StreamlitSherpaClient(
-                url_input, name_input, pwd_input, use_token=authenticate_with_token
-            ).token
+                name_input = st.secrets.sherpa_credentials.username
+                pwd_input = st.secrets.sherpa_credentials.password
+                st.session_state["token"] = get_authenticated_client(
+                    url_input, name_input, pwd_input, use_token=authenticate_with_token
+                ).token
     except BaseException as e:
         st.exception(e)
 
     annotator = None
+    tasks = session_tasks()
+    compared: List[ExtendedAnnotator] = []
     project = None
     sample = None
+    batch: Optional[Batch] = st.session_state.get("sherpa_batch")
     try:
         token = st.session_state.get("token", None)
         if token is not None:
-            if debug:
-                st.write("Calling get_cached_projects(", token, ")")
-            all_projects = get_cached_projects(token, debug=debug)
+            with profiler.phase("projects"):
+                all_projects = get_cached_projects(token)
             selected_projects = sorted(
                 [
                     p.label
@@ -122,55 +173,27 @@ def visualize(  # noqa: C901
                         project_selector_title, selected_projects, key="project"
                     )
                 if st.session_state.get("project", None) is not None:
-                    if debug:
-                        st.write(
-                            "Calling get_cached_project_by_label(",
-                            token,
-                            ",",
-                            st.session_state.project,
-                            ")",
+                    with profiler.phase("project"):
+                        project = get_cached_project_by_label(
+                            token, st.session_state.project
                         )
-                    project = get_cached_project_by_label(
-                        token, st.session_state.project, debug=debug
-                    )
                     if project:
                         if sample_doc and project is not None:
-                            if debug:
-                                st.write(
-                                    "Calling get_cached_sample_doc(",
+                            with profiler.phase("sample"):
+                                sample = session_sample(get_client(token), project.name)
+                        with profiler.phase("annotators"):
+                            all_annotators = (
+                                get_cached_annotators(
                                     token,
-                                    ",",
                                     project.name,
-                                    ")",
+                                    tuple(annotator_types)
+                                    if annotator_types is not None
+                                    else None,
+                                    favorite_only,
                                 )
-                            sample = get_cached_sample_doc(token, project.name, debug=debug)
-                        if debug:
-                            st.write(
-                                "Calling get_cached_annotators(",
-                                token,
-                                ",",
-                                project.name,
-                                ",",
-                                tuple(annotator_types)
-                                if annotator_types is not None
-                                else None,
-                                ",",
-                                favorite_only,
-                                ")",
+                                if project is not None
+                                else []
                             )
-                        all_annotators = (
-                            get_cached_annotators(
-                                token,
-                                project.name,
-                                tuple(annotator_types)
-                                if annotator_types is not None
-                                else None,
-                                favorite_only,
-                                debug=debug,
-                            )
-                            if project is not None
-                            else []
-                        )
                         selected_annotators = sorted(
                             [
                                 p.label
@@ -182,32 +205,38 @@ def visualize(  # noqa: C901
                             annotator_selector_title, selected_annotators, key="annotator"
                         )
                         if st.session_state.get("annotator", None) is not None:
-                            if debug:
-                                st.write(
-                                    "Calling get_cached_annotator_by_label(",
+                            with profiler.phase("annotator"):
+                                annotator = get_cached_annotator_by_label(
                                     token,
-                                    ",",
                                     project.name,
-                                    ",",
                                     st.session_state.annotator,
-                                    ",",
                                     tuple(annotator_types)
                                     if annotator_types is not None
                                     else None,
-                                    ",",
                                     favorite_only,
-                                    ")",
                                 )
-                            annotator = get_cached_annotator_by_label(
-                                token,
-                                project.name,
-                                st.session_state.annotator,
-                                tuple(annotator_types)
-                                if annotator_types is not None
-                                else None,
-                                favorite_only,
-                                debug=debug,
-                            )
+                            if compare:
+                                st.sidebar.multiselect(
+                                    compare_selector_title,
+                                    [
+                                        label
+                                        for label in selected_annotators
+                                        if label != st.session_state.annotator
+                                    ],
+                                    key="compare_annotators",
+                                )
+                                compared = [
+                                    get_cached_annotator_by_label(
+                                        token,
+                                        project.name,
+                                        label,
+                                        tuple(annotator_types)
+                                        if annotator_types is not None
+                                        else None,
+                                        favorite_only,
+                                    )
+                                    for label in st.session_state.get("compare_annotators", [])
+                                ]
 
             if show_project or show_annotator:
                 (
@@ -231,10 +260,10 @@ def visualize(  # noqa: C901
                     st.markdown(page_description)
 
                 client = get_client(token)
-                doc: AnnotatedDocument = None
                 text: str = None
                 uploaded_file: UploadedFile = None
-                formatted: File = None
+                result: Optional[AnnotationResult] = None
+                result_context = {}
                 (
                     col1,
                     col2,
@@ -242,25 +271,18 @@ def visualize(  # noqa: C901
                 converter = (
                     annotator.parameters.converter if annotator.type == "plan" else None
                 )
-                formatter = (
-                    annotator.parameters.formatter if annotator.type == "plan" else None
-                )
                 if converter:
                     file_msg = f"Upload binary file ({converter.name}) to analyze"
                     text_msg = "Or input text to analyze"
                     with col1:
                         with st.form("File1"):
-                            st.file_uploader(
-                                file_msg,
-                                key="file_to_analyze",
-                                accept_multiple_files=False,
-                            )
+                            file_uploader(file_msg, "file_to_analyze", multi_file)
                             submittedf1 = st.form_submit_button("Process File")
                             if submittedf1:
                                 uploaded_file = st.session_state.get(
                                     "file_to_analyze", None
                                 )
-                                if uploaded_file is not None:
+                                if isinstance(uploaded_file, UploadedFile):
                                     if uploaded_file.type.startswith("audio"):
                                         st.audio(
                                             uploaded_file.getvalue(),
@@ -301,168 +323,677 @@ def visualize(  # noqa: C901
                                 text = st.session_state.get("text_to_analyze", None)
                     with col2:
                         with st.form("File2"):
-                            st.file_uploader(
-                                file_msg,
-                                key="file_to_analyze",
-                                accept_multiple_files=False,
-                            )
+                            file_uploader(file_msg, "file_to_analyze", multi_file)
                             submittedf2 = st.form_submit_button("Process File")
                             if submittedf2:
                                 uploaded_file = st.session_state.get(
                                     "file_to_analyze", None
                                 )
 
-                if uploaded_file is not None:
-                    uploaded_file = cast(UploadedFile, uploaded_file)
-                    if converter:
-                        if formatter:
-                            formatted = client.annotate_format_binary(
-                                project, annotator, uploaded_file
+                with profiler.phase("annotate"):
+                    work = None
+                    if isinstance(uploaded_file, list):
+                        if uploaded_file:
+                            if batch is not None:
+                                batch.close()
+                            batch = st.session_state["sherpa_batch"] = start_batch(
+                                client, project, annotator, compared, uploaded_file, workers=batch_workers
                             )
+                        uploaded_file = None
+                    elif uploaded_file is not None:
+                        uploaded_file = cast(UploadedFile, uploaded_file)
+                        source = uploaded_file.name
+                        if converter or "json" in uploaded_file.type:
+                            work = upload_work(client, project, annotator, compared, uploaded_file)
                         else:
-                            docs = client.annotate_binary(
-                                project, annotator, uploaded_file
+                            text = uploaded_file.getvalue().decode("utf-8")
+                    if text is not None:
+                        if uploaded_file is None:
+                            source = text[:40] + ("..." if len(text) > 40 else "")
+                        work = annotation_work(client, project, annotator, compared, text=text)
+                    if work is not None:
+                        context = dict(annotator=annotator, compared=compared)
+                        if background:
+                            tasks.submit(
+                                work, description=f"{annotator.label}: {source}", context=context
                             )
-                            doc = docs[0] if docs is not None else None
-                    else:
-                        if "json" in uploaded_file.type:
-                            if formatter:
-                                formatted = client.annotate_format_json(
-                                    project, annotator, uploaded_file
-                                )
-                            else:
-                                docs = client.annotate_json(
-                                    project, annotator, uploaded_file
-                                )
-                                doc = docs[0] if docs is not None else None
                         else:
-                            text = uploaded_file.getvalue().decode("utf-8")
-                if text is not None:
-                    if formatter:
-                        formatted = client.annotate_format_text(
-                            project, annotator, text
-                        )
-                    else:
-                        doc = client.annotate_text(project, annotator, text)
-
-                if doc is not None:
-                    (
-                        col1,
-                        col2,
-                    ) = st.columns(2)
-                    with col1:
-                        st.success("Annotation successful!")
-                    if show_json:
-                        with col2:
-                            doc_exp = st.expander("Annotated doc (json)")
-                            doc_exp.json(doc.to_dict())
-                    visualize_annotated_doc(doc, annotator)
-                if formatted is not None:
-                    (
-                        col1,
-                        col2,
-                    ) = st.columns(2)
-                    with col1:
-                        st.success("Annotation & formatting successful!")
-                    with col2:
-                        st.download_button(
-                            label="Download result",
-                            data=formatted.payload,
-                            file_name=formatted.file_name,
-                            mime=formatted.mime_type,
-                        )
-                    if formatted.mime_type in [
-                        "text/csv",
-                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    ]:
-                        visualize_table(formatted, annotator)
+                            result, result_context = work(), context
+
+                if background:
+                    task = visualize_tasks(tasks)
+                    if task is not None:
+                        result, result_context = task.future.result(), task.context
+                if batch is not None:
+                    item = visualize_batch(batch)
+                    if item is not None:
+                        result, result_context = item.result, batch.context
+                if result is not None:
+                    with profiler.phase("render"):
+                        visualize_result(result, show_json=show_json, **result_context)
     except BaseException as e:
         st.exception(e)
+    profiler.stop()
+    if profiler.enabled:
+        visualize_profile(profiler)
+    if debug:
+        token = st.session_state.get("token", None)
+        visualize_metrics(get_client(token) if token is not None else None)
     st.sidebar.markdown(
         FOOTER,
         unsafe_allow_html=True,
     )
+    if (background and tasks.pending()) or (batch is not None and batch.pending()):
+        # poll: rerun the script until pending annotations are done
+        time.sleep(poll_interval)
+        st.experimental_rerun()
+
+
+def file_uploader(label: str, key: str, multiple: bool) -> None:
+    """File uploader storing one file, or a list of them, in ``st.session_state[key]``."""
+    if multiple:
+        st.file_uploader(label, key=key, accept_multiple_files=True)
+    else:
+        st.file_uploader(label, key=key, accept_multiple_files=False)
+
+
+def session_sample(client: StreamlitSherpaClient, project: str, key: str = "sherpa_sample") -> Optional[Sample]:
+    """Sample text of the session for a project, another one from the pool on demand."""
+    samples = st.session_state.setdefault(key, {})
+    another = st.sidebar.button("Another sample", key=f"{key}_next")
+    if another or project not in samples:
+        samples[project] = sample_pool(client, project).next()
+    return samples[project]
+
+
+class AnnotationResult(NamedTuple):
+    doc: Optional[AnyDocument] = None
+    formatted: Optional[File] = None
+    comparison: Optional[Tuple[Dict[str, AnyDocument], Dict[str, BaseException]]] = None
+
+
+def plan_definition(annotator: ExtendedAnnotator) -> Optional[AnnotationPlan]:
+    """Definition of a plan annotator, ``None`` for models."""
+    if annotator.type != "plan" or isinstance(annotator.parameters, Unset):
+        return None
+    return annotator.parameters
+
+
+def uploaded_file_copy(uploaded_file: UploadedFile) -> BytesIO:
+    """Detach the content of an upload from the session so it can be used later."""
+    # with the name and type of the upload, as streamlit's UploadedFile
+    datafile: Any = BytesIO(uploaded_file.getvalue())
+    datafile.name = uploaded_file.name
+    datafile.type = uploaded_file.type
+    return datafile
+
+
+def upload_work(
+    client: StreamlitSherpaClient,
+    project: ProjectBean,
+    annotator: ExtendedAnnotator,
+    compared: List[ExtendedAnnotator],
+    uploaded_file: UploadedFile,
+    *,
+    reuse_conversion: bool = False,
+) -> Callable[[], AnnotationResult]:
+    """The annotation call for an uploaded binary (plans with a converter), JSON or text file."""
+    plan = plan_definition(annotator)
+    converter = bool(plan.converter) if plan is not None else False
+    if converter or "json" in uploaded_file.type:
+        return annotation_work(
+            client, project, annotator, compared, file=uploaded_file_copy(uploaded_file), converter=converter,
+            reuse_conversion=reuse_conversion,
+        )
+    return annotation_work(client, project, annotator, compared, text=uploaded_file.getvalue().decode("utf-8"))
+
+
+def start_batch(
+    client: StreamlitSherpaClient,
+    project: ProjectBean,
+    annotator: ExtendedAnnotator,
+    compared: List[ExtendedAnnotator],
+    uploaded_files: List[UploadedFile],
+    *,
+    workers: int = 4,
+) -> Batch:
+    """Annotate uploaded files concurrently, ``workers`` at a time."""
+    batch = Batch(
+        entries=result_entries,
+        summarize=result_summary,
+        workers=workers,
+        spool_threshold=client.spool_threshold,
+        context=dict(annotator=annotator, compared=compared),
+    )
+    for uploaded_file in uploaded_files:
+        batch.submit(
+            uploaded_file.name,
+            upload_work(client, project, annotator, compared, uploaded_file, reuse_conversion=True),
+        )
+    return batch
+
 
+def result_entries(name: str, result: AnnotationResult) -> Iterable[Entry]:
+    """Bundle entries of the result of a file: formatted output or JSON documents."""
+    stem = name.rsplit(".", 1)[0] or name
+    if result.formatted is not None:
+        # formatter outputs are binary files
+        yield f"{stem}/{result.formatted.file_name or 'result'}", cast(IO[bytes], result.formatted.payload)
+    if result.doc is not None:
+        yield f"{stem}.json", json.dumps(result.doc.to_dict()).encode("utf-8")
+    if result.comparison is not None:
+        for label, doc in result.comparison[0].items():
+            yield f"{stem}/{label}.json", json.dumps(doc.to_dict()).encode("utf-8")
+
+
+# columns of result_summary that are not label counts
+SUMMARY_COLUMNS = ("seconds", "documents", "annotations", "bytes")
+
+
+def result_summary(result: AnnotationResult) -> Dict[str, Any]:
+    """Number of annotations of the result of a file, in total and by label."""
+    if result.formatted is not None:
+        payload = result.formatted.payload
+        return {"bytes": len(payload) if isinstance(payload, (bytes, bytearray)) else file_size(payload)}
+    if result.doc is not None:
+        docs = [result.doc]
+    elif result.comparison is not None:
+        # the document of the reference annotator
+        docs = list(result.comparison[0].values())[:1]
+    else:
+        docs = []
+    labels: Counter = Counter()
+    for doc in docs:
+        if not isinstance(doc.annotations, Unset):
+            labels.update(a.label_name for a in doc.annotations)
+    return {"documents": len(docs), "annotations": sum(labels.values()), **labels}
+
+
+def annotation_work(
+    client: StreamlitSherpaClient,
+    project: ProjectBean,
+    annotator: ExtendedAnnotator,
+    compared: List[ExtendedAnnotator],
+    *,
+    text: Optional[str] = None,
+    file: Optional[BytesIO] = None,
+    converter: bool = False,
+    reuse_conversion: bool = False,
+) -> Callable[[], AnnotationResult]:
+    """The annotation call for a text or an uploaded file, to run now or later.
+
+    Batches set ``reuse_conversion`` so the conversions of their files are
+    kept for other plans, see :meth:`StreamlitSherpaClient.annotate_binary`.
+    """
+    plan = plan_definition(annotator)
+    formatter = plan.formatter if plan is not None else None
+
+    def work() -> AnnotationResult:
+        result = annotate()
+        if result.doc is not None:
+            # build the search index while still in the background
+            document_index(result.doc)
+        return result
+
+    def annotate() -> AnnotationResult:
+        if file is not None and converter:
+            if formatter:
+                return AnnotationResult(
+                    formatted=client.annotate_format_binary(project, annotator, file, reuse_conversion=reuse_conversion)
+                )
+            if compared:
+                return AnnotationResult(
+                    comparison=annotate_many(
+                        client, project.name, [annotator, *compared], binary=file.getvalue(), file_name=file.name
+                    )
+                )
+            docs = client.annotate_binary(project, annotator, file, raw=True, reuse_conversion=reuse_conversion)
+            return AnnotationResult(doc=docs[0] if docs else None)
+        if file is not None:
+            if formatter:
+                return AnnotationResult(formatted=client.annotate_format_json(project, annotator, file))
+            if compared:
+                return AnnotationResult(
+                    comparison=annotate_many(
+                        client, project.name, [annotator, *compared], json_data=file.getvalue()
+                    )
+                )
+            docs = client.annotate_json(project, annotator, file, raw=True)
+            return AnnotationResult(doc=docs[0] if docs else None)
+        if formatter:
+            return AnnotationResult(formatted=client.annotate_format_text(project, annotator, text))
+        if compared:
+            return AnnotationResult(
+                comparison=annotate_many(client, project.name, [annotator, *compared], text=text)
+            )
+        return AnnotationResult(doc=client.annotate_text(project, annotator, text, raw=True))
 
+    return work
+
+
+def visualize_batch(batch: Batch, *, title: Optional[str] = "Files", key: str = "sherpa_batch") -> Optional[BatchItem]:
+    """Progress and summary of a batch of files, return the finished file to display."""
+    if title:
+        st.header(title)
+    pending = batch.pending()
+    st.progress(batch.progress)
+    if pending:
+        st.caption(f"{len(batch.items) - len(pending)} of {len(batch.items)} files finished")
+        st.button("Cancel remaining files", key=f"{key}_cancel", on_click=batch.cancel)
+    df = pd.DataFrame(batch.summary()).set_index("file")
+    labels = [c for c in df.columns if c not in SUMMARY_COLUMNS and df[c].dtype.kind in "if"]
+    df[labels] = df[labels].fillna(0).astype(int)
+    st.dataframe(df)
+    if labels:
+        st.bar_chart(df[labels].sum().rename("annotations"))
+    bundle = batch.bundle()
+    if bundle is not None:
+        zipped = File(payload=cast(BinaryIO, bundle), file_name="annotations.zip", mime_type="application/zip")
+        visualize_download(zipped, key=key)
+    names = {i: item.name for i, item in enumerate(batch.items) if item.status == "done"}
+    if not names:
+        return None
+    index = st.selectbox("Show file", list(names), format_func=names.get, key=f"{key}_file")
+    return batch.items[index]
+
+
+def visualize_tasks(tasks: TaskQueue, *, title: Optional[str] = "Annotations") -> Optional[Task]:
+    """List the annotations of the session, return the finished one to display."""
+    if not tasks.tasks:
+        return None
+    if title:
+        st.sidebar.subheader(title)
+    for task in reversed(tasks.tasks):
+        st.sidebar.caption(f"#{task.id} {task.description} | {task.status} ({task.elapsed:.1f}s)")
+    finished = [t for t in tasks.finished() if t.status in ("done", "failed")]
+    if not finished:
+        st.info(f"{len(tasks.pending())} annotation(s) in progress...")
+        return None
+    labels = {t.id: f"#{t.id} {t.description}" for t in reversed(finished)}
+    selected = st.session_state.get("sherpa_task")
+    if st.session_state.get("sherpa_task_newest") != finished[-1].id or selected not in labels:
+        # show each new result as soon as it is ready, or the newest one when the
+        # selected result was dropped from the queue
+        st.session_state["sherpa_task_newest"] = st.session_state["sherpa_task"] = finished[-1].id
+    task_id = st.selectbox("Result", list(labels), format_func=labels.get, key="sherpa_task")
+    shown = tasks.get(task_id)
+    if shown is None:
+        st.session_state.pop("sherpa_task", None)
+        return None
+    error = shown.future.exception() if shown.status == "failed" else None
+    if error is not None:
+        st.exception(error)
+        return None
+    return shown
+
+
+def visualize_result(
+    result: AnnotationResult,
+    annotator: ExtendedAnnotator,
+    compared: List[ExtendedAnnotator],
+    *,
+    show_json: bool = False,
+) -> None:
+    """Render an annotated document, a comparison or a formatted output."""
+    doc, formatted, comparison = result
+    if doc is not None:
+        (
+            col1,
+            col2,
+        ) = st.columns(2)
+        with col1:
+            st.success("Annotation successful!")
+        if show_json:
+            with col2:
+                doc_exp = st.expander("Annotated doc (json)")
+                doc_exp.json(doc.to_dict())
+        visualize_annotated_doc(doc, annotator)
+    if comparison is not None:
+        visualize_comparison(
+            *comparison,
+            annotators={a.label: a for a in [annotator, *compared]},
+        )
+    if formatted is not None:
+        if getattr(formatted.payload, "closed", False):
+            st.warning("This result is no longer available, annotate again to download it.")
+            return
+        session_spools().track(formatted.payload)
+        (
+            col1,
+            col2,
+        ) = st.columns(2)
+        with col1:
+            st.success("Annotation & formatting successful!")
+        with col2:
+            visualize_download(formatted)
+        if formatted.mime_type in TABLE_MIME_TYPES:
+            visualize_table(formatted, annotator)
+
+
+def visualize_download(formatted: File, *, key: str = "download") -> None:
+    """Download button of a formatted output.
+
+    Outputs spooled to disk are only read into memory, for Streamlit to
+    serve them, once the user asks for the download.
+    """
+    payload = formatted.payload
+    if isinstance(payload, (bytes, bytearray)) or not is_on_disk(payload):
+        st.download_button(
+            label="Download result",
+            data=payload if isinstance(payload, (bytes, bytearray)) else read_all(payload),
+            file_name=formatted.file_name,
+            mime=formatted.mime_type,
+        )
+        return
+    prepared = f"{key}_prepared"
+    if st.session_state.get(prepared) is not payload:
+        st.button(
+            f"Prepare download ({file_size(payload) / 2**20:.1f} MiB)",
+            key=f"{key}_prepare",
+            on_click=st.session_state.__setitem__,
+            args=(prepared, payload),
+        )
+    else:
+        st.download_button(
+            label="Download result",
+            data=read_all(payload),
+            file_name=formatted.file_name,
+            mime=formatted.mime_type,
+            on_click=st.session_state.pop,
+            args=(prepared, None),
+        )
+
+
+def visualize_metrics(
+    client: Optional[StreamlitSherpaClient] = None,
+    registry: MetricsRegistry = REGISTRY,
+    *,
+    title: Optional[str] = "Debug",
+) -> None:
+    """Sidebar panel with the collected metrics and the client cache statistics."""
+    with st.sidebar.expander(title or "Debug"):
+        snapshot = registry.snapshot()
+        if snapshot:
+            st.dataframe(
+                pd.DataFrame(
+                    {"metric": list(snapshot.keys()), "value": list(snapshot.values())}
+                )
+            )
+        if client is not None:
+            infos = client.cache_info()
+            st.dataframe(
+                pd.DataFrame(list(infos.values()), index=list(infos.keys()))
+            )
+
+
+@timed(VISUALIZER_SECONDS)
+def visualize_profile(
+    profiler: RerunProfiler,
+    *,
+    title: Optional[str] = "Rerun profile",
+) -> None:
+    """Sidebar panel with the time and allocation breakdown of the rerun."""
+    with st.sidebar.expander(title or "Rerun profile", expanded=True):
+        if profiler.records:
+            df = pd.DataFrame(profiler.records).groupby("phase", sort=False).sum()
+            df["allocated (KiB)"] = df.pop("allocated_bytes") / 1024
+            df["peak (KiB)"] = df.pop("peak_bytes") / 1024
+            df["seconds"] = df["seconds"].round(4)
+            st.dataframe(df)
+        st.caption(f"Total rerun time: {profiler.total_seconds:.3f}s")
+        for path in profiler.dumped:
+            st.caption(f"Dumped {path}")
+
+
+@timed(VISUALIZER_SECONDS)
 def visualize_table(
     result: File,
     annotator: ExtendedAnnotator,
     *,
     title: Optional[str] = "Table",
     key: Optional[str] = None,
+    page_size: int = 1000,
 ):
+    """Display a CSV or XLSX formatter output one sheet and one page at a time."""
     if title:
         st.header(title)
-    if result.mime_type == "text/csv":
-        df = pd.read_csv(result.payload)
-        st.dataframe(data=df)
-    elif (
-        result.mime_type
-        == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    ):
-        with pd.ExcelFile(result.payload) as xls:
-            for sheet in xls.sheet_names:
-                df = pd.read_excel(xls, sheet)
-                st.subheader(sheet)
-                st.dataframe(data=df)
+    if result.mime_type not in TABLE_MIME_TYPES:
+        return
+    key = key or "table"
+    # formatter outputs are binary files
+    data = cast(IO[bytes], result.payload)
+    digest = payload_digest(data)
+    sheet = None
+    if result.mime_type == XLSX_MIME:
+        names = sheet_names(data, digest)
+        sheet = (
+            st.selectbox("Sheet", names, key=f"{key}_sheet")
+            if len(names) > 1
+            else names[0]
+        )
+    table = load_table(data, result.mime_type, sheet, digest)
+    nrows = len(table)
+    pages = max(1, math.ceil(nrows / page_size))
+    page = 1
+    if pages > 1:
+        page = int(
+            st.number_input(
+                f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page"
+            )
+        )
+    start = (page - 1) * page_size
+    stop = min(start + page_size, nrows)
+    st.caption(f"Rows {start + 1 if nrows else 0}-{stop} of {nrows}")
+    st.dataframe(data=table_rows(table, start, stop))
 
 
-def visualize_annotated_doc(
-    doc: AnnotatedDocument,
-    annotator: ExtendedAnnotator,
+@timed(VISUALIZER_SECONDS)
+def visualize_comparison(
+    docs: Dict[str, AnyDocument],
+    errors: Optional[Dict[str, BaseException]] = None,
     *,
-    title: Optional[str] = "Annotated Document",
+    annotators: Dict[str, ExtendedAnnotator],
+    mode: str = "exact",
+    title: Optional[str] = "Comparison",
     key: Optional[str] = None,
 ) -> None:
-    """Visualizer for named entities."""
+    """Render the documents of several annotators side by side with their agreement.
+
+    The first document is the reference of the per label scores and of the
+    overlap matrices.
+    """
     if title:
         st.header(title)
+    for name, e in (errors or {}).items():
+        st.error(f"{name}: {e}")
+    if not docs:
+        return
+    for column, (name, doc) in zip(st.columns(len(docs)), docs.items()):
+        with column:
+            st.subheader(name)
+            html = categories_html(doc, annotators[name])
+            if html is not None:
+                st.write(html, unsafe_allow_html=True)
+            components.html(annotations_html(doc, annotators[name]), height=600, scrolling=True)
+    if len(docs) < 2:
+        return
+    names, f1 = pairwise_f1(docs, mode)
+    st.subheader(f"Pairwise F1 ({mode} match)")
+    st.dataframe(pd.DataFrame(f1, index=names, columns=names))
+    reference = names[0]
+    for name in names[1:]:
+        expander = st.expander(f"{name} vs {reference}")
+        scores = agreement(docs[reference], docs[name], mode)
+        expander.dataframe(pd.DataFrame(scores).set_index("label"))
+        ref_labels, labels, matrix = overlap_matrix(docs[reference], docs[name])
+        expander.caption(f"Overlapping spans, rows are {reference} labels")
+        expander.dataframe(pd.DataFrame(matrix, index=ref_labels, columns=labels))
+
+
+def annotator_labels(annotator: ExtendedAnnotator) -> Dict[str, Label]:
+    """Labels of an annotator by name, empty if it has none."""
+    return annotator.labels if isinstance(annotator.labels, dict) else {}
+
+
+def categories_html(doc: AnyDocument, annotator: ExtendedAnnotator) -> Optional[str]:
+    """Render the document categories as HTML chips, ``None`` if there are none."""
     categories = doc.categories
-    labels = annotator.labels or {}
-
-    if categories is not UNSET:
-        categorized = []
-        for cat in categories:
-            name = cat.label_name
-            score = cat.score or 1.0
-            color = labels.get(name).color if name in labels else "#333"
-            categorized.append(
-                annotation(cat.label or name, "{:.0%}".format(score), color)
-            )
-            categorized.append(" ")
+    if isinstance(categories, Unset):
+        return None
+    labels = annotator_labels(annotator)
+    categorized = []
+    for cat in categories:
+        name = cat.label_name
+        label = labels.get(name) if isinstance(name, str) else None
+        score = cat.score if isinstance(cat.score, (int, float)) and cat.score else 1.0
+        color = label.color if label is not None else "#333"
+        categorized.append(
+            annotation(cat.label or name, "{:.0%}".format(score), color)
+        )
+        categorized.append(" ")
+    return annotated_text(*categorized)
 
-        html = annotated_text(*categorized)
-        st.write(html, unsafe_allow_html=True)
 
-    annotation_map = RangeMap()
-    annotations = doc.annotations
+def annotations_html(
+        doc: AnyDocument,
+        annotator: ExtendedAnnotator,
+        start: int = 0,
+        end: Optional[int] = None,
+) -> str:
+    """Render the text of a document, or of ``[start, end)``, with its annotations as HTML.
+
+    Spans only reference the per-label classes of a generated stylesheet,
+    which keeps the markup of large documents small. Nested annotations are
+    rendered as nested elements and annotations crossing another one are
+    split, so no annotation is lost.
+    """
+    styles = label_styles(annotator_labels(annotator))
     text = doc.text
-    if annotations is not UNSET:
-        for a in annotations:
-            annotation_map[a.start : a.end] = a
-        start = 0
-        annotated = []
-        for r in annotation_map.ranges():
-            if r.start > start:
-                annotated.append(clean_html(text[start : r.start]))
-            a = r.value
-            name = a.label_name
-            color = labels.get(name).color if name in labels else "#333"
-            annotated.append(
-                clean_annotation(
-                    text[r.start : r.stop], clean_html(a.label or name), color
-                )
-            )
-            start = r.stop
-        if start < len(text):
-            annotated.append(clean_html(text[start:]))
-    else:
-        annotated = [text]
+    end = len(text) if end is None else min(end, len(text))
+    if isinstance(doc.annotations, Unset):
+        return styles.wrap(html.escape(text[start:end]))
+    # annotation models or spans of a view, with offsets
+    annotations: Sequence[Any] = doc.annotations
+    spans = [annotations[i] for i in annotation_index(doc).overlapping(start, end)]
+    titles: Dict[str, str] = {}
+    # sweep the boundaries: `active` holds the annotations covering the
+    # current segment in document order, `opened` the elements open in the markup
+    stops = sorted(
+        {start, end, *(a.start for a in spans if a.start > start), *(a.end for a in spans if a.end < end)}
+    )
+    active: List = []
+    opened: List = []
+    annotated = []
+    i = 0
+    for pos, stop in zip(stops, stops[1:]):
+        active = [a for a in active if a.end > pos]
+        while i < len(spans) and spans[i].start <= pos:
+            active.append(spans[i])
+            i += 1
+        common = 0
+        while common < min(len(opened), len(active)) and opened[common] is active[common]:
+            common += 1
+        annotated.append("</mark>" * (len(opened) - common))
+        for a in active[common:]:
+            title = a.label or a.label_name
+            if title not in titles:
+                titles[title] = clean_html(title)
+            annotated.append(styles.open_tag(a.label_name, titles[title]))
+        opened = list(active)
+        segment = text[pos:stop]
+        annotated.append(html.escape(segment if active else clean_text(segment)))
+    annotated.append("</mark>" * len(opened))
+    return styles.wrap("".join(annotated))
+
 
-    html = annotated_text(*annotated)
+@timed(VISUALIZER_SECONDS)
+def visualize_annotated_doc(
+    doc: AnyDocument,
+    annotator: ExtendedAnnotator,
+    *,
+    title: Optional[str] = "Annotated Document",
+    key: Optional[str] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+    search: bool = True,
+) -> None:
+    """Visualizer for named entities, of the whole text or of ``[start, end)``."""
+    if title:
+        st.header(title)
+    html = categories_html(doc, annotator)
+    if html is not None:
+        st.write(html, unsafe_allow_html=True)
+
+    key = key or "sherpa_doc"
+    rendered = st.session_state.get(f"{key}_html")
+    if rendered is None or rendered[0] is not doc or rendered[1:3] != (annotator.name, (start, end)):
+        # searching reruns the script, keep the document markup
+        rendered = (doc, annotator.name, (start, end), annotations_html(doc, annotator, start, end))
+        st.session_state[f"{key}_html"] = rendered
+    highlights = visualize_search(doc, annotator, key=key, start=start, end=end) if search else None
+    # the same markup on every search: the document frame is neither re-sent
+    # (large messages are cached by the browser) nor re-rendered
+    html = rendered[3] + (highlight_listener_html(key) if search else "")
     # html = html.replace("\n", "<br/>")
     components.html(html, width=800, height=800, scrolling=True)
     # st.write(html, unsafe_allow_html=True)
+    if highlights is not None:
+        components.html(highlights, height=0)
+
+
+def visualize_search(
+        doc: AnyDocument,
+        annotator: ExtendedAnnotator,
+        *,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None,
+) -> str:
+    """Search box, label filter and hit navigation, return the frame highlighting the hits.
+
+    The frame posts the hits to the document rendered with
+    :func:`~sherpa_streamlit.util.highlight_listener_html` for the same ``key``.
+    """
+    index = document_index(doc)
+    end = len(doc.text) if end is None else end
+    labels = annotator_labels(annotator)
+    col1, col2, col3, col4, col5 = st.columns([4, 3, 1, 1, 2])
+    query = col1.text_input("Search", key=f"{key}_query")
+    label_name = col2.selectbox(
+        "Label",
+        ["", *sorted(index.labels)],
+        format_func=lambda name: (labels[name].label or name) if name in labels else name,
+        key=f"{key}_label",
+    )
+    if label_name:
+        hits = index.label_hits(label_name)
+        if query:
+            needle = normalize(query)
+            hits = [h for h in hits if needle in normalize(doc.text[h.start : h.end])]
+    else:
+        hits = index.find(query) if query else []
+    hits = [h for h in hits if h.start >= start and h.end <= end]
+    position = f"{key}_hit"
+    if st.session_state.get(f"{key}_hits") != (query, label_name, id(doc)):
+        st.session_state[f"{key}_hits"] = (query, label_name, id(doc))
+        st.session_state[position] = hits[0].start if hits else None
+    current = st.session_state.get(position)
+
+    def move(step):
+        offset = st.session_state.get(position)
+        offset = -1 if offset is None else offset
+        hit = index.next_hit(hits, offset) if step > 0 else index.previous_hit(hits, offset)
+        st.session_state[position] = hit.start if hit else None
+
+    col3.button("<", key=f"{key}_previous", on_click=move, args=(-1,), disabled=not hits)
+    col4.button(">", key=f"{key}_next", on_click=move, args=(1,), disabled=not hits)
+    if not hits:
+        if query or label_name:
+            col5.caption("No match")
+        return highlight_html([], key=key)
+    rank = next((i for i, h in enumerate(hits) if h.start == current), 0)
+    col5.caption(f"{rank + 1} / {len(hits)}")
+    return highlight_html(hits, rank, offset=start, key=key)
 
 
 def main():
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the stub Sherpa server and the budgets live with the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+from stub_server import StubSherpaServer  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    with StubSherpaServer() as server:
+        yield server
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from sherpa_streamlit.auth import MemoryTokenStore, StoredLogin, TokenStore, jwt_expiry, login_key
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+from stub_server import StubSherpaServer
+
+LOGIN = "POST /auth/login"
+
+
+@pytest.fixture
+def server():
+    with StubSherpaServer(token_ttl=3600) as server:
+        yield server
+
+
+def test_stored_login_is_reused(server):
+    store = MemoryTokenStore()
+    first = StreamlitSherpaClient(server.url, "user", "password", token_store=store)
+    second = StreamlitSherpaClient(server.url, "user", "password", token_store=store)
+    assert server.requests[LOGIN] == 1
+    assert second.token == first.token
+    assert second.expires_at == pytest.approx(time.time() + 3600, abs=60)
+    second.get_projects()
+    # another password never matches the stored login
+    StreamlitSherpaClient(server.url, "user", "other", token_store=store)
+    assert server.requests[LOGIN] == 2
+
+
+def test_revoked_token_is_replaced_after_401(server):
+    store = MemoryTokenStore()
+    client = StreamlitSherpaClient(server.url, "user", "password", token_store=store)
+    stale = client.token
+    client.get_projects()
+    server.revoke_tokens()
+    client.get_projects.cache_clear()
+    assert client.get_projects()
+    assert server.requests[LOGIN] == 2
+    assert server.requests["GET /projects"] == 2
+    assert client.token != stale
+    # the store holds the new login for the next clients
+    assert store.get(login_key(server.url.rstrip("/"), "user", "password")).token == client.token
+
+
+def test_expiring_token_is_renewed_before_requests(server):
+    client = StreamlitSherpaClient(server.url, "user", "password", token_store=None, refresh_margin=60)
+    client.get_projects()
+    assert server.requests[LOGIN] == 1
+    client.expires_at = time.time() + 30
+    client.get_projects.cache_clear()
+    client.get_projects()
+    assert server.requests[LOGIN] == 2
+    assert client.expires_at > time.time() + 3000
+
+
+def test_renewed_tokens_replace_older_ones_in_the_register(server):
+    client = StreamlitSherpaClient(server.url, "user", "password", token_store=None)
+    tokens = [client.token]
+    for _ in range(3):
+        server.revoke_tokens()
+        client._relogin(client.token)
+        tokens.append(client.token)
+    assert len(set(tokens)) == 4
+    registered = [t for t, c in StreamlitSherpaClient.register.items() if c is client]
+    # the current token and the one it replaced, for reruns that read it before
+    assert registered == tokens[-2:]
+    assert StreamlitSherpaClient.from_token(tokens[0]) is None
+    assert StreamlitSherpaClient.from_token(tokens[-2]) is client
+
+
+def test_token_stores_implement_the_mapping():
+    with pytest.raises(TypeError):
+        TokenStore()
+    store = MemoryTokenStore()
+    store.put("key", StoredLogin("token", token="t"))
+    assert store.get("key").token == "t"
+    store.delete("key")
+    store.delete("key")
+    assert store.get("key") is None
+
+
+def test_jwt_expiry():
+    token = StubSherpaServer(token_ttl=10).issue_token()
+    assert jwt_expiry(token) == pytest.approx(time.time() + 10, abs=5)
+    assert jwt_expiry("not a token") is None
+    assert StoredLogin("token", expires_at=100).is_valid(now=99)
+    assert not StoredLogin("token", expires_at=100).is_valid(margin=5, now=99)
+
+
+def test_file_store_updates_from_several_writers(tmp_path):
+    pytest.importorskip("cryptography")
+    from sherpa_streamlit.auth import FileTokenStore
+
+    path = tmp_path / "tokens"
+    # one store each, as in separate processes: only the file lock serializes them
+    stores = [FileTokenStore(path, secret="secret") for _ in range(4)]
+
+    def put_logins(i, store):
+        for j in range(10):
+            store.put(f"{i}-{j}", StoredLogin("token", token=f"t{i}-{j}", expires_at=time.time() + 60))
+
+    threads = [threading.Thread(target=put_logins, args=(i, s)) for i, s in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reader = FileTokenStore(path, secret="secret")
+    assert all(reader.get(f"{i}-{j}").token == f"t{i}-{j}" for i in range(4) for j in range(10))
+    assert (path.stat().st_mode & 0o777) == 0o600
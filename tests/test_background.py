@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+import streamlit
+
+from sherpa_streamlit.background import TaskQueue, get_executor, session_tasks
+
+
+def test_finished_tasks_beyond_the_limit_are_trimmed():
+    tasks = TaskQueue(max_finished=3)
+    done = [tasks.submit(lambda i=i: i, description=f"task {i}") for i in range(5)]
+    for task in done:
+        task.future.result()
+    release = threading.Event()
+    running = tasks.submit(release.wait, 5, description="running")
+    # the oldest finished tasks go, pending ones always stay
+    assert [t.description for t in tasks.tasks] == ["task 2", "task 3", "task 4", "running"]
+    assert tasks.pending() == [running]
+    assert tasks.get(done[0].id) is None
+    assert tasks.get(done[4].id) is done[4]
+    release.set()
+    running.future.result()
+    tasks.clear_finished()
+    assert tasks.tasks == []
+
+
+def test_errors_are_kept_in_the_task():
+    tasks = TaskQueue()
+    task = tasks.submit(lambda: 1 / 0, description="broken", context={"file": "a.txt"})
+    with pytest.raises(ZeroDivisionError):
+        task.future.result()
+    assert task.status == "failed"
+    assert isinstance(task.future.exception(), ZeroDivisionError)
+    assert task.context == {"file": "a.txt"}
+    assert tasks.finished() == [task]
+    assert task.elapsed >= 0
+
+
+def test_queued_tasks_can_be_cancelled():
+    tasks = TaskQueue()
+    release = threading.Event()
+    # occupy every worker of the shared executor
+    blockers = [tasks.submit(release.wait, 5) for _ in range(get_executor()._max_workers)]
+    deadline = time.monotonic() + 5
+    while any(t.status != "running" for t in blockers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queued = tasks.submit(lambda: "never")
+    assert queued.status == "queued"
+    tasks.cancel_pending()
+    release.set()
+    wait([t.future for t in blockers])
+    assert queued.status == "cancelled"
+    assert [t.status for t in blockers] == ["done"] * len(blockers)
+
+
+def test_session_tasks_are_kept_in_the_session_state(monkeypatch):
+    state = {}
+    monkeypatch.setattr(streamlit, "session_state", state)
+    tasks = session_tasks()
+    assert state == {"sherpa_tasks": tasks}
+    assert session_tasks() is tasks
+    assert session_tasks("other") is not tasks
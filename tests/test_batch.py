@@ -0,0 +1,81 @@
+import io
+import threading
+import time
+import zipfile
+
+from sherpa_streamlit.batch import Batch
+
+
+def entries(name, result):
+    return [(f"{name}.json", result.encode("utf-8")), (f"{name}.txt", io.BytesIO(result.encode("utf-8")))]
+
+
+def wait_for(batch: Batch, statuses):
+    deadline = time.monotonic() + 5
+    while [item.status for item in batch.items] != statuses and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [item.status for item in batch.items] == statuses
+
+
+def test_bundle_holds_the_outputs_and_a_summary():
+    batch = Batch(entries=entries, summarize=lambda result: {"chars": len(result)})
+    for name in ("a", "b", "a"):
+        batch.submit(name, lambda name=name: f"result of {name}")
+    batch.submit("broken", lambda: 1 / 0)
+    wait_for(batch, ["done", "done", "done", "failed"])
+    assert batch.progress == 1.0
+    with zipfile.ZipFile(batch.bundle()) as bundle:
+        names = bundle.namelist()
+        assert sorted(names) == ["a.json", "a.txt", "a_1.json", "a_1.txt", "b.json", "b.txt", "summary.csv"]
+        assert bundle.read("b.txt") == b"result of b"
+        summary = bundle.read("summary.csv").decode("utf-8").splitlines()
+    assert summary[0] == "file,status,seconds,chars,error"
+    assert [line.split(",")[:2] for line in summary[1:]] == [
+        ["a", "done"], ["b", "done"], ["a", "done"], ["broken", "failed"]
+    ]
+    assert summary[-1].endswith("division by zero")
+    # the summary is written once
+    with zipfile.ZipFile(batch.bundle()) as bundle:
+        assert bundle.namelist() == names
+    batch.close()
+
+
+def test_entry_names_are_unique():
+    batch = Batch()
+    names = ["doc.txt", "doc.txt", "doc.txt", "README", "README", ".env", ".env"]
+    assert [batch._entry_name(n) for n in names] == [
+        "doc.txt", "doc_1.txt", "doc_2.txt", "README", "README_1", ".env", ".env_1"
+    ]
+    batch.close()
+
+
+def blocking_batch():
+    release = threading.Event()
+    batch = Batch(entries=entries, workers=1)
+    batch.submit("first", lambda: release.wait(5) and "first")
+    for name in ("second", "third"):
+        batch.submit(name, lambda: "never")
+    wait_for(batch, ["running", "queued", "queued"])
+    return batch, release
+
+
+def test_cancel_drops_the_files_not_started():
+    batch, release = blocking_batch()
+    batch.cancel()
+    assert batch.bundle() is None
+    release.set()
+    wait_for(batch, ["done", "cancelled", "cancelled"])
+    assert batch.done
+    with zipfile.ZipFile(batch.bundle()) as bundle:
+        assert sorted(bundle.namelist()) == ["first.json", "first.txt", "summary.csv"]
+    batch.close()
+
+
+def test_close_while_files_run():
+    batch, release = blocking_batch()
+    batch.close()
+    release.set()
+    # the running file ends without a bundle to write to
+    wait_for(batch, ["done", "cancelled", "cancelled"])
+    assert batch.items[0].error is None
+    assert batch.bundle() is None
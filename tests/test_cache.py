@@ -0,0 +1,209 @@
+import copy
+import pickle
+import threading
+import time
+
+import pytest
+from sherpa_client.models import Label, ProjectBean
+
+from sherpa_streamlit.cache import (
+    CacheBudget,
+    KeyLocks,
+    LruCache,
+    estimate_size,
+    freeze,
+    lru_cache,
+    shared_cache,
+)
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+from sherpa_streamlit.util import get_cached_projects
+
+
+def test_estimate_size_counts_shared_objects_once():
+    item = "x" * 1000
+    assert estimate_size([item, item]) < 2 * estimate_size(item)
+    assert estimate_size({"a": [item]}) > estimate_size(item)
+
+
+def test_estimate_size_walks_inherited_slots():
+    class Base:
+        __slots__ = ("payload",)
+
+    class Derived(Base):
+        __slots__ = "extra"
+
+    obj = Derived()
+    obj.payload = "x" * 1000
+    obj.extra = "y" * 1000
+    assert estimate_size(obj) > 2000
+
+
+def test_key_locks_are_kept_while_callers_wait():
+    locks = KeyLocks()
+    running = []
+    overlaps = []
+
+    def compute():
+        with locks.hold("key"):
+            running.append(1)
+            overlaps.append(len(running))
+            time.sleep(0.01)
+            running.pop()
+
+    threads = [threading.Thread(target=compute) for _ in range(8)]
+    # callers keep arriving while the first ones wait
+    for t in threads:
+        t.start()
+        time.sleep(0.005)
+    for t in threads:
+        t.join()
+    assert overlaps == [1] * 8
+    with pytest.raises(ValueError), locks.hold("key"):
+        raise ValueError("released anyway")
+    assert len(locks) == 0
+
+
+def test_lru_byte_accounting():
+    budget = CacheBudget()
+    cache = LruCache(maxsize=None, maxbytes=None, budget=budget)
+    cache.put("a", "value", size=100)
+    cache.put("b", "value", size=50)
+    assert cache.bytes == budget.bytes == 150
+    # replacing a key releases its previous size
+    cache.put("a", "other", size=10)
+    assert cache.bytes == budget.bytes == 60
+    cache.discard("b")
+    assert cache.bytes == budget.bytes == 10
+    cache.clear()
+    assert cache.bytes == budget.bytes == 0
+    assert len(cache.data) == 0
+
+
+def test_lru_evicts_least_recently_used_beyond_maxbytes():
+    cache = LruCache(maxsize=None, maxbytes=250, budget=CacheBudget())
+    for key in "abc":
+        cache.put(key, key, size=100)
+    assert list(cache.data) == ["b", "c"]
+    assert cache.get("b") == "b"
+    cache.put("d", "d", size=100)
+    assert list(cache.data) == ["b", "d"]
+    info = cache.info()
+    assert (info.evictions, info.bytes, info.currsize) == (2, 200, 2)
+
+
+def test_lru_evicts_beyond_maxsize_and_skips_oversized_values():
+    cache = LruCache(maxsize=2, maxbytes=1000, budget=CacheBudget())
+    for key in "abc":
+        cache.put(key, key, size=1)
+    assert list(cache.data) == ["b", "c"]
+    cache.put("huge", "huge", size=1001)
+    assert "huge" not in cache.data
+
+
+def test_lru_counts_hits_and_misses():
+    cache = LruCache(budget=CacheBudget())
+    assert cache.get("a") is None
+    cache.put("a", 1, size=1)
+    assert cache.get("a") == 1
+    assert cache.peek("a") == 1
+    info = cache.info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_budget_evicts_oldest_entry_across_caches():
+    budget = CacheBudget(maxbytes=300)
+    first = LruCache(maxsize=None, budget=budget)
+    second = LruCache(maxsize=None, budget=budget)
+    first.put("a", "a", size=100)
+    second.put("b", "b", size=100)
+    first.put("c", "c", size=100)
+    # touching "a" makes "b", in the other cache, the least recently used
+    first.get("a")
+    second.put("d", "d", size=100)
+    assert list(first.data) == ["c", "a"]
+    assert list(second.data) == ["d"]
+    assert budget.bytes == 300
+    assert budget.info().evictions == 1
+
+
+def test_lru_cache_method_is_per_instance():
+    budget = CacheBudget()
+
+    class Client:
+        def __init__(self):
+            self.calls = 0
+
+        @lru_cache(maxsize=4, budget=budget)
+        def get(self, key):
+            self.calls += 1
+            return [key] * 10
+
+    one, two = Client(), Client()
+    assert one.get("a") is one.get("a")
+    two.get("a")
+    assert (one.calls, two.calls) == (1, 1)
+    assert one.get.cache_info().hits == 1
+    assert budget.bytes == one.get.cache_info().bytes + two.get.cache_info().bytes > 0
+    one.get.cache_clear()
+    assert one.get.cache_info().currsize == 0
+
+
+def test_freeze_copies_and_leaves_the_original_mutable():
+    label = Label(name="person", label="Person", color="#ff0000")
+    value = {"labels": [label, label], "pair": (label, 1)}
+    frozen = freeze(value)
+    assert frozen == value
+    assert frozen["labels"][0] is not label
+    assert isinstance(frozen["labels"][0], Label)
+    # objects shared in the graph are copied once
+    assert frozen["labels"][0] is frozen["labels"][1] is frozen["pair"][0]
+    label.color = "#00ff00"
+    value["labels"].append(label)
+    assert frozen["labels"][0].color == "#ff0000"
+    assert len(frozen["labels"]) == 2
+    with pytest.raises(TypeError):
+        frozen["labels"][0].color = "#0000ff"
+    with pytest.raises(TypeError):
+        frozen["labels"].append(label)
+    with pytest.raises(TypeError):
+        frozen["other"] = None
+    assert freeze(frozen) is frozen
+
+
+def test_copies_of_frozen_values_are_mutable():
+    frozen = freeze([Label(name="person", label="Person", color="#ff0000")])
+    for thawed in (copy.deepcopy(frozen), pickle.loads(pickle.dumps(frozen))):
+        assert (thawed[0].name, thawed[0].color) == ("person", "#ff0000")
+        thawed[0].color = "#00ff00"
+        thawed.append(None)
+        assert type(thawed[0]) is Label
+    assert frozen[0].color == "#ff0000"
+
+
+def test_shared_cache_returns_one_frozen_copy():
+    returned = []
+
+    @shared_cache(ttl=60, budget=CacheBudget())
+    def get_labels(name):
+        returned.append([Label(name=name, label=name.title(), color="#ff0000")])
+        return returned[-1]
+
+    labels = get_labels("person")
+    assert get_labels("person") is labels
+    assert len(returned) == 1
+    assert labels is not returned[0] and labels[0] is not returned[0][0]
+    returned[0][0].color = "#00ff00"
+    with pytest.raises(TypeError):
+        labels[0].color = "#00ff00"
+
+
+def test_client_caches_are_not_frozen(stub):
+    client = StreamlitSherpaClient(stub.url, "user", "password", token_store=None)
+    shared = get_cached_projects(client.token)
+    project = client.get_projects()[0]
+    assert shared[0] == project and project == shared[0]
+    assert shared[0] is not project
+    assert type(project) is ProjectBean
+    project.label = "renamed"
+    assert shared[0].label != "renamed"
+    get_cached_projects.cache_clear()
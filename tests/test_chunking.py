@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from sherpa_streamlit.chunking import Chunk, split_text, stitch
+from stub_server import synthetic_text
+
+WORD_RE = re.compile(r"\w{6,}")
+
+
+def find_words(text):
+    """Stands for an annotator: one annotation per long word."""
+    return {
+        "text": text,
+        "annotations": [
+            {"start": m.start(), "end": m.end(), "labelName": "word", "text": m.group()}
+            for m in WORD_RE.finditer(text)
+        ],
+    }
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("short text", max_chars=100, overlap=10) == [Chunk(0, 10, 0, 10)]
+
+
+def test_overlap_must_be_smaller_than_half_the_chunks():
+    with pytest.raises(ValueError):
+        split_text("text", max_chars=100, overlap=50)
+
+
+def test_chunks_overlap_and_own_the_text_once():
+    text = synthetic_text(20000)
+    chunks = split_text(text, max_chars=2000, overlap=200)
+    assert len(chunks) > 10
+    assert chunks[0].start == chunks[0].own_start == 0
+    assert chunks[-1].end == chunks[-1].own_end == len(text)
+    for chunk, following in zip(chunks, chunks[1:]):
+        assert chunk.end - chunk.start <= 2000
+        assert following.start <= chunk.end
+        if following.start == chunk.end:
+            # entities do not cross paragraphs, no overlap is needed there
+            assert text[chunk.end - 2:chunk.end] == "\n\n"
+        # owned regions tile the text, inside their chunks
+        assert chunk.own_end == following.own_start
+        assert chunk.start <= chunk.own_start < chunk.own_end <= chunk.end
+        # chunks end on separators
+        assert text[chunk.end - 1].isspace()
+
+
+def test_stitched_annotations_match_the_whole_text():
+    text = synthetic_text(20000)
+    chunks = split_text(text, max_chars=2000, overlap=200)
+    fields = {"identifier": "doc1", "title": "Long document", "metadata": {"source": "test"}}
+    results = [{**fields, **find_words(text[c.start:c.end])} for c in chunks]
+    doc = stitch(text, chunks, results)
+    assert {k: doc[k] for k in fields} == fields
+    assert doc["text"] == text
+    assert doc["annotations"] == find_words(text)["annotations"]
+    for a in doc["annotations"]:
+        assert text[a["start"]:a["end"]] == a["text"]
+
+
+def test_stitch_shifts_sentences_and_keeps_best_categories():
+    text = "One. Two. Three."
+    chunks = [Chunk(0, 10, 0, 5), Chunk(5, 16, 5, 16)]
+    results = [
+        {
+            "sentences": [{"start": 0, "end": 4}, {"start": 5, "end": 9}],
+            "categories": [{"labelName": "a", "score": 0.5}, {"labelName": "b", "score": 0.9}],
+        },
+        {
+            "sentences": [{"start": 0, "end": 4}, {"start": 5, "end": 11}],
+            "categories": [{"labelName": "a", "score": 0.7}],
+        },
+    ]
+    doc = stitch(text, chunks, results)
+    assert doc["sentences"] == [{"start": 0, "end": 4}, {"start": 5, "end": 9}, {"start": 10, "end": 16}]
+    assert sorted((c["labelName"], c["score"]) for c in doc["categories"]) == [("a", 0.7), ("b", 0.9)]
+    assert doc["annotations"] == []
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pytest
+from sherpa_client.models import AnnotatedDocument
+
+from sherpa_streamlit.compare import (
+    MICRO,
+    SpanSet,
+    agreement,
+    overlap_matrix,
+    overlapping_pairs,
+    pairwise_f1,
+    span_set,
+)
+from sherpa_streamlit.docview import documents_from_json
+
+TEXT = "x" * 40
+
+
+def doc_json(*spans):
+    return {
+        "text": TEXT,
+        "annotations": [
+            {"start": s, "end": e, "labelName": label, "text": TEXT[s:e]} for s, e, label in spans
+        ],
+    }
+
+
+def doc(*spans) -> AnnotatedDocument:
+    return AnnotatedDocument.from_dict(doc_json(*spans))
+
+
+REFERENCE = doc((0, 5, "person"), (10, 15, "place"), (20, 25, "org"))
+# identical person, partial place, org seen as a location, one extra person
+CANDIDATE = doc((0, 5, "person"), (12, 18, "place"), (21, 23, "location"), (30, 35, "person"))
+EMPTY = AnnotatedDocument(text=TEXT)
+
+
+def scores(reference, candidate, mode="exact"):
+    return {s.label: (s.precision, s.recall, s.f1) for s in agreement(reference, candidate, mode)}
+
+
+def test_span_sets_of_models_and_views_match():
+    (view,) = documents_from_json(json.dumps([doc_json((0, 5, "person"), (10, 15, "place"))]).encode())
+    model, lazy = span_set(doc((0, 5, "person"), (10, 15, "place"))), span_set(view)
+    for a, b in zip(model, lazy):
+        assert a.tolist() == b.tolist()
+    assert [len(a) for a in span_set(EMPTY)] == [0, 0, 0]
+
+
+def test_identical_spans_agree():
+    assert scores(REFERENCE, REFERENCE) == {
+        "org": (1.0, 1.0, 1.0), "person": (1.0, 1.0, 1.0), "place": (1.0, 1.0, 1.0), MICRO: (1.0, 1.0, 1.0)
+    }
+
+
+def test_disjoint_spans_do_not_agree():
+    disjoint = doc((5, 10, "person"), (15, 20, "place"), (25, 30, "org"))
+    rows, cols = overlapping_pairs(span_set(REFERENCE), span_set(disjoint))
+    assert len(rows) == len(cols) == 0
+    for mode in ("exact", "overlap"):
+        assert scores(REFERENCE, disjoint, mode)[MICRO] == (0.0, 0.0, 0.0)
+
+
+def test_partial_overlaps():
+    exact = scores(REFERENCE, CANDIDATE)
+    assert exact["person"] == pytest.approx((1 / 2, 1.0, 2 / 3))
+    assert exact["place"] == (0.0, 0.0, 0.0)
+    # 1 of 4 candidates and 1 of 3 references match
+    assert exact[MICRO] == pytest.approx((1 / 4, 1 / 3, 2 / 7))
+    overlap = scores(REFERENCE, CANDIDATE, "overlap")
+    assert overlap["place"] == (1.0, 1.0, 1.0)
+    # labels must still be equal
+    assert overlap["org"] == overlap["location"] == (0.0, 0.0, 0.0)
+    assert overlap[MICRO] == pytest.approx((2 / 4, 2 / 3, 4 / 7))
+    with pytest.raises(ValueError):
+        agreement(REFERENCE, CANDIDATE, "fuzzy")
+
+
+def test_overlap_matrix_counts_pairs_by_labels():
+    ref_labels, cand_labels, matrix = overlap_matrix(REFERENCE, CANDIDATE)
+    assert ref_labels == ["org", "person", "place"]
+    assert cand_labels == ["location", "person", "place"]
+    assert matrix.tolist() == [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+def test_annotator_without_annotations():
+    assert scores(REFERENCE, EMPTY)[MICRO] == (0.0, 0.0, 0.0)
+    assert scores(EMPTY, EMPTY) == {MICRO: (0.0, 0.0, 0.0)}
+    ref_labels, cand_labels, matrix = overlap_matrix(REFERENCE, EMPTY)
+    assert (ref_labels, cand_labels, matrix.shape) == (["org", "person", "place"], [], (3, 0))
+    names, f1 = pairwise_f1({"reference": REFERENCE, "candidate": CANDIDATE, "empty": EMPTY})
+    assert names == ["reference", "candidate", "empty"]
+    assert f1 == pytest.approx(np.array([[1, 2 / 7, 0], [2 / 7, 1, 0], [0, 0, 1]]))
+
+
+def test_overlapping_pairs_match_brute_force():
+    rng = np.random.default_rng(0)
+
+    def spans(n):
+        starts = rng.integers(0, 1000, n)
+        return SpanSet(starts, starts + rng.integers(1, 30, n), np.array(["a"] * n, dtype=object))
+
+    reference, candidate = spans(300), spans(200)
+    expected = {
+        (i, j)
+        for i in range(300)
+        for j in range(200)
+        if reference.starts[i] < candidate.ends[j] and candidate.starts[j] < reference.ends[i]
+    }
+    for block in (1, 7, 1024):
+        rows, cols = overlapping_pairs(reference, candidate, block=block)
+        assert set(zip(rows.tolist(), cols.tolist())) == expected
+        assert len(rows) == len(expected)
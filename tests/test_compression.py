@@ -0,0 +1,106 @@
+import gzip
+from io import BytesIO
+
+import httpx
+import pytest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from sherpa_streamlit.compression import (
+    compress_request,
+    is_compressible,
+    learn_request_encodings,
+    request_encoding,
+)
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+from stub_server import StubSherpaServer, synthetic_text
+
+TEXT = synthetic_text(50000)
+
+
+def test_compressed_body_is_streamed_and_can_be_resent():
+    request = {"content": TEXT, "headers": {"Content-Type": "text/plain"}}
+    compressed = compress_request(request, "gzip")
+    assert compressed["headers"]["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in request["headers"]
+    body = compressed["content"]
+    chunks = list(body)
+    assert len(chunks) > 1
+    assert body.size == sum(len(c) for c in chunks) < len(TEXT)
+    assert gzip.decompress(b"".join(chunks)).decode("utf-8") == TEXT
+    # sent again after a 401 or a 415: compressed again from the start
+    assert b"".join(body) == b"".join(chunks)
+
+
+def test_only_textual_content_is_compressible():
+    assert is_compressible({"content": b"{}", "headers": {"Content-Type": "application/json"}})
+    assert is_compressible({"content": "text", "headers": {"content-type": "text/plain; charset=utf-8"}})
+    assert not is_compressible({"content": b"%PDF", "headers": {"Content-Type": "application/pdf"}})
+    assert not is_compressible({"content": b"data", "headers": {}})
+    assert not is_compressible({"files": {"file": ("a.pdf", BytesIO(b"%PDF"))}, "headers": {}})
+
+
+def test_request_encodings_are_learned_per_server():
+    def response(header):
+        return httpx.Response(200, headers={"Accept-Encoding": header} if header else {})
+
+    learn_request_encodings("http://one", response(None))
+    assert request_encoding("http://one") is None
+    learn_request_encodings("http://one", response("br, gzip"))
+    assert request_encoding("http://one") == "gzip"
+    learn_request_encodings("http://two", response("gzip;q=0, identity"))
+    assert request_encoding("http://two") is None
+    assert request_encoding("http://one") == "gzip"
+
+
+def client_for(server: StubSherpaServer, **kwargs) -> StreamlitSherpaClient:
+    client = StreamlitSherpaClient(server.url, "user", "password", token_store=None, **kwargs)
+    # not counting the login
+    server.reset_counters()
+    return client
+
+
+def test_bodies_compressed_once_the_server_accepts_them(stub):
+    client = client_for(stub)
+    project = stub.project_names()[0]
+    # nothing is known of the server before its first response
+    client.annotate_text(project, f"{project}_model_0", TEXT)
+    assert dict(stub.request_encodings) == {"identity": 1}
+    doc = client.annotate_text(project, f"{project}_model_0", TEXT)
+    assert doc.text == TEXT
+    assert dict(stub.request_encodings) == {"identity": 1, "zstd" if zstandard else "gzip": 1}
+    # small bodies are sent as is
+    client.annotate_text(project, f"{project}_model_0", "short")
+    assert stub.request_encodings["identity"] == 2
+
+
+def test_compressed_body_rejected_with_415_is_resent_uncompressed():
+    with StubSherpaServer(reject_compressed=True) as server:
+        client = client_for(server, compression="gzip")
+        project = server.project_names()[0]
+        for _ in range(2):
+            assert client.annotate_text(project, f"{project}_model_0", TEXT).text == TEXT
+        # compressed once, then the endpoint is sent uncompressed
+        assert dict(server.request_encodings) == {"identity": 2}
+        assert server.requests["POST /projects/*/annotators/*/_annotate"] == 2
+        assert client.uncompressed_endpoints == {"annotate_text_with"}
+
+
+def test_multipart_uploads_are_not_compressed(stub):
+    client = client_for(stub, compression="gzip", compress_threshold=0)
+    project = stub.project_names()[0]
+    upload = BytesIO(TEXT.encode("utf-8"))
+    upload.name = "large.txt"
+    client.annotate_binary(project, f"{project}_plan_0", upload)
+    assert set(stub.request_encodings) == {"identity"}
+
+
+@pytest.mark.parametrize("threshold", [1024, None])
+def test_gzip_responses_are_decoded(threshold):
+    with StubSherpaServer(gzip_threshold=threshold) as server:
+        client = client_for(server)
+        project = server.project_names()[0]
+        assert client.annotate_text(project, f"{project}_model_0", TEXT).text == TEXT
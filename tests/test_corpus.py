@@ -0,0 +1,73 @@
+import pytest
+from sherpa_client.models import SherpaJobBeanStatus
+
+from sherpa_streamlit.corpus import CorpusOrchestrator, CorpusTask
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+from stub_server import StubSherpaServer
+
+COMPLETED = SherpaJobBeanStatus.COMPLETED.value
+FAILED = SherpaJobBeanStatus.FAILED.value
+
+
+def orchestrator(server: StubSherpaServer, **kwargs) -> CorpusOrchestrator:
+    client = StreamlitSherpaClient(server.url, "user", "password", token_store=None)
+    kwargs = dict(dict(poll_interval=0.01, retry_delay=0.0), **kwargs)
+    return CorpusOrchestrator(client, **kwargs)
+
+
+def tasks(server: StubSherpaServer, count: int):
+    return [CorpusTask(name, f"{name}_model_0", name) for name in server.project_names()[:count]]
+
+
+def test_jobs_complete_with_document_counts(stub):
+    summary = orchestrator(stub, max_concurrent=2).run(tasks(stub, 3))
+    assert [r.status for r in summary.records] == [COMPLETED] * 3
+    assert [r.attempts for r in summary.records] == [1, 1, 1]
+    # documents of the projects, not steps of the jobs
+    assert summary.documents == 300
+    assert stub.requests["POST /projects/*/annotators/*/_annotate_corpus"] == 3
+
+
+def test_failed_jobs_are_retried():
+    with StubSherpaServer(failing_jobs=2) as server:
+        summary = orchestrator(server, max_retries=1).run(tasks(server, 1))
+    (record,) = summary.records
+    assert record.attempts == 2
+    assert record.status == FAILED
+    assert summary.failed == [record]
+    with StubSherpaServer(failing_jobs=1) as server:
+        summary = orchestrator(server, max_retries=1).run(tasks(server, 1))
+    assert [(r.attempts, r.status) for r in summary.records] == [(2, COMPLETED)]
+
+
+@pytest.mark.parametrize("errors, attempts, status", [(2, 1, COMPLETED), (10, 2, FAILED)])
+def test_polling_errors_back_off_then_fail_the_job(stub, errors, attempts, status):
+    orch = orchestrator(stub, max_retries=1, max_poll_failures=3)
+    get_job = orch.client.get_job
+    polls = []
+
+    def flaky_get_job(project, job_id):
+        polls.append(job_id)
+        if len(polls) <= errors:
+            raise ConnectionError("server unreachable")
+        return get_job(project, job_id)
+
+    orch.client.get_job = flaky_get_job
+    (record,) = orch.run(tasks(stub, 1)).records
+    assert (record.attempts, record.status) == (attempts, status)
+    if status == FAILED:
+        # each attempt gives up after three polling errors in a row
+        assert len(polls) == 6
+        assert "could not be polled 3 times" in record.error
+
+
+def test_counting_documents_never_fails_a_completed_job(stub):
+    orch = orchestrator(stub)
+
+    def unreachable(project):
+        raise ConnectionError("server unreachable")
+
+    orch.client.get_project_by_name = unreachable
+    summary = orch.run(tasks(stub, 1))
+    assert [(r.status, r.documents) for r in summary.records] == [(COMPLETED, None)]
+    assert summary.documents == 0
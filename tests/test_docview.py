@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from sherpa_client.models import AnnotatedDocument
+from sherpa_client.types import Unset
+
+from sherpa_streamlit.docview import (
+    AnnotatedDocumentView,
+    Span,
+    SpanArray,
+    annotation_index,
+    documents_from_json,
+    to_annotated_document,
+)
+
+TEXT = "Acme Corp hired John Smith in Paris."
+DOC = {
+    "identifier": "doc1",
+    "title": "Hiring",
+    "text": TEXT,
+    "metadata": {"source": "news"},
+    "annotations": [
+        {"start": 0, "end": 9, "labelName": "org", "label": "Organization", "text": "Acme Corp", "score": 0.9},
+        {"start": 16, "end": 26, "labelName": "person", "label": "Person", "text": "John Smith"},
+        {"start": 16, "end": 20, "labelName": "first", "text": "John"},
+        {"start": 30, "end": 35, "labelName": "place", "text": "Paris"},
+    ],
+    "categories": [{"labelName": "business", "label": "Business", "score": 0.75}],
+    "sentences": [{"start": 0, "end": 36}],
+}
+
+
+def spans(models):
+    return [
+        (getattr(m, "start", None), getattr(m, "end", None), m.label_name, m.label, m.score)
+        for m in models
+    ]
+
+
+def test_lazy_view_matches_the_models():
+    (view,) = documents_from_json(json.dumps(DOC).encode("utf-8"))
+    doc = AnnotatedDocument.from_dict(DOC)
+    assert (view.text, view.identifier, view.title) == (doc.text, doc.identifier, doc.title)
+    assert view.metadata == {"source": "news"}
+    for lazy, models in ((view.annotations, doc.annotations), (view.categories, doc.categories)):
+        expected = [
+            tuple(None if isinstance(v, Unset) else v for v in span) for span in spans(models)
+        ]
+        assert [tuple(s) for s in lazy] == expected
+        assert [lazy[i] for i in range(len(lazy))] == list(lazy)
+        assert lazy.to_models() == models
+        assert lazy.model_at(0) == models[0]
+    assert [(s.start, s.end) for s in view.sentences] == [(s.start, s.end) for s in doc.sentences]
+    assert view.to_annotated_document() == doc
+    assert to_annotated_document(view) is view.to_annotated_document()
+    assert to_annotated_document(doc) is doc
+
+
+def test_span_arrays_keep_offsets_in_arrays():
+    annotations = AnnotatedDocumentView(DOC).annotations
+    assert list(annotations.starts) == [0, 16, 16, 30]
+    assert list(annotations.ends) == [9, 26, 20, 35]
+    assert annotations[1] == Span(16, 26, "person", "Person", None)
+    part = annotations[1:3]
+    assert isinstance(part, SpanArray) and list(part.starts) == [16, 16]
+    assert annotations[-1].label_name == "place"
+
+
+def test_annotation_indexes_of_views_and_models_agree():
+    view, doc = AnnotatedDocumentView(DOC), AnnotatedDocument.from_dict(DOC)
+    assert annotation_index(view) is annotation_index(view)
+    assert list(annotation_index(view).order) == list(annotation_index(doc).order) == [0, 1, 2, 3]
+    assert annotation_index(view).covering(17) == annotation_index(doc).covering(17) == [1, 2]
+    assert annotation_index(view).overlapping(5, 31) == annotation_index(doc).overlapping(5, 31) == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("content", [json.dumps([DOC, {"text": "empty"}]), json.dumps({"text": "empty"})])
+def test_documents_without_spans(content):
+    view = documents_from_json(content)[-1]
+    assert view.text == "empty"
+    assert len(view.annotations) == len(view.categories) == len(view.sentences) == 0
+    assert view.identifier is None and view.metadata is None
+    assert len(annotation_index(view)) == 0
+    assert len(annotation_index(AnnotatedDocument.from_dict({"text": "empty"}))) == 0
+    assert repr(view) == "AnnotatedDocumentView(text=5 chars, annotations=0, categories=0)"
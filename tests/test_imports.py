@@ -0,0 +1,29 @@
+import json
+import subprocess
+import sys
+
+from run_benchmarks import BUDGETS, HEAVY_MODULES
+
+IMPORT = """
+import json, sys, time
+start = time.perf_counter()
+import sherpa_streamlit
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(m for m in %r if m in sys.modules)}))
+"""
+
+
+def import_package() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT % (HEAVY_MODULES,)], check=True, capture_output=True, text=True
+    )
+    return json.loads(out.stdout)
+
+
+def test_import_does_not_load_visualizer_dependencies():
+    assert import_package()["modules"] == []
+
+
+def test_import_time_within_budget():
+    seconds = min(import_package()["seconds"] for _ in range(3))
+    assert seconds <= BUDGETS["import.core.seconds"]
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from sherpa_streamlit.intervals import IntervalIndex
+
+
+def brute_force(starts, ends, start, end):
+    found = [i for i in range(len(starts)) if starts[i] < end and ends[i] > start and ends[i] > starts[i]]
+    return sorted(found, key=lambda i: (starts[i], -ends[i]))
+
+
+def test_covering_returns_outermost_first():
+    starts = [10, 0, 12, 30, 0]
+    ends = [20, 50, 15, 40, 5]
+    index = IntervalIndex(starts, ends)
+    assert len(index) == 5
+    assert index.covering(13) == [1, 0, 2]
+    assert index.covering(20) == [1]
+    assert index.covering(2) == [1, 4]
+    assert index.covering(50) == []
+
+
+def test_overlapping_ranges_are_half_open():
+    index = IntervalIndex([0, 10, 20], [10, 20, 30])
+    assert index.overlapping(10, 20) == [1]
+    assert index.overlapping(9, 21) == [0, 1, 2]
+    assert index.overlapping(30, 40) == []
+
+
+def test_empty_spans_and_index():
+    assert IntervalIndex([], []).overlapping(0, 100) == []
+    assert IntervalIndex([5], [5]).covering(5) == []
+    with pytest.raises(ValueError):
+        IntervalIndex([0, 1], [2])
+
+
+def test_queries_match_brute_force():
+    rng = random.Random(7)
+    starts = [rng.randrange(10000) for _ in range(2000)]
+    ends = [s + rng.randrange(1, 200) for s in starts]
+    index = IntervalIndex(starts, ends)
+    for _ in range(200):
+        start = rng.randrange(10300)
+        end = start + rng.randrange(1, 300)
+        assert index.overlapping(start, end) == brute_force(starts, ends, start, end)
+        assert index.covering(start) == brute_force(starts, ends, start, start + 1)
@@ -0,0 +1,93 @@
+import math
+import urllib.request
+
+import pytest
+
+from sherpa_streamlit.metrics import Gauge, Metric, MetricsRegistry, Sample, render_text, start_http_server, timed
+
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        Metric("metric")
+
+
+def test_counter_and_gauge_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests")
+    counter.inc(endpoint="a", status=200)
+    # label order does not matter and values are strings
+    counter.inc(2, status="200", endpoint="a")
+    counter.inc(endpoint="b", status=500)
+    counter.inc()
+    assert counter.get(endpoint="a", status=200) == 3
+    assert counter.get(endpoint="b", status="500") == 1
+    assert counter.get() == 1
+    assert counter.get(endpoint="c") == 0
+    assert registry.counter("requests_total") is counter
+    gauge = registry.gauge("bytes")
+    gauge.set(10, cache="a")
+    gauge.set(4, cache="a")
+    gauge.inc(cache="a")
+    assert gauge.get(cache="a") == 5
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("seconds", buckets=(0.1, 1.0, math.inf))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, method="get")
+    histogram.observe(0.01, method="put")
+    assert histogram.count(method="get") == 4
+    assert histogram.sum(method="get") == pytest.approx(6.05)
+    assert histogram.count(method="delete") == 0
+    buckets = {s.labels: s.value for s in histogram.samples() if s.name == "seconds_bucket"}
+    assert buckets[(("method", "get"), ("le", "0.1"))] == 1
+    assert buckets[(("method", "get"), ("le", "1.0"))] == 3
+    assert buckets[(("method", "get"), ("le", "+Inf"))] == 4
+    assert buckets[(("method", "put"), ("le", "0.1"))] == 1
+
+
+def test_text_exposition():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests sent").inc(endpoint='say "hi"\\n')
+    registry.histogram("seconds", buckets=(1.0, math.inf)).observe(0.5)
+    registry.add_collector(lambda: [(Gauge("entries", "Cache entries"), [Sample("entries", (("cache", "a"),), 3)])])
+    assert render_text(registry) == (
+        "# HELP requests_total Requests sent\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{endpoint="say \\"hi\\"\\\\n"} 1.0\n'
+        "# TYPE seconds histogram\n"
+        'seconds_bucket{le="1.0"} 1.0\n'
+        'seconds_bucket{le="+Inf"} 1.0\n'
+        "seconds_count 1.0\n"
+        "seconds_sum 0.5\n"
+        "# HELP entries Cache entries\n"
+        "# TYPE entries gauge\n"
+        'entries{cache="a"} 3\n'
+    )
+    assert registry.snapshot() == {
+        'requests_total{endpoint="say \\"hi\\"\\\\n"}': 1.0,
+        "seconds_count": 1.0,
+        "seconds_sum": 0.5,
+        'entries{cache="a"}': 3,
+    }
+
+
+def test_timed_and_http_exposition():
+    registry = MetricsRegistry()
+
+    @timed("call_seconds", registry, client="test")
+    def call(x):
+        return x * 2
+
+    assert call(2) == 4
+    assert registry.histogram("call_seconds").count(method="call", client="test") == 1
+    server = start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode("utf-8") == render_text(registry)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,69 @@
+import pstats
+import time
+import tracemalloc
+
+import pytest
+
+from sherpa_streamlit import visualizer
+from sherpa_streamlit.profiling import PHASES, RerunProfiler
+
+from test_visualizer import run_session
+
+APP = """
+import sherpa_streamlit
+
+sherpa_streamlit.visualize(show_connection=False, background=False, profile=True)
+"""
+
+
+def test_phases_record_time_and_allocations():
+    with RerunProfiler() as profiler:
+        with profiler.phase("connect"):
+            time.sleep(0.01)
+        with profiler.phase("sample"):
+            data = [bytes(1024) for _ in range(100)]
+        with pytest.raises(ValueError), profiler.phase("render"):
+            raise ValueError("recorded anyway")
+    assert [r.phase for r in profiler.records] == ["connect", "sample", "render"]
+    connect, sample, _ = profiler.records
+    assert connect.seconds >= 0.01
+    assert sample.allocated_bytes >= 100 * 1024 and sample.peak_bytes >= sample.allocated_bytes
+    assert profiler.total_seconds >= connect.seconds
+    # tracing started by the profiler is stopped with it
+    assert not tracemalloc.is_tracing()
+    assert profiler.dumped == [] and data
+
+
+def test_disabled_profiler_records_nothing(tmp_path):
+    profiler = RerunProfiler(enabled=False, dump_dir=tmp_path)
+    with profiler, profiler.phase("connect"):
+        pass
+    assert profiler.records == [] and profiler.total_seconds == 0.0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiles_and_snapshots_are_dumped(tmp_path):
+    with RerunProfiler(dump_dir=tmp_path / "profiles") as profiler:
+        with profiler.phase("annotate"):
+            sorted(range(1000), reverse=True)
+    prof, snapshot = profiler.dumped
+    assert prof.suffix == ".prof" and snapshot.suffix == ".tracemalloc"
+    assert any("sorted" in name[2] for name in pstats.Stats(str(prof)).stats)
+    assert tracemalloc.Snapshot.load(str(snapshot)).traces
+
+
+def test_visualize_records_each_phase_once(stub, tmp_path, monkeypatch):
+    profilers = []
+    monkeypatch.setattr(visualizer, "visualize_profile", profilers.append)
+    monkeypatch.setattr(
+        visualizer.st.secrets,
+        "_secrets",
+        {"sherpa_credentials": {"url": stub.url, "username": "u", "password": "p"}},
+    )
+    script = tmp_path / "app.py"
+    script.write_text(APP)
+    run = run_session(str(script))
+    assert run.exceptions == []
+    phases = [r.phase for r in profilers[-1].records]
+    assert {"connect", "projects", "project", "annotators", "annotator"} <= set(phases)
+    assert len(phases) == len(set(phases)) and set(phases) <= set(PHASES)
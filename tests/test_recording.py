@@ -0,0 +1,62 @@
+import gzip
+
+import httpx
+
+from sherpa_streamlit.recording import (
+    REDACTED,
+    TraceRecorder,
+    TraceReplayServer,
+    load_trace,
+    redact_body,
+    redact_query,
+)
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+
+SECRET = "s3cret-value"
+
+
+def test_secret_query_parameters_and_fields_are_redacted():
+    query = redact_query([("api_key", SECRET), ("access_token", SECRET), ("name", "project")])
+    assert query == [("api_key", REDACTED), ("access_token", REDACTED), ("name", "project")]
+    body = redact_body(f'{{"password": "{SECRET}", "accessToken": "a\\"{SECRET}", "name": "n"}}'.encode())
+    assert SECRET.encode() not in body
+    assert body == b'{"password": "***", "accessToken": "***", "name": "n"}'
+
+
+def test_trace_holds_no_secrets(tmp_path):
+    path = tmp_path / "trace.jsonl.gz"
+    response = httpx.Response(
+        200,
+        json={"name": "project", "token": SECRET, "nested": {"client_secret": SECRET}},
+        headers={"Set-Cookie": f"session={SECRET}"},
+    )
+    request = {
+        "method": "get",
+        "url": "http://sherpa/api/projects",
+        "params": {"apiKey": SECRET, "name": "project"},
+        "headers": {"Authorization": f"Bearer {SECRET}"},
+    }
+    with TraceRecorder(path) as recorder:
+        recorder.record("get_projects", request, response, 0.01, 0, len(response.content))
+    raw = gzip.decompress(path.read_bytes()).decode("utf-8")
+    assert SECRET not in raw
+    trace = load_trace(path)
+    (call,) = trace.calls
+    assert call["query"] == [["apiKey", REDACTED], ["name", "project"]]
+    assert b'"name": "project"' in trace.body(call)
+
+
+def test_recorded_session_is_replayed(stub, tmp_path):
+    path = tmp_path / "trace.jsonl.gz"
+    with TraceRecorder(path) as recorder:
+        client = StreamlitSherpaClient(stub.url, "user", "password", token_store=None, recorder=recorder)
+        projects = client.get_projects()
+    trace = load_trace(path)
+    assert trace.header["trace"] == 1
+    assert [c["endpoint"] for c in trace.calls] == ["get_projects"]
+    assert "password" not in gzip.decompress(path.read_bytes()).decode("utf-8")
+    with TraceReplayServer(trace, latency_scale=0.0) as server:
+        replayed = StreamlitSherpaClient(server.url, "user", "password", token_store=None)
+        assert [p.name for p in replayed.get_projects()] == [p.name for p in projects]
+        assert server.served == 1
+        assert not server.misses
@@ -0,0 +1,91 @@
+import time
+
+from sherpa_streamlit.samples import Sample, SamplePool, sample_pool
+from sherpa_streamlit.sherpa import StreamlitSherpaClient
+
+SAMPLE = "POST /projects/*/documents/_sample"
+
+
+class ScriptedClient:
+    """Stands for a client: returns the next batch of documents on each call."""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.calls = 0
+
+    def get_samples(self, project, size):
+        self.calls += 1
+        batch = self.batches.pop(0) if self.batches else []
+        return [{"identifier": i, "title": f"Title {i}", "text": f"Text {i}"} for i in batch]
+
+
+def wait_for_refill(pool: SamplePool):
+    deadline = time.monotonic() + 5
+    while pool._refilling and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not pool._refilling
+
+
+def test_samples_are_served_in_rotation():
+    pool = SamplePool(ScriptedClient(["a", "b", "c"]), "project", size=3, low_water=0)
+    assert [pool.next().identifier for _ in range(5)] == ["a", "b", "c", "a", "b"]
+    assert pool.next() == Sample("c", "Title c", "Text c")
+    assert len(pool) == 3
+    assert pool.random().identifier in {"a", "b", "c"}
+    assert pool.client.calls == 1
+
+
+def test_samples_are_deduplicated_by_identifier():
+    pool = SamplePool(ScriptedClient(["a", "a", "b", None, None], ["b", "c"]), "project", low_water=0)
+    assert pool.fill() == 4
+    # documents without identifier are never considered duplicates
+    assert [s.identifier for s in pool.unseen] == ["a", "b", None, None]
+    assert pool.fill() == 1
+    assert not pool.exhausted
+
+
+def test_batches_without_new_samples_exhaust_the_pool():
+    pool = SamplePool(ScriptedClient(["a", "b"], ["a", "b"]), "project", size=2, low_water=2)
+    pool.fill()
+    assert pool.next().identifier == "a"
+    wait_for_refill(pool)
+    assert pool.exhausted
+    assert pool.client.calls == 2
+    # no more refills once exhausted
+    pool.next()
+    wait_for_refill(pool)
+    assert pool.client.calls == 2
+
+
+def test_low_water_refills_in_the_background(stub):
+    client = StreamlitSherpaClient(stub.url, "user", "password", token_store=None)
+    project = stub.project_names()[0]
+    pool = SamplePool(client, project, size=4, low_water=2)
+    first = pool.next()
+    assert stub.requests[SAMPLE] == 1
+    assert first.identifier == f"{project}_doc_0" and first.text
+    pool.next()
+    wait_for_refill(pool)
+    assert stub.requests[SAMPLE] == 1
+    pool.next()
+    wait_for_refill(pool)
+    assert stub.requests[SAMPLE] == 2
+    # the stub always answers the same documents
+    assert pool.exhausted and len(pool) == 4
+
+    scripted = SamplePool(ScriptedClient(["a", "b", "c", "d"], ["e", "f"]), "project", size=4, low_water=2)
+    assert [scripted.next().identifier for _ in range(3)] == ["a", "b", "c"]
+    wait_for_refill(scripted)
+    assert [s.identifier for s in scripted.unseen] == ["d", "e", "f"]
+
+
+def test_pools_are_shared_by_logins_only(stub):
+    project = stub.project_names()[0]
+    alice = StreamlitSherpaClient(stub.url, "alice", "password", token_store=None)
+    bob = StreamlitSherpaClient(stub.url, "bob", "password", token_store=None)
+    pool = sample_pool(alice, project)
+    assert sample_pool(bob, project) is not pool
+    # another session of the same login shares the pool and refills it with its client
+    again = StreamlitSherpaClient(stub.url, "alice", "password", token_store=None)
+    assert sample_pool(again, project) is pool
+    assert pool.client is again
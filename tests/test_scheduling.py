@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import pytest
+
+from sherpa_streamlit.background import TaskQueue
+from sherpa_streamlit.batch import Batch
+from sherpa_streamlit.scheduling import (
+    ANNOTATE,
+    BATCH,
+    INTERACTIVE,
+    METADATA,
+    RequestScheduler,
+    TokenBucket,
+    current_lane,
+    endpoint_class,
+    in_current_context,
+    lane,
+)
+
+
+def test_endpoint_classes():
+    assert endpoint_class("annotate_text_with") == ANNOTATE
+    assert endpoint_class("get_projects") == METADATA
+    assert endpoint_class("launch_document_import") == "import"
+
+
+def test_lane_is_scoped():
+    assert current_lane() == INTERACTIVE
+    with lane(BATCH):
+        assert current_lane() == BATCH
+        with lane(INTERACTIVE):
+            assert current_lane() == INTERACTIVE
+        assert current_lane() == BATCH
+    assert current_lane() == INTERACTIVE
+    with pytest.raises(ValueError):
+        with lane("urgent"):
+            pass
+
+
+def test_lane_follows_work_into_executors():
+    with ThreadPoolExecutor(2) as pool, lane(BATCH):
+        assert pool.submit(current_lane).result() == INTERACTIVE
+        assert list(pool.map(in_current_context(lambda _: current_lane()), range(4))) == [BATCH] * 4
+    with lane(BATCH):
+        task = TaskQueue().submit(current_lane)
+        batch = Batch()
+        item = batch.submit("file", current_lane)
+    assert task.future.result() == BATCH
+    while item.finished is None:
+        sleep(0.01)
+    assert item.result == BATCH
+
+
+def test_token_bucket_allows_bursts_then_the_rate():
+    bucket = TokenBucket(rate=2.0, burst=3)
+    now = bucket.updated
+    assert [bucket.try_take(now) for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert not bucket.try_take(now + 0.25)
+    assert bucket.try_take(now + 0.5)
+    # refills up to the burst only
+    assert bucket.wait_time(now + 100) == 0.0
+    assert bucket.tokens == 3
+
+
+def test_batch_lane_leaves_slots_to_interactive_requests():
+    scheduler = RequestScheduler(max_concurrent=3, interactive_reserve=2)
+    assert scheduler._capacity(INTERACTIVE) == 3
+    assert scheduler._capacity(BATCH) == 1
+
+
+def test_waiting_interactive_requests_go_before_batch_ones():
+    scheduler = RequestScheduler(max_concurrent=1, interactive_reserve=0)
+    order = []
+
+    def request(lane_name):
+        with scheduler.slot(ANNOTATE, lane_name):
+            order.append(lane_name)
+
+    with scheduler.slot(ANNOTATE):
+        threads = [threading.Thread(target=request, args=(BATCH,))]
+        threads[0].start()
+        while len(scheduler.waiting) < 1:
+            sleep(0.01)
+        threads.append(threading.Thread(target=request, args=(INTERACTIVE,)))
+        threads[1].start()
+        while len(scheduler.waiting) < 2:
+            sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, BATCH]
+    assert scheduler.active == 0
@@ -0,0 +1,89 @@
+import json
+import re
+
+from sherpa_client.models import AnnotatedDocument
+
+from sherpa_streamlit.docview import documents_from_json
+from sherpa_streamlit.search import DocumentIndex, Hit, document_index
+from sherpa_streamlit.util import highlight_html, highlight_listener_html
+
+TEXT = "Acme Corp hired acme corporation staff. The Acme corp board met at Acmes."
+
+
+def doc_json(text, *spans):
+    return {
+        "text": text,
+        "annotations": [
+            {"start": s, "end": e, "labelName": label, "text": text[s:e]} for s, e, label in spans
+        ],
+    }
+
+
+DOC = doc_json(TEXT, (44, 53, "ORG"), (0, 9, "ORG"), (16, 32, "ORG"), (67, 72, "PLACE"))
+
+
+def expected(pattern, text=TEXT, length=None):
+    return [Hit(m.start(), m.start() + (length or len(m.group()))) for m in re.finditer(pattern, text, re.IGNORECASE)]
+
+
+def test_words_match_by_prefix():
+    index = DocumentIndex(AnnotatedDocument.from_dict(DOC))
+    assert index.find("acm") == expected(r"\bacm") and len(index.find("acm")) == 4
+    assert index.find("ACME") == expected(r"\bacme")
+    # at word starts only
+    assert index.find("cme") == []
+    assert index.find("zzz") == []
+
+
+def test_multi_word_queries():
+    index = DocumentIndex(AnnotatedDocument.from_dict(DOC))
+    assert index.find("acme corp") == expected(r"\bacme corp") == [Hit(0, 9), Hit(16, 25), Hit(44, 53)]
+    assert index.find("Corp hired") == [Hit(5, 15)]
+    assert index.find("cme corp") == []
+    assert index.find("  ") == []
+
+
+def test_case_folding_that_changes_lengths_falls_back_to_a_scan():
+    text = "İstanbul is not istanbul, ISTANBUL is."
+    index = DocumentIndex(AnnotatedDocument.from_dict(doc_json(text)))
+    # "İ".lower() is two characters, offsets of the lowered text would be wrong
+    assert index._lower is None
+    hits = index.find("istanbul")
+    assert hits == [Hit(0, 8), Hit(16, 24), Hit(26, 34)]
+    assert [text[h.start : h.end].casefold() for h in hits] == ["i̇stanbul", "istanbul", "istanbul"]
+    assert index.find("İstanbul") == hits
+
+
+def test_labels_and_surface_forms():
+    index = DocumentIndex(AnnotatedDocument.from_dict(DOC))
+    assert index.label_hits("ORG") == [Hit(0, 9), Hit(16, 32), Hit(44, 53)]
+    assert index.label_hits("PERSON") == []
+    assert index.surface_hits("ACME  corp") == [Hit(0, 9), Hit(44, 53)]
+
+
+def test_navigation_wraps_around():
+    hits = DocumentIndex(AnnotatedDocument.from_dict(DOC)).find("acme")
+    assert DocumentIndex.next_hit(hits, -1) == hits[0]
+    assert DocumentIndex.next_hit(hits, hits[0].start) == hits[1]
+    assert DocumentIndex.next_hit(hits, hits[-1].start) == hits[0]
+    assert DocumentIndex.previous_hit(hits, hits[1].start) == hits[0]
+    assert DocumentIndex.previous_hit(hits, hits[0].start) == hits[-1]
+    assert DocumentIndex.next_hit([], 0) is None and DocumentIndex.previous_hit([], 0) is None
+
+
+def test_views_keep_their_index():
+    (view,) = documents_from_json(json.dumps([DOC]).encode("utf-8"))
+    index = document_index(view)
+    assert document_index(view) is index
+    assert index.label_hits("ORG") == DocumentIndex(AnnotatedDocument.from_dict(DOC)).label_hits("ORG")
+
+
+def test_hits_are_posted_to_a_stable_document_frame():
+    listener = highlight_listener_html("doc")
+    # the document markup does not depend on the hits
+    assert "sa-ready" in listener and '("doc")' in listener
+    posted = highlight_html([(10, 15), (20, 22)], 1, offset=5, key="doc")
+    message = json.loads(re.search(r"\}\)\((\{.*\})\);</script>$", posted).group(1))
+    assert message == {"type": "sa-highlight", "key": "doc", "hits": [[5, 10], [15, 17]], "current": 1}
+    assert json.loads(re.search(r"\((\{.*\})\);", highlight_html([], key="doc")).group(1))["hits"] == []
+    assert "</script>" not in highlight_html([], key="</script>")[:-len("</script>")]
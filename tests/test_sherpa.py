@@ -0,0 +1,75 @@
+import json
+import time
+from io import BytesIO
+
+import pytest
+from streamlit.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+from sherpa_streamlit.compare import annotate_many
+from sherpa_streamlit.sherpa import StreamlitSherpaClient, file_bytes
+from sherpa_streamlit.visualizer import start_batch, upload_work
+
+DOCS = [{"identifier": "1", "text": "First"}, {"identifier": "2", "text": "Second"}]
+
+
+@pytest.mark.parametrize("wrap", [bytes, bytearray, BytesIO, "path", "str"])
+def test_documents_from_file_inputs(tmp_path, wrap):
+    data = json.dumps(DOCS).encode("utf-8")
+    path = tmp_path / "docs.json"
+    path.write_bytes(data)
+    datafile = {"path": path, "str": str(path)}.get(wrap) or wrap(data)
+    assert file_bytes(datafile) == data
+    assert StreamlitSherpaClient.documents_from_file(datafile) == DOCS
+
+
+def test_single_document_file_is_a_list():
+    stream = BytesIO(json.dumps(DOCS[0]).encode("utf-8"))
+    stream.read()
+    assert StreamlitSherpaClient.documents_from_file(stream) == [DOCS[0]]
+    # rewound for the next reader
+    assert stream.tell() == 0
+
+
+CONVERT = "POST /annotate/_annotate_binary"
+ANNOTATE_BINARY = "POST /projects/*/plans/*/_annotate_binary"
+ANNOTATE_DOCUMENTS = "POST /projects/*/annotators/*/_annotate_documents"
+
+
+def binary_requests(stub):
+    return [stub.requests[CONVERT], stub.requests[ANNOTATE_BINARY], stub.requests[ANNOTATE_DOCUMENTS]]
+
+
+def test_comparisons_convert_a_file_once(stub):
+    client = StreamlitSherpaClient(stub.url, "user", "password", token_store=None)
+    project = stub.project_names()[0]
+    plans = client.get_annotators(project, ("plan",))
+    docs, errors = annotate_many(client, project, plans, binary=b"binary content", file_name="file.pdf")
+    assert not errors and [d.text for d in docs.values()] == ["binary content"] * len(plans)
+    assert binary_requests(stub) == [1, 0, len(plans)]
+    # without reuse_conversion each plan uploads the file
+    for plan in plans:
+        client.annotate_binary(project, plan, BytesIO(b"binary content"))
+    assert binary_requests(stub) == [1, len(plans), len(plans)]
+    client.annotate_binary(project, plans[0], BytesIO(b"binary content"), reuse_conversion=True)
+    assert binary_requests(stub) == [1, len(plans), len(plans) + 1]
+
+
+def test_batches_reuse_conversions(stub):
+    client = StreamlitSherpaClient(stub.url, "user", "password", token_store=None)
+    project = client.get_project_by_name(stub.project_names()[0])
+    first, second = client.get_annotators(project.name, ("plan",))[:2]
+    uploads = [
+        UploadedFile(UploadedFileRec(i, f"file{i}.pdf", "application/pdf", f"content {i}".encode("utf-8")))
+        for i in range(3)
+    ]
+    for plan in (first, second):
+        batch = start_batch(client, project, plan, [], uploads, workers=2)
+        deadline = time.monotonic() + 10
+        while not batch.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [item.status for item in batch.items] == ["done"] * len(uploads)
+        batch.close()
+    assert binary_requests(stub) == [len(uploads), 0, 2 * len(uploads)]
+    # single uploads do not keep their conversion
+    upload_work(client, project, first, [], uploads[0])()
+    assert binary_requests(stub) == [len(uploads), 1, 2 * len(uploads)]
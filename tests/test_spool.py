@@ -0,0 +1,57 @@
+import gc
+import io
+
+import streamlit
+
+from sherpa_streamlit.spool import (
+    SpoolRegistry,
+    file_size,
+    is_on_disk,
+    iter_file,
+    read_all,
+    session_spools,
+    spooled_file,
+)
+
+
+def test_spooled_files_move_to_disk_past_the_threshold():
+    f = spooled_file(threshold=10)
+    f.write(b"0123456789")
+    assert not is_on_disk(f)
+    f.write(b"abc")
+    assert is_on_disk(f)
+    assert file_size(f) == 13 and f.tell() == 13
+    assert b"".join(iter_file(f, chunk_size=4)) == read_all(f) == b"0123456789abc"
+    f.close()
+    assert not is_on_disk(io.BytesIO(b"data"))
+
+
+def test_oldest_files_are_closed_beyond_the_limit():
+    registry = SpoolRegistry(max_files=2)
+    files = [spooled_file() for _ in range(3)]
+    for f in files:
+        assert registry.track(f) is f
+    registry.track(files[2])
+    assert len(registry) == 2 and registry.files == files[1:]
+    assert [f.closed for f in files] == [True, False, False]
+    # results that are not files are returned untouched
+    assert registry.track(b"bytes") == b"bytes" and len(registry) == 2
+    registry.close()
+    assert all(f.closed for f in files) and len(registry) == 0
+
+
+def test_files_are_closed_when_the_registry_is_dropped():
+    registry = SpoolRegistry()
+    f = registry.track(spooled_file())
+    del registry
+    gc.collect()
+    assert f.closed
+
+
+def test_session_spools_are_kept_in_the_session_state(monkeypatch):
+    state = {}
+    monkeypatch.setattr(streamlit, "session_state", state)
+    spools = session_spools()
+    assert state == {"sherpa_spools": spools}
+    assert session_spools() is spools
+    assert session_spools("other") is not spools
@@ -0,0 +1,74 @@
+import tempfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from sherpa_streamlit import tables
+from sherpa_streamlit.tables import (
+    CSV_MIME,
+    TABLES,
+    XLSX_MIME,
+    load_table,
+    payload_digest,
+    sheet_names,
+    table_rows,
+)
+
+CSV = b"label,count\nperson,3\nplace,2\norganization,1\n"
+
+
+def workbook() -> bytes:
+    out = BytesIO()
+    with pd.ExcelWriter(out, engine="openpyxl") as writer:
+        pd.DataFrame({"label": ["person", "place"], "count": [3, 2]}).to_excel(writer, "labels", index=False)
+        pd.DataFrame({"text": ["a", "b", "c"]}).to_excel(writer, "texts", index=False)
+    return out.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    TABLES.clear()
+    yield
+    TABLES.clear()
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_csv_pages(monkeypatch, arrow):
+    if not arrow:
+        monkeypatch.setattr(tables, "pyarrow", None)
+    elif tables.pyarrow is None:
+        pytest.skip("pyarrow is not installed")
+    table = load_table(CSV, CSV_MIME)
+    assert isinstance(table, pd.DataFrame) != arrow
+    page = table_rows(table, 1, 3)
+    assert isinstance(page, pd.DataFrame)
+    assert page["label"].tolist() == ["place", "organization"]
+    assert page["count"].tolist() == [2, 1]
+    assert table_rows(table, 2, 10)["label"].tolist() == ["organization"]
+
+
+def test_sheets_are_parsed_on_demand():
+    data = workbook()
+    assert sheet_names(data) == ["labels", "texts"]
+    assert load_table(data, XLSX_MIME)["label"].tolist() == ["person", "place"]
+    assert load_table(data, XLSX_MIME, sheet="texts")["text"].tolist() == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        load_table(b"{}", "application/json")
+
+
+def test_tables_are_cached_by_payload_digest(monkeypatch):
+    parsed = []
+    read_csv = tables.read_csv
+    monkeypatch.setattr(tables, "read_csv", lambda data: parsed.append(data) or read_csv(data))
+    first = load_table(CSV, CSV_MIME)
+    # the same content in a spooled file is the same table
+    with tempfile.SpooledTemporaryFile() as f:
+        f.write(CSV)
+        assert load_table(f, CSV_MIME) is first
+        digest = payload_digest(f)
+        assert tables._DIGESTS[f] == digest == payload_digest(CSV)
+    assert len(parsed) == 1
+    assert load_table(CSV + b"other,0\n", CSV_MIME) is not first
+    assert len(parsed) == 2
+    assert TABLES.info().currsize == 2
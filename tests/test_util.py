@@ -0,0 +1,48 @@
+import json
+import re
+import shutil
+import subprocess
+
+import pytest
+from sherpa_client.models import Label
+
+from sherpa_streamlit.util import ANNOTATED_TEXT_CSS, label_styles
+
+LABELS = {
+    "person": Label(name="person", label="Person", color="#ff0000"),
+    "org": Label(name="org", label="<b>Org</b> &lt;/script&gt;", color="red;} body{display:none"),
+    "uncoloured": Label(name="uncoloured", label="Uncoloured", color=""),
+}
+
+
+def tooltips(header):
+    return json.loads(re.search(r"<script>var T=(\{.*?\});", header).group(1))
+
+
+def test_one_css_class_per_coloured_label():
+    styles = label_styles(LABELS)
+    assert styles.classes == {"org": "l0", "person": "l1"}
+    assert styles.titles == {"org": "Org </script>", "person": "Person"}
+    css = re.search(r"<style>(.*)</style>", styles.header).group(1)
+    # colours cannot close the rule
+    assert css == ANNOTATED_TEXT_CSS + ".sa-doc .l0{border-color:red bodydisplaynone}.sa-doc .l1{border-color:#ff0000}"
+    assert label_styles(dict(LABELS)) is styles
+    assert label_styles(None).classes == {}
+
+
+def test_tooltips_are_embedded_as_json():
+    styles = label_styles(LABELS)
+    assert tooltips(styles.header) == {"l0": "Org </script>", "l1": "Person"}
+    assert styles.header.count("</script>") == 1 and styles.header.endswith("</script>")
+    assert styles.open_tag("person", "Person") == "<mark class=l1>"
+    assert styles.open_tag("person", 'Person "A"') == '<mark class=l1 data-l="Person &quot;A&quot;">'
+    assert styles.open_tag("uncoloured", "Uncoloured") == '<mark data-l="Uncoloured">'
+    assert styles.wrap("text") == f'{styles.header}<div class="sa-doc">text</div>'
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_tooltip_script_is_valid_javascript():
+    script = re.search(r"<script>(.*)</script>", label_styles(LABELS).header).group(1)
+    subprocess.run(
+        ["node", "-e", "new Function(require('fs').readFileSync(0, 'utf8'))"], input=script, text=True, check=True
+    )
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import List, NamedTuple
+
+import pytest
+import streamlit as st
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.scriptrunner import RerunData, ScriptRunner, ScriptRunnerEvent
+from streamlit.session_data import SessionData
+from streamlit.state.session_state import SessionState
+from streamlit.uploaded_file_manager import UploadedFileManager
+
+from run_benchmarks import BUDGETS
+
+APP = """
+import sherpa_streamlit
+
+sherpa_streamlit.visualize(show_connection=False, background=False)
+"""
+
+
+class ScriptRun(NamedTuple):
+    seconds: float
+    runs: int
+    elements: List[str]
+    exceptions: List[str]
+
+
+def run_session(script: str) -> ScriptRun:
+    """Run a Streamlit script as a new browser session would, until it stops."""
+    stopped = threading.Event()
+    events = []
+    elements = []
+    exceptions = []
+
+    def on_event(sender, event, forward_msg=None, **kwargs):
+        events.append(event)
+        if forward_msg is not None and forward_msg.WhichOneof("type") == "delta":
+            if forward_msg.delta.WhichOneof("type") == "new_element":
+                element = forward_msg.delta.new_element
+                elements.append(element.WhichOneof("type"))
+                if element.WhichOneof("type") == "exception":
+                    exceptions.append(element.exception.message)
+        if event == ScriptRunnerEvent.SHUTDOWN:
+            stopped.set()
+
+    runner = ScriptRunner(
+        session_id="test",
+        session_data=SessionData(script, "streamlit run"),
+        client_state=ClientState(),
+        session_state=SessionState(),
+        uploaded_file_mgr=UploadedFileManager(),
+        initial_rerun_data=RerunData(),
+        user_info={"email": "test@example.com"},
+    )
+    runner.on_event.connect(on_event, weak=False)
+    start = time.perf_counter()
+    runner.start()
+    assert stopped.wait(30), "the script did not finish"
+    return ScriptRun(
+        time.perf_counter() - start,
+        events.count(ScriptRunnerEvent.SCRIPT_STARTED),
+        elements,
+        exceptions,
+    )
+
+
+@pytest.fixture
+def app(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        st.secrets, "_secrets", {"sherpa_credentials": {"url": stub.url, "username": "u", "password": "p"}}
+    )
+    script = tmp_path / "app.py"
+    script.write_text(APP)
+    return str(script)
+
+
+def test_cold_session_first_render_within_budget(app, stub):
+    run = run_session(app)
+    assert run.exceptions == []
+    # the sample text is shown, ready to be annotated
+    assert "text_area" in run.elements
+    # at most one rerun to apply the theme, before any Sherpa call
+    assert run.runs <= 2
+    assert stub.requests["POST /auth/login"] == 1
+    assert run.seconds <= BUDGETS["cold_start.time_to_first_render"]
+
+
+def test_later_sessions_reuse_login_and_metadata(app, stub):
+    run_session(app)
+    requests = dict(stub.requests)
+    run = run_session(app)
+    assert run.exceptions == []
+    assert run.runs == 1
+    assert dict(stub.requests) == requests